@@ -0,0 +1,17 @@
+"""
+URL configuration used when the project is served over ASGI.
+
+Identical to ``urls`` except that /graphql/ is handled by the async view.
+"""
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from .schema import schema
+from .urls import urlpatterns as wsgi_urlpatterns
+from .views import AsyncGraphQLView
+
+urlpatterns = [
+    pattern for pattern in wsgi_urlpatterns
+    if str(pattern.pattern) != 'graphql/'
+] + [
+    path('graphql/', csrf_exempt(AsyncGraphQLView.as_view(schema=schema, graphiql=True))),
+]
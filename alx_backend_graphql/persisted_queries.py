@@ -0,0 +1,85 @@
+"""
+Parsed-document cache and automatic persisted query (APQ) stores for the
+GraphQL endpoint.
+
+Documents are keyed by the sha256 of the query text, the same key clients
+send in ``extensions.persistedQuery.sha256Hash``.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe least-recently-used mapping with a fixed capacity."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalMemoryStore:
+    """Persisted query texts kept in the current process."""
+
+    def __init__(self, maxsize=None):
+        if maxsize is None:
+            maxsize = settings.GRAPHQL_PERSISTED_QUERY_MAX_ENTRIES
+        self._cache = LRUCache(maxsize)
+
+    def get(self, sha256_hash):
+        return self._cache.get(sha256_hash)
+
+    def set(self, sha256_hash, query):
+        self._cache.set(sha256_hash, query)
+
+
+class DjangoCacheStore:
+    """Persisted query texts shared between processes via a Django cache."""
+
+    key_prefix = 'graphql:apq:'
+
+    def __init__(self, alias='default', timeout=None):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, sha256_hash):
+        return self.cache.get(self.key_prefix + sha256_hash)
+
+    def set(self, sha256_hash, query):
+        self.cache.set(self.key_prefix + sha256_hash, query, self.timeout)
+
+
+def get_persisted_query_store():
+    """Instantiate the store named by ``GRAPHQL_PERSISTED_QUERY_STORE``."""
+    return import_string(settings.GRAPHQL_PERSISTED_QUERY_STORE)()
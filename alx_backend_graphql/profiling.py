@@ -0,0 +1,251 @@
+"""
+Per-resolver timing and SQL instrumentation for the GraphQL endpoint.
+
+A ``Profile`` records, for one operation, the wall time of every resolver
+keyed by its path with list indices dropped (``allOrders.edges.node.customer``)
+and every SQL statement run while that resolver was on the stack, through a
+``connection.execute_wrapper``. Statements whose SQL text repeats within a
+request are reported as duplicates; a path repeating the same statement
+``GRAPHQL_PROFILE_N_PLUS_ONE_THRESHOLD`` times is flagged as an N+1.
+
+Requests sending the ``GRAPHQL_PROFILE_HEADER`` get the breakdown in
+``extensions.profile`` (staff users, or anyone with ``DEBUG``). With
+``GRAPHQL_METRICS_ENABLED`` every operation is also exported as Prometheus
+histograms (requires ``prometheus_client``), labelled by operation name
+and by schema coordinate (``OrderType.customer``) to bound cardinality.
+Operation names come from clients, so only those in
+``GRAPHQL_METRICS_OPERATIONS`` are used as labels; the rest share "other".
+"""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+UNATTRIBUTED = '(operation)'
+
+
+def path_key(path):
+    """``allOrders.edges.node.customer`` for a resolver ``info.path``."""
+    return '.'.join(str(key) for key in path.as_list() if not isinstance(key, int))
+
+
+class ResolverStats:
+    __slots__ = ('field', 'calls', 'duration', 'queries', 'sql_duration')
+
+    def __init__(self, field):
+        self.field = field
+        self.calls = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_duration = 0.0
+
+
+class Profile:
+    """Timings and SQL statements of one GraphQL operation."""
+
+    def __init__(self, operation_name=None):
+        self.operation_name = operation_name
+        self.started = time.perf_counter()
+        self.duration = None
+        self.resolvers = {}
+        self.stack = []
+        self.queries = 0
+        self.sql_duration = 0.0
+        # sql -> path -> [count, set of params]
+        self.statements = defaultdict(lambda: defaultdict(lambda: [0, set()]))
+
+    def resolver(self, path, field):
+        stats = self.resolvers.get(path)
+        if stats is None:
+            stats = self.resolvers[path] = ResolverStats(field)
+        return stats
+
+    @contextmanager
+    def capture(self):
+        """Record SQL on every configured database while the block runs."""
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self.execute))
+            try:
+                yield self
+            finally:
+                self.duration = time.perf_counter() - self.started
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.sql_duration += elapsed
+            path = self.stack[-1].field_path if self.stack else UNATTRIBUTED
+            if self.stack:
+                stats = self.stack[-1].stats
+                stats.queries += 1
+                stats.sql_duration += elapsed
+            statement = self.statements[sql][path]
+            statement[0] += 1
+            try:
+                statement[1].add(repr(params))
+            except TypeError:
+                pass
+
+    def duplicates(self):
+        """Statements run more than once, most repeated first."""
+        threshold = settings.GRAPHQL_PROFILE_N_PLUS_ONE_THRESHOLD
+        report = []
+        for sql, paths in self.statements.items():
+            count = sum(statement[0] for statement in paths.values())
+            if count < 2:
+                continue
+            report.append({
+                'sql': sql,
+                'count': count,
+                'distinctParams': len(set().union(
+                    *(statement[1] for statement in paths.values()))),
+                'paths': sorted(paths),
+                'nPlusOne': sorted(
+                    path for path, statement in paths.items()
+                    if path != UNATTRIBUTED and statement[0] >= threshold),
+            })
+        report.sort(key=lambda item: -item['count'])
+        return report
+
+    def as_extension(self):
+        return {
+            'operation': self.operation_name,
+            'duration': round(self.duration * 1000, 3),
+            'sqlQueries': self.queries,
+            'sqlDuration': round(self.sql_duration * 1000, 3),
+            'resolvers': [
+                {
+                    'path': path,
+                    'field': stats.field,
+                    'calls': stats.calls,
+                    'duration': round(stats.duration * 1000, 3),
+                    'sqlQueries': stats.queries,
+                    'sqlDuration': round(stats.sql_duration * 1000, 3),
+                }
+                for path, stats in sorted(
+                    self.resolvers.items(), key=lambda item: -item[1].duration)
+            ],
+            'duplicateQueries': self.duplicates(),
+        }
+
+
+class _Frame:
+    __slots__ = ('field_path', 'stats')
+
+    def __init__(self, field_path, stats):
+        self.field_path = field_path
+        self.stats = stats
+
+
+class ProfilingMiddleware:
+    """Graphene middleware timing each resolver into a ``Profile``."""
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def resolve(self, next, root, info, **args):
+        path = path_key(info.path)
+        stats = self.profile.resolver(
+            path, f'{info.parent_type.name}.{info.field_name}')
+        self.profile.stack.append(_Frame(path, stats))
+        start = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            stats.duration += time.perf_counter() - start
+            stats.calls += 1
+            self.profile.stack.pop()
+
+
+def profile_requested(request):
+    header = settings.GRAPHQL_PROFILE_HEADER
+    if not header or not request.headers.get(header):
+        return False
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Prometheus collectors, registered once per process."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is not None:
+            return _metrics
+        try:
+            from prometheus_client import Counter, Histogram
+        except ImportError:
+            raise ImproperlyConfigured(
+                "GRAPHQL_METRICS_ENABLED requires prometheus_client "
+                "(pip install prometheus_client)")
+
+        _metrics = {
+            'operation_duration': Histogram(
+                'graphql_operation_duration_seconds',
+                'Wall time of GraphQL operations.', ['operation']),
+            'operation_queries': Histogram(
+                'graphql_operation_sql_queries',
+                'SQL statements run per GraphQL operation.', ['operation'],
+                buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)),
+            'operation_sql_duration': Histogram(
+                'graphql_operation_sql_duration_seconds',
+                'Time spent in SQL per GraphQL operation.', ['operation']),
+            'resolver_duration': Histogram(
+                'graphql_resolver_duration_seconds',
+                'Wall time per resolved field and operation, summed over its calls.',
+                ['field']),
+            'resolver_queries': Counter(
+                'graphql_resolver_sql_queries',
+                'SQL statements run by a resolved field.', ['field']),
+            'n_plus_one': Counter(
+                'graphql_n_plus_one',
+                'Operations in which a field repeated one SQL statement at '
+                'least GRAPHQL_PROFILE_N_PLUS_ONE_THRESHOLD times.', ['field']),
+        }
+    return _metrics
+
+
+def metrics_operation(operation_name):
+    """The ``operation`` label of ``operation_name``."""
+    if not operation_name:
+        return 'anonymous'
+    if operation_name in settings.GRAPHQL_METRICS_OPERATIONS:
+        return operation_name
+    return 'other'
+
+
+def record_metrics(profile):
+    metrics = get_metrics()
+    operation = metrics_operation(profile.operation_name)
+    metrics['operation_duration'].labels(operation).observe(profile.duration)
+    metrics['operation_queries'].labels(operation).observe(profile.queries)
+    metrics['operation_sql_duration'].labels(operation).observe(profile.sql_duration)
+
+    by_field = defaultdict(lambda: [0.0, 0])
+    for stats in profile.resolvers.values():
+        by_field[stats.field][0] += stats.duration
+        by_field[stats.field][1] += stats.queries
+    for field, (duration, queries) in by_field.items():
+        metrics['resolver_duration'].labels(field).observe(duration)
+        if queries:
+            metrics['resolver_queries'].labels(field).inc(queries)
+
+    flagged = {path for duplicate in profile.duplicates()
+               for path in duplicate['nPlusOne']}
+    for field in {profile.resolvers[path].field for path in flagged}:
+        metrics['n_plus_one'].labels(field).inc()
@@ -0,0 +1,257 @@
+"""
+Static cost and depth analysis of GraphQL operations.
+
+Every composite field costs 1 (a row or a related object to load) and
+scalars are free, unless ``GRAPHQL_FIELD_COSTS`` weighs them otherwise.
+A connection multiplies the cost of its ``edges`` by the page size it can
+return: ``first``/``last`` capped at ``RELAY_CONNECTION_MAX_LIMIT``, or the
+limit itself when neither is given. Other lists of objects multiply by
+their ``first`` argument or ``GRAPHQL_DEFAULT_LIST_SIZE``.
+
+The estimate is an upper bound: fragments on abstract types and
+``@skip``/``@include`` branches are all counted. Introspection fields are
+free and do not count towards the depth.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from graphene.relay import Connection
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    Undefined,
+    get_named_type,
+    is_composite_type,
+    is_list_type,
+    is_non_null_type,
+    value_from_ast,
+)
+from graphql.validation import ValidationRule
+
+COST_BUDGET_PREFIX = 'graphql:cost:'
+
+# Connection plumbing carries no rows of its own
+FREE_CONNECTION_FIELDS = ('edges', 'pageInfo')
+
+
+class QueryCostError(Exception):
+    def __init__(self, message, code, cost, retry_after=None):
+        super().__init__(message)
+        self.code = code
+        self.cost = cost
+        self.retry_after = retry_after
+
+
+def _is_subclass(graphql_type, base):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, base)
+
+
+def _unwrap_list(graphql_type):
+    """Return whether ``graphql_type`` is a list, ignoring non-null wrappers."""
+    if is_non_null_type(graphql_type):
+        graphql_type = graphql_type.of_type
+    return is_list_type(graphql_type)
+
+
+def field_weight(parent_type, field_name, field_type):
+    weights = settings.GRAPHQL_FIELD_COSTS
+    key = f'{parent_type.name}.{field_name}'
+    if key in weights:
+        return weights[key]
+    if field_name in weights:
+        return weights[field_name]
+    if field_name in FREE_CONNECTION_FIELDS and _is_subclass(parent_type, Connection):
+        return 0
+    return 1 if is_composite_type(get_named_type(field_type)) else 0
+
+
+class CostAnalysis:
+    """Walk one operation, resolving size arguments from ``variables``."""
+
+    def __init__(self, schema, fragments, variables=None):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+        self.max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+    def argument(self, field_def, node, name):
+        for argument in node.arguments or ():
+            if argument.name.value == name:
+                value = value_from_ast(
+                    argument.value, field_def.args[name].type, self.variables)
+                return None if value is Undefined else value
+        return None
+
+    def page_size(self, field_def, node):
+        sizes = [size for size in (self.argument(field_def, node, 'first'),
+                                   self.argument(field_def, node, 'last'))
+                 if size is not None]
+        size = min(sizes) if sizes else self.max_limit
+        return max(0, min(size, self.max_limit)) if self.max_limit else size
+
+    def multiplier(self, parent_type, field_def, node, page_size):
+        """How many times the field's selection is resolved per parent."""
+        if _is_subclass(parent_type, Connection):
+            # Only the edges repeat per row; totalCount and pageInfo do not
+            return page_size if node.name.value == 'edges' else 1
+        if not _unwrap_list(field_def.type) or \
+                not is_composite_type(get_named_type(field_def.type)):
+            return 1
+        if 'first' in field_def.args:
+            first = self.argument(field_def, node, 'first')
+            if first is not None:
+                return max(0, first)
+        return settings.GRAPHQL_DEFAULT_LIST_SIZE
+
+    def selection_cost(self, parent_type, selection_set, visited=frozenset(),
+                       page_size=None):
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                cost += self.field_cost(parent_type, selection, visited, page_size)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(
+                        selection.type_condition.name.value)
+                cost += self.selection_cost(
+                    fragment_type, selection.selection_set, visited, page_size)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visited:
+                    continue
+                cost += self.selection_cost(
+                    self.schema.get_type(fragment.type_condition.name.value),
+                    fragment.selection_set, visited | {name}, page_size)
+        return cost
+
+    def field_cost(self, parent_type, node, visited, page_size=None):
+        name = node.name.value
+        if name.startswith('__'):
+            return 0
+        field_def = getattr(parent_type, 'fields', {}).get(name)
+        if field_def is None:
+            return 0
+        cost = field_weight(parent_type, name, field_def.type)
+        if node.selection_set is not None:
+            field_type = get_named_type(field_def.type)
+            child_page_size = None
+            if _is_subclass(field_type, Connection):
+                child_page_size = self.page_size(field_def, node)
+            cost += self.multiplier(parent_type, field_def, node, page_size) * \
+                self.selection_cost(field_type, node.selection_set, visited,
+                                    child_page_size)
+        return cost
+
+    def operation_cost(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        return self.selection_cost(root_type, operation.selection_set)
+
+
+def query_cost(schema, document, operation, variables=None):
+    """Estimated cost of running ``operation`` from ``document``."""
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if not isinstance(definition, OperationDefinitionNode)
+    }
+    return CostAnalysis(schema, fragments, variables).operation_cost(operation)
+
+
+def selection_depth(selection_set, fragments, visited=frozenset()):
+    depth = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            if selection.name.value.startswith('__'):
+                continue
+            child_depth = 0
+            if selection.selection_set is not None:
+                child_depth = selection_depth(selection.selection_set, fragments, visited)
+            depth = max(depth, child_depth + 1)
+        elif isinstance(selection, InlineFragmentNode):
+            depth = max(depth, selection_depth(selection.selection_set, fragments, visited))
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            fragment = fragments.get(name)
+            if fragment is not None and name not in visited:
+                depth = max(depth, selection_depth(
+                    fragment.selection_set, fragments, visited | {name}))
+    return depth
+
+
+class QueryDepthRule(ValidationRule):
+    """Reject operations nested deeper than ``GRAPHQL_MAX_QUERY_DEPTH``."""
+
+    def enter_operation_definition(self, node, *args):
+        max_depth = settings.GRAPHQL_MAX_QUERY_DEPTH
+        if not max_depth:
+            return
+        fragments = {
+            definition.name.value: definition
+            for definition in self.context.document.definitions
+            if not isinstance(definition, OperationDefinitionNode)
+        }
+        depth = selection_depth(node.selection_set, fragments)
+        if depth > max_depth:
+            name = f"'{node.name.value}'" if node.name else 'Operation'
+            self.report_error(GraphQLError(
+                f"{name} has depth {depth}, which exceeds the maximum of {max_depth}.",
+                node,
+                extensions={'code': 'QUERY_TOO_DEEP', 'depth': depth,
+                            'maxDepth': max_depth},
+            ))
+
+
+def charge_cost(client_key, cost):
+    """
+    Add ``cost`` to the client's budget for the current window and raise
+    ``QueryCostError`` once ``GRAPHQL_QUERY_COST_BUDGET`` is exhausted.
+    """
+    budget = settings.GRAPHQL_QUERY_COST_BUDGET
+    if not budget:
+        return None
+    window = settings.GRAPHQL_QUERY_COST_BUDGET_WINDOW
+    now = time.time()
+    window_start = int(now // window) * window
+    key = f'{COST_BUDGET_PREFIX}{client_key}:{window_start}'
+    cache = caches[settings.GRAPHQL_QUERY_COST_BUDGET_CACHE_ALIAS]
+    cache.add(key, 0, window)
+    try:
+        spent = cache.incr(key, cost)
+    except ValueError:
+        # Expired between add and incr; start the window over
+        cache.set(key, cost, window)
+        spent = cost
+    if spent > budget:
+        raise QueryCostError(
+            f"Query cost budget of {budget} per {window}s exhausted.",
+            'QUERY_COST_BUDGET_EXCEEDED', cost,
+            retry_after=max(1, int(window_start + window - now)))
+    return budget - spent
+
+
+def check_cost(schema, document, operation, variables, client_key):
+    """
+    Return the cost report for ``operation``, raising ``QueryCostError``
+    when it exceeds ``GRAPHQL_MAX_QUERY_COST`` or the client's budget.
+    """
+    cost = query_cost(schema, document, operation, variables)
+    max_cost = settings.GRAPHQL_MAX_QUERY_COST
+    if max_cost and cost > max_cost:
+        raise QueryCostError(
+            f"Query cost {cost} exceeds the maximum of {max_cost}. "
+            f"Ask for fewer rows with first/last or select fewer nested connections.",
+            'QUERY_TOO_COSTLY', cost)
+    report = {'requested': cost, 'maximum': max_cost}
+    remaining = charge_cost(client_key, cost)
+    if remaining is not None:
+        report['budgetRemaining'] = remaining
+    return report
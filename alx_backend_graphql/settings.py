@@ -128,6 +128,116 @@ GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql.schema.schema',
 }
 
+# Parsed and validated GraphQL documents kept per process
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+
+# Automatic persisted queries: LocalMemoryStore keeps query texts per
+# process, DjangoCacheStore shares them through the default Django cache
+GRAPHQL_PERSISTED_QUERY_STORE = 'alx_backend_graphql.persisted_queries.LocalMemoryStore'
+GRAPHQL_PERSISTED_QUERY_MAX_ENTRIES = 1000
+
+# Threads the ASGI endpoint runs the (synchronous) GraphQL view on; this
+# bounds how many operations one ASGI process executes at once
+GRAPHQL_ASYNC_THREADS = 32
+
+# Opt-in cache for query results, invalidated per model on writes. Point
+# the 'graphql' cache at a shared backend (e.g. Redis) when running more
+# than one process so invalidations reach every worker.
+GRAPHQL_RESPONSE_CACHE_ENABLED = False
+GRAPHQL_RESPONSE_CACHE_ALIAS = 'graphql'
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = 300
+
+# Query cost analysis (see alx_backend_graphql/query_cost.py). Operations
+# nested deeper than GRAPHQL_MAX_QUERY_DEPTH or estimated above
+# GRAPHQL_MAX_QUERY_COST are rejected before execution; 0 disables either.
+# GRAPHQL_FIELD_COSTS overrides the weight of 'Type.field' or any 'field'.
+GRAPHQL_MAX_QUERY_DEPTH = 12
+GRAPHQL_MAX_QUERY_COST = 25000
+GRAPHQL_DEFAULT_LIST_SIZE = 100
+GRAPHQL_FIELD_COSTS = {
+    'totalCount': 10,
+    'OrderType.totalAmount': 1,
+    'Query.crmStats': 10,
+    'CRMStatsType.groups': 10,
+    'Query.salesRollup': 10,
+    'Query.customerMetrics': 10,
+    'Query.productAffinity': 10,
+}
+
+# Optional cost budget per client (user, or IP when anonymous) and window
+# in seconds, shared through the given cache; None disables throttling.
+GRAPHQL_QUERY_COST_BUDGET = None
+GRAPHQL_QUERY_COST_BUDGET_WINDOW = 60
+GRAPHQL_QUERY_COST_BUDGET_CACHE_ALIAS = 'default'
+
+# Resolver profiling: requests sending this header get per-resolver timings,
+# SQL counts and repeated statements in extensions.profile (staff users, or
+# anyone with DEBUG). A resolver repeating one statement this many times is
+# flagged as an N+1. GRAPHQL_METRICS_ENABLED profiles every operation and
+# serves Prometheus metrics at /metrics (requires prometheus_client).
+# Operations are labelled by name only when listed in
+# GRAPHQL_METRICS_OPERATIONS, and as "other" otherwise, so clients cannot
+# create unbounded label values.
+GRAPHQL_PROFILE_HEADER = 'X-GraphQL-Profile'
+GRAPHQL_PROFILE_N_PLUS_ONE_THRESHOLD = 5
+GRAPHQL_METRICS_ENABLED = False
+GRAPHQL_METRICS_OPERATIONS = {
+    'AllOrders',
+    'BulkCreateCustomers',
+    'CreateOrder',
+    'RecentOrders',
+    'UpdateLowStockProducts',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'graphql': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'graphql-responses',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Rows per INSERT for bulk mutations
+CRM_BULK_CREATE_BATCH_SIZE = 1000
+
+# Rows fetched and written per chunk by exports
+CRM_EXPORT_CHUNK_SIZE = 2000
+
+# Orders placed within this many days of signup count as 'new' customer sales
+CRM_NEW_CUSTOMER_DAYS = 30
+
+# crm.analytics: rows read per chunk, seconds results are cached for (and
+# may lag writes by), cache alias, and years of lifetime value projected
+CRM_ANALYTICS_CHUNK_SIZE = 50000
+CRM_ANALYTICS_CACHE_TIMEOUT = 600
+CRM_ANALYTICS_CACHE_ALIAS = 'default'
+CRM_ANALYTICS_CLV_YEARS = 3
+
+# Dotted path to a crm.search backend; None picks one for the database vendor
+CRM_SEARCH_BACKEND = None
+
+# Order reminders: sender class, 'threads' or 'celery' delivery, reminders
+# per batch, orders per GraphQL page (at most the relay limit of 100),
+# delivery threads and messages per second per process (0 = unlimited)
+CRM_REMINDER_SENDER = 'crm.reminders.FileSender'
+CRM_REMINDER_DISPATCH = 'threads'
+CRM_REMINDER_BATCH_SIZE = 100
+CRM_REMINDER_PAGE_SIZE = 100
+CRM_REMINDER_THREADS = 8
+CRM_REMINDER_RATE = 50
+
+# GraphQL client used by Celery tasks, cron jobs and scripts: 'local'
+# executes against the schema in-process, 'http' posts to CRM_GRAPHQL_URL.
+CRM_GRAPHQL_TRANSPORT = 'local'
+CRM_GRAPHQL_URL = 'http://localhost:8000/graphql'
+CRM_GRAPHQL_TIMEOUT = 30
+CRM_GRAPHQL_RETRIES = 3
+
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
     ('0 */12 * * *', 'crm.cron.update_low_stock'),
@@ -148,4 +258,12 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'recalculate-order-totals': {
+        'task': 'crm.tasks.recalculate_order_totals',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'refresh-daily-sales-rollup': {
+        'task': 'crm.tasks.refresh_daily_sales_rollup',
+        'schedule': crontab(hour=3, minute=30),
+    },
 }
@@ -17,10 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+from crm import views as crm_views
 from .schema import schema
+from .views import CachedGraphQLView, metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(schema=schema, graphiql=True))),
+    path('graphql/', csrf_exempt(CachedGraphQLView.as_view(schema=schema, graphiql=True))),
+    path('metrics', metrics, name='graphql-metrics'),
+    path('export/<str:name>.<str:format>', crm_views.export, name='crm-export'),
 ]
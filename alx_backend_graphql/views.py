@@ -0,0 +1,381 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    print_ast,
+    validate_schema,
+)
+from graphql.error import GraphQLError
+from graphql.validation import specified_rules, validate
+
+from crm import cache as response_cache
+from . import profiling
+from .persisted_queries import LRUCache, get_persisted_query_store, query_hash
+from .query_cost import QueryCostError, QueryDepthRule, check_cost
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQL view that parses and validates each distinct document once.
+
+    Validated documents are kept in a process-wide LRU keyed by the sha256
+    of the query text. Clients may also send only that hash in
+    ``extensions.persistedQuery`` (Apollo automatic persisted queries); the
+    text is then looked up in the configured persisted query store.
+
+    With ``GRAPHQL_RESPONSE_CACHE_ENABLED`` set, results of query operations
+    are cached per normalized document, variables and user, and dropped
+    whenever a model the query reads is written.
+
+    Operations nested deeper than ``GRAPHQL_MAX_QUERY_DEPTH`` fail
+    validation, and each operation's estimated cost is checked against
+    ``GRAPHQL_MAX_QUERY_COST`` (and the client's budget) before it runs
+    and reported in ``extensions.cost``.
+
+    Resolver timings and SQL are profiled (see ``profiling``) for requests
+    sending ``GRAPHQL_PROFILE_HEADER`` and, when ``GRAPHQL_METRICS_ENABLED``
+    is set, for every request.
+    """
+
+    validation_rules = (*specified_rules, QueryDepthRule)
+    document_cache = LRUCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+    response_cache_info = LRUCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+    persisted_query_store = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.persisted_query_store is None:
+            CachedGraphQLView.persisted_query_store = get_persisted_query_store()
+        if settings.GRAPHQL_METRICS_ENABLED:
+            profiling.get_metrics()
+
+    @staticmethod
+    def get_persisted_query_hash(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest(
+                    "Extensions are invalid JSON."))
+        persisted_query = (extensions or {}).get('persistedQuery') or {}
+        return persisted_query.get('sha256Hash')
+
+    def resolve_persisted_query(self, query, sha256_hash):
+        """Return the query text for a request and its document cache key."""
+        if sha256_hash is None:
+            return query, query and query_hash(query)
+        if not query:
+            query = self.persisted_query_store.get(sha256_hash)
+            if query is None:
+                raise PersistedQueryError(
+                    'PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+            return query, sha256_hash
+        if query_hash(query) != sha256_hash:
+            raise PersistedQueryError(
+                'provided sha does not match query', 'INVALID_SHA256_HASH')
+        return query, sha256_hash
+
+    def get_document(self, schema, query, key):
+        """Parse and validate ``query``, reusing the cached document."""
+        key = (id(schema), key)
+        document = self.document_cache.get(key)
+        if document is not None:
+            return document, []
+
+        document = parse(query)
+        validation_errors = validate(
+            schema,
+            document,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if not validation_errors:
+            self.document_cache.set(key, document)
+        return document, validation_errors
+
+    def get_response_cache_key(self, request, schema, document, key,
+                               variables, operation_name):
+        key = (id(schema), key)
+        info = self.response_cache_info.get(key)
+        if info is None:
+            info = (
+                query_hash(print_ast(document)),
+                response_cache.document_models(schema, document),
+            )
+            self.response_cache_info.set(key, info)
+        document_hash, models = info
+
+        user = getattr(request, 'user', None)
+        user_key = user.pk if user is not None and user.is_authenticated else None
+        return response_cache.response_key(
+            document_hash, variables, operation_name, user_key, models)
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        sha256_hash = self.get_persisted_query_hash(request, data)
+        register = sha256_hash is not None and bool(query)
+        try:
+            query, key = self.resolve_persisted_query(query, sha256_hash)
+        except PersistedQueryError as e:
+            return ExecutionResult(
+                data=None,
+                errors=[GraphQLError(str(e), extensions={'code': e.code})])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            document, validation_errors = self.get_document(schema, query, key)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+        profile = getattr(request, 'graphql_profile', None)
+        if profile is not None and operation_ast is not None and operation_ast.name:
+            profile.operation_name = operation_ast.name.value
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        if register:
+            self.persisted_query_store.set(key, query)
+
+        cost = None
+        if operation_ast is not None:
+            try:
+                cost = check_cost(schema, document, operation_ast, variables,
+                                  self.get_client_key(request))
+            except QueryCostError as e:
+                extensions = {'code': e.code, 'cost': e.cost}
+                if e.retry_after is not None:
+                    extensions['retryAfter'] = e.retry_after
+                return ExecutionResult(
+                    data=None, errors=[GraphQLError(str(e), extensions=extensions)])
+
+        result = self.execute_operation(
+            request, schema, document, key, operation_ast, variables, operation_name)
+        if cost is not None:
+            result.extensions = {**(result.extensions or {}), 'cost': cost}
+        return result
+
+    @staticmethod
+    def get_client_key(request):
+        """Identify the client a query cost budget is charged to."""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        return f"ip:{request.META.get('REMOTE_ADDR')}"
+
+    def execute_operation(self, request, schema, document, key, operation_ast,
+                          variables, operation_name):
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options[
+                    "execution_context_class"
+                ] = self.execution_context_class
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            if (
+                settings.GRAPHQL_RESPONSE_CACHE_ENABLED
+                and operation_ast is not None
+                and operation_ast.operation == OperationType.QUERY
+            ):
+                cache_key = self.get_response_cache_key(
+                    request, schema, document, key, variables, operation_name)
+                data = response_cache.get_response(cache_key)
+                if data is not None:
+                    return ExecutionResult(data=data)
+                result = execute(schema, document, **execute_options)
+                if not result.errors:
+                    response_cache.set_response(cache_key, result.data)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        profile = getattr(request, 'graphql_profile', None)
+        if profile is not None:
+            middleware = [*(middleware or ()), profiling.ProfilingMiddleware(profile)]
+        return middleware
+
+    def get_response(self, request, data, show_graphiql=False):
+        """
+        ``GraphQLView.get_response``, plus the result's ``extensions`` and
+        the resolver profile when one was requested.
+        """
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        show_profile = profiling.profile_requested(request)
+        profile = None
+        if show_profile or settings.GRAPHQL_METRICS_ENABLED:
+            profile = request.graphql_profile = profiling.Profile(operation_name)
+            with profile.capture():
+                execution_result = self.execute_graphql_request(
+                    request, data, query, variables, operation_name, show_graphiql
+                )
+            if settings.GRAPHQL_METRICS_ENABLED:
+                profiling.record_metrics(profile)
+            if show_profile and execution_result:
+                execution_result.extensions = {
+                    **(execution_result.extensions or {}),
+                    'profile': profile.as_extension(),
+                }
+        else:
+            execution_result = self.execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+
+def metrics(request):
+    """Prometheus exposition of the GraphQL metrics of this process."""
+    if not settings.GRAPHQL_METRICS_ENABLED:
+        raise Http404
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        # Aggregate the samples every worker process wrote to the directory
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+class AsyncGraphQLView(CachedGraphQLView):
+    """
+    Entry point for the GraphQL endpoint under ASGI.
+
+    This is a thread-offload wrapper, not async execution: the resolvers
+    and relay connections are synchronous and use the sync ORM, so the
+    whole sync view runs on a pool of ``GRAPHQL_ASYNC_THREADS`` threads
+    while the event loop only accepts requests and writes responses. It
+    serves as many operations at once as a sync server with that many
+    threads; it lets the endpoint run under an ASGI server without
+    blocking the loop, but does not raise throughput by itself.
+    """
+
+    view_is_async = True
+    executor = ThreadPoolExecutor(
+        max_workers=settings.GRAPHQL_ASYNC_THREADS,
+        thread_name_prefix='graphql',
+    )
+
+    async def dispatch(self, request, *args, **kwargs):
+        return await sync_to_async(
+            self.dispatch_in_thread,
+            thread_sensitive=False,
+            executor=self.executor,
+        )(request, *args, **kwargs)
+
+    def dispatch_in_thread(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Pool threads outlive the request; release their connections
+            # the way request_finished does for WSGI workers.
+            close_old_connections()
@@ -0,0 +1,202 @@
+"""
+Compare concurrent throughput of the sync (WSGI) and async (ASGI) GraphQL
+endpoints in-process.
+
+The WSGI application is driven by a fixed pool of worker threads, as a sync
+server would run it; the ASGI application is driven by a single event loop
+with many requests in flight. ``--latency-ms`` adds a sleep to every SQL
+statement to model a database reached over the network.
+
+The ASGI view runs operations on ``GRAPHQL_ASYNC_THREADS`` threads, so its
+parallelism is the smaller of that and ``--concurrency``. ``--wsgi-workers``
+and ``--concurrency`` default to the same thread count, so the two paths
+are compared at equal parallelism; the effective parallelism of each is
+reported next to its results.
+
+Usage:
+    python -m benchmarks.concurrency --requests 400 --latency-ms 50
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+
+from alx_backend_graphql.asgi import application as asgi_application  # noqa: E402
+from alx_backend_graphql.wsgi import application as wsgi_application  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+
+DEFAULT_QUERY = """
+{
+    allOrders(first: 20) {
+        edges {
+            node {
+                id
+                totalAmount
+                customer { email }
+                products { edges { node { name price } } }
+            }
+        }
+    }
+}
+"""
+
+
+def add_latency(seconds):
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def on_connection(sender, connection, **kwargs):
+        # Fires on every reconnect of the same per-thread wrapper
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(on_connection, weak=False)
+
+
+def summarize(name, latencies, elapsed, statuses):
+    latencies = sorted(latencies)
+    if len(latencies) >= 2:
+        # Inclusive: percentiles stay within the observed latencies
+        quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    else:
+        # quantiles() needs two samples; one is every percentile
+        quantiles = latencies * 99 or [0.0] * 99
+    return {
+        'path': name,
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status != 200),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(quantiles[49] * 1000, 2),
+            'p95': round(quantiles[94] * 1000, 2),
+            'p99': round(quantiles[98] * 1000, 2),
+            'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+def run_wsgi(body, requests, workers):
+    def one_request(_):
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/graphql/',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+        }
+        statuses = []
+        start = time.perf_counter()
+        chunks = wsgi_application(
+            environ, lambda status, headers: statuses.append(status))
+        b''.join(chunks)
+        return time.perf_counter() - start, int(statuses[0].split()[0])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - start
+    return summarize('wsgi', [r[0] for r in results], elapsed,
+                     [r[1] for r in results])
+
+
+async def run_asgi(body, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'POST',
+            'scheme': 'http',
+            'path': '/graphql/',
+            'query_string': b'',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'content-type', b'application/json'),
+            ],
+            'server': ('localhost', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        finished = asyncio.Event()
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                finished.set()
+
+        async with semaphore:
+            start = time.perf_counter()
+            await asgi_application(scope, receive, send)
+            return time.perf_counter() - start, status[0]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return summarize('asgi', [r[0] for r in results], elapsed,
+                     [r[1] for r in results])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=settings.GRAPHQL_ASYNC_THREADS,
+                        help='requests in flight on the ASGI event loop '
+                             '(default: GRAPHQL_ASYNC_THREADS)')
+    parser.add_argument('--wsgi-workers', type=int, default=settings.GRAPHQL_ASYNC_THREADS,
+                        help='sync workers serving the WSGI application '
+                             '(default: GRAPHQL_ASYNC_THREADS)')
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help='simulated network latency per SQL statement')
+    parser.add_argument('--query', default=DEFAULT_QUERY)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    settings.ALLOWED_HOSTS = ['*']
+    if args.latency_ms:
+        add_latency(args.latency_ms / 1000)
+    body = json.dumps({'query': args.query}).encode('utf-8')
+
+    report = {
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('query', 'output')},
+        'results': [
+            dict(run_wsgi(body, args.requests, args.wsgi_workers),
+                 parallelism=args.wsgi_workers),
+            dict(asyncio.run(run_asgi(body, args.requests, args.concurrency)),
+                 parallelism=min(args.concurrency, settings.GRAPHQL_ASYNC_THREADS)),
+        ],
+    }
+    report['config']['async_threads'] = settings.GRAPHQL_ASYNC_THREADS
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Generate a reproducible synthetic CRM dataset for the benchmarks.
+
+Customers sign up uniformly over ``--days`` days and place orders after
+signing up. Both customers and products are picked with Zipf-like
+popularity, so a few customers order often and a few products appear in
+most orders. Each order has 1 to ``--max-lines`` products, each extra line
+half as likely as the one before (about two per order), and a quarter of
+lines are for 2 to 5 units. Rows are written with
+``bulk_create`` in batches, so memory stays flat from 1k to 10M orders.
+Order totals are computed as the rows are generated, and the daily sales
+rollup is rebuilt at the end.
+
+The same ``--seed`` and sizes always give the same data. Use ``--reset``
+to empty the CRM tables first. Run it only against a benchmark database.
+
+Usage:
+    python -m benchmarks.datagen --orders 100000 --seed 42 --reset
+    python -m benchmarks.datagen --orders 10000000 --customers 1000000 \\
+        --products 50000 --batch-size 20000 --reset
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from crm.cache import invalidate_models  # noqa: E402
+from crm.cleanup import raw_cascade_delete  # noqa: E402
+from crm.models import Customer, DailySalesRollup, Order, OrderItem, Product  # noqa: E402
+from crm.tasks import refresh_daily_sales_rollup  # noqa: E402
+
+PRODUCT_NOUNS = ('Laptop', 'Mouse', 'Keyboard', 'Monitor', 'Headset', 'Webcam',
+                 'Dock', 'Cable', 'Charger', 'Speaker', 'Tablet', 'Stand')
+PRODUCT_ADJECTIVES = ('Basic', 'Pro', 'Ultra', 'Compact', 'Wireless', 'Studio',
+                      'Travel', 'Gaming', 'Office', 'Mini')
+
+
+@contextmanager
+def explicit_dates(model, *names):
+    """Let ``bulk_create`` keep the given ``auto_now_add`` values."""
+    fields = [model._meta.get_field(name) for name in names]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def zipf_picker(rng, items, exponent):
+    """Return a function picking from ``items`` with weight ``1 / rank ** exponent``."""
+    cum_weights = list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, len(items) + 1)))
+    total = cum_weights[-1]
+
+    def pick():
+        return items[bisect.bisect(cum_weights, rng.random() * total)]
+    return pick
+
+
+def line_count(rng, max_lines):
+    count = 1
+    while count < max_lines and rng.random() < 0.5:
+        count += 1
+    return count
+
+
+def item_quantity(rng):
+    return 1 if rng.random() < 0.75 else rng.randint(2, 5)
+
+
+def reset():
+    with transaction.atomic():
+        DailySalesRollup.objects.all()._raw_delete(DailySalesRollup.objects.db)
+        raw_cascade_delete(Customer.objects.all())
+        raw_cascade_delete(Product.objects.all())
+    invalidate_models(Customer, Order, Product, DailySalesRollup)
+
+
+def generate_products(rng, count, batch_size, now, days):
+    products = []
+    with explicit_dates(Product, 'created_at'):
+        for start in range(0, count, batch_size):
+            batch = [
+                Product(
+                    name=f'{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)} {i}',
+                    price=Decimal(rng.randint(199, 199999)) / 100,
+                    stock=rng.randint(0, 500),
+                    created_at=now - timedelta(days=days + 30),
+                )
+                for i in range(start, min(start + batch_size, count))
+            ]
+            products.extend(Product.objects.bulk_create(batch))
+    # Shuffle so popularity is unrelated to id order
+    rng.shuffle(products)
+    return [(product.pk, product.price) for product in products]
+
+
+def generate_customers(rng, count, batch_size, now, days, seed):
+    customers = []
+    with explicit_dates(Customer, 'created_at'):
+        for start in range(0, count, batch_size):
+            batch = [
+                Customer(
+                    name=f'Customer {i}',
+                    email=f'customer{i}.s{seed}@bench.example.com',
+                    phone=f'+1{rng.randint(2000000000, 9999999999)}' if rng.random() < 0.7 else None,
+                    created_at=now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                )
+                for i in range(start, min(start + batch_size, count))
+            ]
+            customers.extend(
+                (customer.pk, customer.created_at)
+                for customer in Customer.objects.bulk_create(batch))
+    rng.shuffle(customers)
+    return customers
+
+
+def generate_orders(rng, count, customers, products, max_lines, batch_size, now,
+                    log=print):
+    pick_customer = zipf_picker(rng, customers, 0.8)
+    pick_product = zipf_picker(rng, products, 1.1)
+    lines = 0
+    started = time.perf_counter()
+    with explicit_dates(Order, 'order_date', 'created_at'):
+        for start in range(0, count, batch_size):
+            orders, order_lines = [], []
+            for _ in range(min(batch_size, count - start)):
+                customer_id, signed_up = pick_customer()
+                chosen = {}
+                for _ in range(line_count(rng, max_lines)):
+                    product_id, price = pick_product()
+                    chosen[product_id] = (item_quantity(rng), price)
+                order_date = signed_up + (now - signed_up) * rng.random()
+                orders.append(Order(
+                    customer_id=customer_id,
+                    total_amount=sum(quantity * price for quantity, price in chosen.values()),
+                    order_date=order_date,
+                    created_at=order_date,
+                ))
+                order_lines.append(chosen)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(orders)
+                items = [
+                    OrderItem(order_id=order.pk, product_id=product_id,
+                              quantity=quantity, unit_price=price)
+                    for order, chosen in zip(orders, order_lines)
+                    for product_id, (quantity, price) in chosen.items()
+                ]
+                OrderItem.objects.bulk_create(items)
+            lines += len(items)
+            done = start + len(orders)
+            rate = done / (time.perf_counter() - started)
+            log(f"  {done}/{count} orders, {lines} lines ({rate:,.0f} orders/s)")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--customers', type=int,
+                        help='default: one per 5 orders')
+    parser.add_argument('--products', type=int,
+                        help='default: one per 200 orders, at least 50')
+    parser.add_argument('--max-lines', type=int, default=8,
+                        help='maximum products per order')
+    parser.add_argument('--days', type=int, default=365,
+                        help='history covered by signups and orders')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true',
+                        help='delete all customers, products and orders first')
+    args = parser.parse_args(argv)
+
+    customers = args.customers or max(1, args.orders // 5)
+    products = args.products or max(50, args.orders // 200)
+    rng = random.Random(args.seed)
+    # Anchor dates to the day so reruns with the same seed match
+    now = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if args.reset:
+        print('Deleting existing CRM data')
+        reset()
+    elif Customer.objects.filter(email__endswith=f'.s{args.seed}@bench.example.com').exists():
+        parser.error(f'seed {args.seed} was already generated; use --reset or another --seed')
+
+    started = time.perf_counter()
+    print(f'Generating {products} products')
+    product_rows = generate_products(rng, products, args.batch_size, now, args.days)
+    print(f'Generating {customers} customers')
+    customer_rows = generate_customers(
+        rng, customers, args.batch_size, now, args.days, args.seed)
+    print(f'Generating {args.orders} orders')
+    lines = generate_orders(rng, args.orders, customer_rows, product_rows,
+                            args.max_lines, args.batch_size, now)
+    print('Rebuilding the daily sales rollup')
+    refresh_daily_sales_rollup(full=True, days_per_batch=30)
+    invalidate_models(Customer, Order, Product, DailySalesRollup)
+
+    print(f'Done in {time.perf_counter() - started:.1f}s: {products} products, '
+          f'{customers} customers, {args.orders} orders, {lines} order lines')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Run the GraphQL benchmark scenarios and report per-scenario performance.
+
+Every scenario is sent through the full Django stack (middleware, the
+GraphQL view, the database) with the test client. ``--warmup`` requests
+are sent first and discarded. Then ``--iterations`` requests are timed,
+spread over ``--concurrency`` threads, to report throughput, latency
+percentiles and SQL statements per request. A final pass of
+``--memory-iterations`` requests runs under ``tracemalloc`` to report the
+peak Python memory allocated by one request.
+
+Mutations write to the database, so run the suite against a benchmark
+database filled with ``benchmarks.datagen``. Write a JSON report with
+``--output``, and compare it with an earlier run with ``--compare``.
+
+Usage:
+    python -m benchmarks.run --iterations 200 --output before.json
+    python -m benchmarks.run --scenario all_orders_nested --concurrency 8 \\
+        --compare before.json --output after.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from benchmarks.scenarios import SCENARIOS  # noqa: E402
+from crm.models import Customer, Order, OrderItem, Product  # noqa: E402
+
+# Metrics compared by --compare, and whether lower is better
+COMPARED = (
+    ('throughput_rps', False),
+    ('latency_ms.p50', True),
+    ('latency_ms.p95', True),
+    ('latency_ms.p99', True),
+    ('queries_per_request.mean', True),
+    ('peak_memory_kib', True),
+)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+_local = threading.local()
+
+
+def send(body):
+    """Post ``body`` to /graphql/ and return (seconds, queries, error)."""
+    client = getattr(_local, 'client', None)
+    if client is None:
+        client = _local.client = Client()
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        response = client.post('/graphql/', body, content_type='application/json')
+    elapsed = time.perf_counter() - start
+
+    error = None
+    if response.status_code != 200:
+        error = f'HTTP {response.status_code}'
+    payload = json.loads(response.content)
+    if payload.get('errors'):
+        error = payload['errors'][0].get('message')
+    return elapsed, counter.count, error
+
+
+def percentile(sorted_values, fraction):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    index = (len(sorted_values) - 1) * fraction
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (index - lower)
+
+
+def run_scenario(scenario, rng, iterations, warmup, concurrency, memory_iterations):
+    scenario.setup()
+    for _ in range(warmup):
+        send(scenario.body(rng))
+
+    # Build the bodies up front so threads share no random state
+    bodies = [scenario.body(rng) for _ in range(iterations)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, bodies))
+    elapsed = time.perf_counter() - start
+
+    peaks = []
+    for _ in range(memory_iterations):
+        body = scenario.body(rng)
+        tracemalloc.start()
+        try:
+            send(body)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    latencies = sorted(result[0] for result in results)
+    queries = [result[1] for result in results]
+    errors = [result[2] for result in results if result[2]]
+    return {
+        'scenario': scenario.name,
+        'description': scenario.description,
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(iterations / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 2),
+            'p50': round(percentile(latencies, 0.50) * 1000, 2),
+            'p90': round(percentile(latencies, 0.90) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+            'max': round(latencies[-1] * 1000, 2),
+        },
+        'queries_per_request': {
+            'mean': round(statistics.fmean(queries), 2),
+            'max': max(queries),
+        },
+        'peak_memory_kib': round(max(peaks) / 1024, 1) if peaks else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'dataset': {
+            'customers': Customer.objects.count(),
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+            'order_items': OrderItem.objects.count(),
+        },
+    }
+
+
+def lookup(result, dotted):
+    for key in dotted.split('.'):
+        result = (result or {}).get(key)
+    return result
+
+
+def compare(report, baseline):
+    """Print how each scenario moved against ``baseline``."""
+    previous = {result['scenario']: result for result in baseline['results']}
+    lines = [f"Compared with {baseline['environment'].get('commit') or 'baseline'} "
+             f"({baseline['environment'].get('timestamp')}):"]
+    for result in report['results']:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        lines.append(f"  {result['scenario']}")
+        for metric, lower_is_better in COMPARED:
+            old, new = lookup(before, metric), lookup(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            better = (change < 0) == lower_is_better
+            verdict = 'better' if better else 'worse'
+            if abs(change) < 5:
+                verdict = 'same'
+            lines.append(f"    {metric:<26} {old:>10} -> {new:<10} {change:+7.1f}% {verdict}")
+    print('\n'.join(lines), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable; default: all)')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='threads sending requests')
+    parser.add_argument('--memory-iterations', type=int, default=5,
+                        help='requests measured under tracemalloc (0 to skip)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', metavar='REPORT',
+                        help='earlier JSON report to compare against')
+    args = parser.parse_args(argv)
+
+    settings.ALLOWED_HOSTS = ['*']
+    rng = random.Random(args.seed)
+    names = args.scenario or list(SCENARIOS)
+
+    results = []
+    for name in names:
+        print(f'Running {name}', file=sys.stderr)
+        results.append(run_scenario(
+            SCENARIOS[name](), rng, args.iterations, args.warmup,
+            args.concurrency, args.memory_iterations))
+
+    report = {
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'compare')},
+        'environment': environment(),
+        'results': results,
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                              / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Representative GraphQL operations for ``benchmarks.run``.
+
+Each scenario builds one request body per iteration from a seeded random
+generator and ids sampled from the current database, so runs against the
+same dataset (see ``benchmarks.datagen``) send the same requests.
+"""
+import uuid
+
+from crm.models import Customer, Product
+
+# Ids sampled from the database for building requests
+SAMPLE_SIZE = 10000
+
+
+class Scenario:
+    name = None
+    description = None
+    query = None
+
+    def setup(self):
+        """Load whatever ``variables`` needs; called once before warmup."""
+
+    def variables(self, rng):
+        return {}
+
+    def body(self, rng):
+        return {'query': self.query, 'variables': self.variables(rng)}
+
+
+class AllOrdersNested(Scenario):
+    name = 'all_orders_nested'
+    description = 'First page of allOrders with each order\'s customer and products'
+    query = """
+        query AllOrdersNested($first: Int!) {
+            allOrders(first: $first) {
+                edges {
+                    node {
+                        id
+                        orderDate
+                        totalAmount
+                        customer { name email }
+                        products { edges { node { name price } } }
+                    }
+                }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+    """
+
+    def variables(self, rng):
+        return {'first': 50}
+
+
+class AllProductsFiltered(Scenario):
+    name = 'all_products_filtered'
+    description = 'allProducts filtered on a random price range and low stock, with totalCount'
+    query = """
+        query AllProductsFiltered($priceGte: Decimal, $priceLte: Decimal) {
+            allProducts(first: 50, priceGte: $priceGte, priceLte: $priceLte, stockLte: 100) {
+                totalCount
+                edges { node { id name price stock } }
+            }
+        }
+    """
+
+    def variables(self, rng):
+        low = rng.uniform(2, 1500)
+        return {'priceGte': f'{low:.2f}', 'priceLte': f'{low + rng.uniform(50, 500):.2f}'}
+
+
+class CreateOrder(Scenario):
+    name = 'create_order'
+    description = 'createOrder for a sampled customer with 1 to 3 sampled products'
+    query = """
+        mutation CreateOrder($customerId: Int!, $productIds: [Int]!) {
+            createOrder(input: {customerId: $customerId, productIds: $productIds}) {
+                success
+                order { id totalAmount }
+            }
+        }
+    """
+
+    def setup(self):
+        self.customer_ids = list(Customer.objects.order_by('pk').values_list(
+            'pk', flat=True)[:SAMPLE_SIZE])
+        self.product_ids = list(Product.objects.order_by('pk').values_list(
+            'pk', flat=True)[:SAMPLE_SIZE])
+        if not self.customer_ids or not self.product_ids:
+            raise RuntimeError('create_order needs customers and products; run benchmarks.datagen')
+
+    def variables(self, rng):
+        return {
+            'customerId': rng.choice(self.customer_ids),
+            'productIds': rng.sample(self.product_ids, min(len(self.product_ids),
+                                                           rng.randint(1, 3))),
+        }
+
+
+class BulkCreateCustomers(Scenario):
+    name = 'bulk_create_customers'
+    description = 'bulkCreateCustomers with 50 new customers'
+    query = """
+        mutation BulkCreateCustomers($input: [BulkCreateCustomersInput]!) {
+            bulkCreateCustomers(input: $input) {
+                success
+                errors
+                customers { id }
+            }
+        }
+    """
+    batch = 50
+
+    def variables(self, rng):
+        # Emails must be new on every run, not just within one
+        run = uuid.uuid4().hex[:12]
+        return {'input': [
+            {'name': f'Bench Customer {i}', 'email': f'bench-{run}-{i}@example.com',
+             'phone': f'+1{rng.randint(2000000000, 9999999999)}'}
+            for i in range(self.batch)
+        ]}
+
+
+class UpdateLowStockProducts(Scenario):
+    name = 'update_low_stock_products'
+    description = 'updateLowStockProducts restocking by 1 everything under 10'
+    query = """
+        mutation UpdateLowStockProducts {
+            updateLowStockProducts(threshold: 10, increment: 1) {
+                success
+                updatedCount
+                updatedProducts(first: 20) { id stock }
+            }
+        }
+    """
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (AllOrdersNested, AllProductsFiltered, CreateOrder,
+                     BulkCreateCustomers, UpdateLowStockProducts)
+}
@@ -0,0 +1,171 @@
+"""
+Stress test stock reservation: many concurrent createOrder mutations
+competing for a few products with little stock, as in a flash sale.
+
+Each of ``--workers`` threads (or processes with ``--processes``) sends
+``--orders`` createOrder mutations through the full Django stack. Every
+order holds 1 to ``--max-lines`` of the ``--products`` sale products,
+1 to ``--max-quantity`` units of each.
+Demand far exceeds supply, so most orders must be refused. The run then
+checks that:
+- no product's stock went below zero;
+- every product's stock went down by exactly the units ordered;
+- exactly the accepted orders were written, so no refused order left a
+  partial reservation behind.
+
+It reports throughput and how the orders were decided. The process exits
+non-zero when any check fails.
+
+The sale products are created fresh and left in place. Use a benchmark
+database; on SQLite set a busy ``timeout`` in ``DATABASES`` OPTIONS or
+some orders fail with "database is locked" (reported, not oversold).
+
+Usage:
+    python -m benchmarks.stock_reservation --workers 16 --orders 2000 --stock 100
+    python -m benchmarks.stock_reservation --processes --workers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from crm.models import Customer, OrderItem, Product  # noqa: E402
+
+CREATE_ORDER = """
+    mutation CreateOrder($customerId: Int!, $items: [OrderItemInput]!) {
+        createOrder(input: {customerId: $customerId, items: $items}) {
+            success
+            order { id }
+        }
+    }
+"""
+
+_local = threading.local()
+
+
+def place_order(body):
+    """Send one createOrder; return (outcome, seconds)."""
+    client = getattr(_local, 'client', None)
+    if client is None:
+        settings.ALLOWED_HOSTS = ['*']
+        client = _local.client = Client()
+    start = time.perf_counter()
+    response = client.post('/graphql/', body, content_type='application/json')
+    elapsed = time.perf_counter() - start
+    payload = json.loads(response.content)
+    errors = payload.get('errors')
+    if not errors:
+        return 'accepted', elapsed
+    code = (errors[0].get('extensions') or {}).get('code')
+    if code == 'INSUFFICIENT_STOCK':
+        return 'sold_out', elapsed
+    return f"error: {errors[0].get('message')}", elapsed
+
+
+def place_orders(bodies):
+    return [place_order(body) for body in bodies]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--processes', action='store_true',
+                        help='run workers as processes instead of threads')
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=3)
+    parser.add_argument('--stock', type=int, default=100,
+                        help='initial stock of each sale product')
+    parser.add_argument('--max-lines', type=int, default=2,
+                        help='most sale products in one order')
+    parser.add_argument('--max-quantity', type=int, default=3,
+                        help='most units of one product in one order')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    tag = f'{time.time_ns():x}'
+    customer, _ = Customer.objects.get_or_create(
+        email='flash-sale@bench.example.com', defaults={'name': 'Flash Sale'})
+    products = Product.objects.bulk_create([
+        Product(name=f'Flash sale {tag} #{i}', price='9.99', stock=args.stock)
+        for i in range(args.products)
+    ])
+    product_ids = [product.pk for product in products]
+
+    bodies = [
+        {'query': CREATE_ORDER, 'variables': {
+            'customerId': customer.pk,
+            'items': [
+                {'productId': product_id, 'quantity': rng.randint(1, args.max_quantity)}
+                for product_id in rng.sample(
+                    product_ids, rng.randint(1, min(args.max_lines, len(product_ids))))
+            ],
+        }}
+        for _ in range(args.orders)
+    ]
+
+    start = time.perf_counter()
+    if args.processes:
+        # Children must open their own connections
+        connections.close_all()
+        chunks = [bodies[i::args.workers] for i in range(args.workers)]
+        with ProcessPoolExecutor(
+                max_workers=args.workers,
+                mp_context=multiprocessing.get_context('fork')) as pool:
+            results = [result for chunk in pool.map(place_orders, chunks)
+                       for result in chunk]
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(place_order, bodies))
+    elapsed = time.perf_counter() - start
+
+    outcomes = Counter(outcome for outcome, _ in results)
+    latencies = sorted(seconds for _, seconds in results)
+    stock = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'stock'))
+    items = OrderItem.objects.filter(product_id__in=product_ids)
+    sold = Counter(dict(items.values('product_id').annotate(
+        units=Sum('quantity')).values_list('product_id', 'units')))
+    checks = {
+        'stock_never_negative': all(units >= 0 for units in stock.values()),
+        'stock_matches_units_sold': all(
+            args.stock - stock[pk] == sold[pk] for pk in product_ids),
+        'orders_match_accepted': (
+            items.values('order_id').distinct().count() == outcomes['accepted']),
+    }
+    report = {
+        'config': vars(args),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(latencies[len(latencies) // 2] * 1000, 2),
+            'p99': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+        },
+        'outcomes': dict(outcomes),
+        'remaining_stock': {str(pk): stock[pk] for pk in product_ids},
+        'units_sold': {str(pk): sold[pk] for pk in product_ids},
+        'checks': checks,
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
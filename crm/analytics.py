@@ -0,0 +1,316 @@
+"""
+Vectorized customer and product analytics behind the ``customerMetrics``
+and ``productAffinity`` queries.
+
+Orders and order lines are read once into columnar NumPy arrays with
+``values_list(...).iterator()`` in chunks. Money is held as integer cents
+so sums stay exact. Every metric is then a group-by on those arrays:
+- RFM: recency, frequency and monetary value per customer, each scored
+  1-5 by quintile and mapped to a segment.
+- Lifetime value: average order value times the yearly order rate, over
+  ``CRM_ANALYTICS_CLV_YEARS``.
+- Co-purchase: support, confidence and lift per product pair.
+
+Results are cached for ``CRM_ANALYTICS_CACHE_TIMEOUT`` seconds per date
+window, so the figures may lag writes by that much.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from crm.models import Order, OrderItem
+
+CACHE_PREFIX = 'crm:analytics:'
+SECONDS_PER_DAY = 86400
+# Tenure below which yearly order rates are not extrapolated
+MIN_TENURE_DAYS = 30
+
+RFM_SEGMENTS = ('champions', 'loyal', 'promising', 'at_risk', 'lost',
+                'hibernating', 'needs_attention')
+
+
+def _cents(value):
+    return int(Decimal(value).scaleb(2))
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def load_columns(queryset, fields, dtypes, chunk_size=None):
+    """
+    Read ``fields`` of ``queryset`` into one NumPy array per field, a chunk
+    of rows at a time. ``dtypes`` maps each field to a dtype, or to a
+    ``(dtype, convert)`` pair for values needing conversion.
+    """
+    chunk_size = chunk_size or settings.CRM_ANALYTICS_CHUNK_SIZE
+    chunks = {field: [] for field in fields}
+    rows = queryset.order_by().values_list(*fields).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            break
+        for field, column in zip(fields, zip(*chunk)):
+            dtype = dtypes[field]
+            if isinstance(dtype, tuple):
+                dtype, convert = dtype
+                column = map(convert, column)
+            chunks[field].append(np.fromiter(column, dtype=dtype, count=len(chunk)))
+    return {
+        field: np.concatenate(arrays) if arrays else np.empty(0, dtype=np.dtype(
+            dtypes[field][0] if isinstance(dtypes[field], tuple) else dtypes[field]))
+        for field, arrays in chunks.items()
+    }
+
+
+def window_orders(date_from=None, date_to=None):
+    orders = Order.objects.all()
+    if date_from is not None:
+        orders = orders.filter(order_date__gte=date_from)
+    if date_to is not None:
+        orders = orders.filter(order_date__lte=date_to)
+    return orders
+
+
+def _cached(name, params, compute):
+    cache = caches[settings.CRM_ANALYTICS_CACHE_ALIAS]
+    payload = json.dumps(params, sort_keys=True, default=str)
+    key = CACHE_PREFIX + name + ':' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, settings.CRM_ANALYTICS_CACHE_TIMEOUT)
+    return result
+
+
+def quintile_scores(values):
+    """
+    Score ``values`` 1 (lowest fifth) to 5 (highest). Ties share the score
+    of the highest rank among them, so a lone value, or a group of equal
+    ones, scores 5. With fewer than five values the scores are spread
+    evenly from 1 to 5 instead.
+    """
+    count = len(values)
+    if not count:
+        return np.empty(0, dtype=np.int8)
+    if count == 1:
+        return np.full(1, 5, dtype=np.int8)
+    # 1-based rank of the last value tied with each one
+    ranks = np.searchsorted(np.sort(values), values, side='right')
+    if count < 5:
+        return (5 - 4 * (count - ranks) // (count - 1)).astype(np.int8)
+    return ((5 * ranks + count - 1) // count).astype(np.int8)
+
+
+def rfm_segments(recency, frequency):
+    conditions = [
+        (recency >= 4) & (frequency >= 4),
+        (recency >= 3) & (frequency >= 3),
+        recency >= 4,
+        (recency <= 2) & (frequency >= 3),
+        recency == 1,
+        recency <= 2,
+    ]
+    return np.select(conditions, RFM_SEGMENTS[:-1], default=RFM_SEGMENTS[-1])
+
+
+def compute_customer_metrics(date_from=None, date_to=None, as_of=None):
+    """
+    Per-customer RFM and lifetime value for orders in the window, as a dict
+    of equally long arrays sorted by customer id.
+    """
+    as_of = as_of or timezone.now()
+    columns = load_columns(
+        window_orders(date_from, date_to),
+        ('customer_id', 'order_date', 'total_amount'),
+        {
+            'customer_id': np.int64,
+            'order_date': (np.int64, lambda value: int(value.timestamp())),
+            'total_amount': (np.int64, _cents),
+        },
+    )
+    customer_ids, groups = np.unique(columns['customer_id'], return_inverse=True)
+    count = len(customer_ids)
+
+    frequency = np.bincount(groups, minlength=count)
+    # bincount weights sum in float64; add the integer cents exactly
+    monetary = np.zeros(count, dtype=np.int64)
+    np.add.at(monetary, groups, columns['total_amount'])
+    first_order = np.full(count, np.iinfo(np.int64).max)
+    last_order = np.full(count, np.iinfo(np.int64).min)
+    np.minimum.at(first_order, groups, columns['order_date'])
+    np.maximum.at(last_order, groups, columns['order_date'])
+
+    now = int(as_of.timestamp())
+    recency_days = (now - last_order) // SECONDS_PER_DAY
+    tenure_days = np.maximum((now - first_order) / SECONDS_PER_DAY, MIN_TENURE_DAYS)
+    average_order = np.divide(monetary, frequency, out=np.zeros(count), where=frequency > 0)
+    orders_per_year = frequency / (tenure_days / 365)
+    lifetime_value = average_order * orders_per_year * settings.CRM_ANALYTICS_CLV_YEARS
+
+    recency_score = quintile_scores(-recency_days)
+    frequency_score = quintile_scores(frequency)
+    monetary_score = quintile_scores(monetary)
+    return {
+        'customer_id': customer_ids,
+        'recency_days': recency_days,
+        'frequency': frequency,
+        'monetary_cents': monetary,
+        'average_order_cents': np.rint(average_order).astype(np.int64),
+        'lifetime_value_cents': np.rint(lifetime_value).astype(np.int64),
+        'first_order': first_order,
+        'last_order': last_order,
+        'recency_score': recency_score,
+        'frequency_score': frequency_score,
+        'monetary_score': monetary_score,
+        'segment': rfm_segments(recency_score, frequency_score),
+    }
+
+
+CUSTOMER_METRICS_ORDER = {
+    'lifetime_value': ('lifetime_value_cents', True),
+    'monetary': ('monetary_cents', True),
+    'frequency': ('frequency', True),
+    'recency': ('recency_days', False),
+}
+
+
+def customer_metrics(date_from=None, date_to=None, customer_id=None, segment=None,
+                     order_by='lifetime_value', first=50):
+    """Rows of per-customer metrics, best first by ``order_by``."""
+    metrics = _cached(
+        'customers',
+        # Recency counts whole days, so the results are keyed by date
+        [date_from, date_to, timezone.localdate()],
+        lambda: compute_customer_metrics(date_from, date_to))
+
+    selected = np.arange(len(metrics['customer_id']))
+    if customer_id is not None:
+        selected = selected[metrics['customer_id'] == customer_id]
+    if segment is not None:
+        selected = selected[metrics['segment'][selected] == segment]
+
+    column, descending = CUSTOMER_METRICS_ORDER[order_by]
+    values = metrics[column][selected]
+    # Stable sort, ties by customer id
+    order = np.argsort(-values if descending else values, kind='stable')
+    selected = selected[order[:first] if first is not None else order]
+
+    return [
+        {
+            'customer_id': int(metrics['customer_id'][i]),
+            'recency_days': int(metrics['recency_days'][i]),
+            'frequency': int(metrics['frequency'][i]),
+            'monetary': _money(metrics['monetary_cents'][i]),
+            'average_order_value': _money(metrics['average_order_cents'][i]),
+            'lifetime_value': _money(metrics['lifetime_value_cents'][i]),
+            'first_order_date': _datetime(metrics['first_order'][i]),
+            'last_order_date': _datetime(metrics['last_order'][i]),
+            'recency_score': int(metrics['recency_score'][i]),
+            'frequency_score': int(metrics['frequency_score'][i]),
+            'monetary_score': int(metrics['monetary_score'][i]),
+            'rfm_score': '{}{}{}'.format(metrics['recency_score'][i],
+                                         metrics['frequency_score'][i],
+                                         metrics['monetary_score'][i]),
+            'segment': str(metrics['segment'][i]),
+        }
+        for i in selected
+    ]
+
+
+def _datetime(timestamp):
+    return datetime.fromtimestamp(int(timestamp), tz=dt_timezone.utc)
+
+
+def compute_co_purchases(date_from=None, date_to=None):
+    """
+    Order counts per product and per product pair bought together, for the
+    orders in the window.
+    """
+    orders = window_orders(date_from, date_to)
+    columns = load_columns(
+        OrderItem.objects.filter(order__in=orders.values('pk')),
+        ('order_id', 'product_id'),
+        {'order_id': np.int64, 'product_id': np.int64},
+    )
+    product_ids, products = np.unique(columns['product_id'], return_inverse=True)
+    product_orders = np.bincount(products, minlength=len(product_ids))
+
+    # Sort lines by order; every pair of lines within an order is a pair
+    order = np.argsort(columns['order_id'], kind='stable')
+    order_ids, products = columns['order_id'][order], products[order]
+    _, starts, sizes = np.unique(order_ids, return_index=True, return_counts=True)
+    ends = np.repeat(starts + sizes, sizes)
+    partners = ends - np.arange(len(products)) - 1
+    first = np.repeat(np.arange(len(products)), partners)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(partners) - partners, partners)
+    second = first + 1 + offsets
+
+    low = np.minimum(products[first], products[second])
+    high = np.maximum(products[first], products[second])
+    pairs, pair_orders = np.unique(low * len(product_ids) + high, return_counts=True)
+    return {
+        'total_orders': len(starts),
+        'product_ids': product_ids,
+        'product_orders': product_orders,
+        'pair_low': pairs // max(len(product_ids), 1),
+        'pair_high': pairs % max(len(product_ids), 1),
+        'pair_orders': pair_orders,
+    }
+
+
+def product_affinity(date_from=None, date_to=None, product_id=None, min_orders=1,
+                     first=20):
+    """
+    Product pairs bought together in at least ``min_orders`` orders, by
+    lift, highest first. With ``product_id``, only pairs containing it,
+    with that product first.
+    """
+    stats = _cached(
+        'co_purchases', [date_from, date_to],
+        lambda: compute_co_purchases(date_from, date_to))
+    product_ids = stats['product_ids']
+    low, high = stats['pair_low'], stats['pair_high']
+    pair_orders = stats['pair_orders']
+
+    if product_id is not None:
+        index = np.searchsorted(product_ids, product_id)
+        if index == len(product_ids) or product_ids[index] != product_id:
+            return []
+        involved = (low == index) | (high == index)
+        low, high, pair_orders = low[involved], high[involved], pair_orders[involved]
+        # Put the requested product on the left
+        swap = high == index
+        low, high = np.where(swap, high, low), np.where(swap, low, high)
+
+    keep = pair_orders >= min_orders
+    low, high, pair_orders = low[keep], high[keep], pair_orders[keep]
+    if not len(pair_orders):
+        return []
+
+    total = stats['total_orders']
+    support = pair_orders / total
+    # Share of the first product's orders that also contain the second
+    confidence = pair_orders / stats['product_orders'][low]
+    lift = confidence / (stats['product_orders'][high] / total)
+
+    order = np.lexsort((-pair_orders, -lift))
+    order = order[:first] if first is not None else order
+    return [
+        {
+            'product_id': int(product_ids[low[i]]),
+            'other_product_id': int(product_ids[high[i]]),
+            'order_count': int(pair_orders[i]),
+            'support': float(support[i]),
+            'confidence': float(confidence[i]),
+            'lift': float(lift[i]),
+        }
+        for i in order
+    ]
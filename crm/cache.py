@@ -0,0 +1,104 @@
+"""
+Response cache for read-only GraphQL queries.
+
+Every model has a generation counter in the cache. A cached response key
+includes the generations of all models the query reads, so bumping a
+model's generation on write makes every response that depends on it
+unreachable at once; stale entries then age out through TTL/LRU eviction.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, visit
+
+GENERATION_PREFIX = 'graphql:generation:'
+RESPONSE_PREFIX = 'graphql:response:'
+
+
+def get_cache():
+    return caches[settings.GRAPHQL_RESPONSE_CACHE_ALIAS]
+
+
+def _generation_key(model):
+    return GENERATION_PREFIX + model._meta.label_lower
+
+
+def invalidate_models(*models):
+    """
+    Drop every cached response that read any of ``models``.
+
+    Inside a transaction the generations are bumped again on commit, so a
+    response cached from a concurrent read of pre-commit data is dropped too.
+    """
+    _bump_generations(models)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_generations(models))
+
+
+def _bump_generations(models):
+    cache = get_cache()
+    for model in models:
+        key = _generation_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Start from the clock rather than 0 so an evicted counter can
+            # never come back with a value older responses were keyed on.
+            cache.set(key, time.time_ns(), None)
+
+
+def _generations(models):
+    cache = get_cache()
+    keys = sorted(_generation_key(model) for model in models)
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def document_models(schema, document):
+    """
+    Return the Django models behind every type selected in ``document``.
+
+    Types not backed by a model (aggregates, for example) list the models
+    they read in a ``cache_models`` attribute.
+    """
+    type_info = TypeInfo(schema)
+    models = set()
+
+    class ModelCollector(Visitor):
+        def enter_field(self, node, *args):
+            graphene_type = getattr(
+                get_named_type(type_info.get_type()), 'graphene_type', None)
+            model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+            if model is not None:
+                models.add(model)
+            models.update(getattr(graphene_type, 'cache_models', ()))
+
+    visit(document, TypeInfoVisitor(type_info, ModelCollector()))
+    return models
+
+
+def response_key(document_hash, variables, operation_name, user_key, models):
+    payload = json.dumps(
+        [document_hash, variables, operation_name, user_key,
+         _generations(models)],
+        sort_keys=True,
+        default=str,
+    )
+    return RESPONSE_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_response(key):
+    return get_cache().get(key)
+
+
+def set_response(key, data):
+    get_cache().set(key, data, settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT)
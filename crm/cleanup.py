@@ -0,0 +1,153 @@
+"""
+Batched removal of customers with no recent orders.
+
+Inactive customers are found with a single ``NOT EXISTS`` subquery and
+deleted in pk order, a bounded batch per short transaction. Dependent rows
+are deleted with set-based ``DELETE ... WHERE ... IN (subquery)``
+statements, children first, instead of loading every object for the
+delete signals; the work those signals do (response cache invalidation,
+daily sales rollups) is done once per batch instead.
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from django.db import models, router, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.utils import timezone
+
+from crm.cache import invalidate_models
+from crm.models import Customer, DailySalesRollup, Order, OrderItem, Product
+
+
+def inactive_customers(cutoff):
+    """Customers created before ``cutoff`` with no order since then."""
+    recent_orders = Order.objects.filter(
+        customer=OuterRef('pk'), order_date__gte=cutoff)
+    return Customer.objects.filter(created_at__lt=cutoff).filter(
+        ~Exists(recent_orders))
+
+
+def cascade_models(model, seen=None):
+    """
+    Return the models a delete of ``model`` cascades to, or None when some
+    relation is not a plain ``CASCADE`` and Django's collector is needed.
+    """
+    seen = set() if seen is None else seen
+    for relation in get_candidate_relations_to_delete(model._meta):
+        if relation.on_delete is not models.CASCADE:
+            return None
+        related_model = relation.related_model
+        if related_model not in seen:
+            seen.add(related_model)
+            if cascade_models(related_model, seen) is None:
+                return None
+    return seen
+
+
+def raw_cascade_delete(queryset):
+    """Delete ``queryset`` and everything it cascades to, children first."""
+    using = queryset.db
+    for relation in get_candidate_relations_to_delete(queryset.model._meta):
+        related = relation.related_model._base_manager.using(using).filter(**{
+            f'{relation.field.name}__in': queryset.values('pk'),
+        })
+        raw_cascade_delete(related)
+    return queryset.order_by()._raw_delete(using)
+
+
+class CleanupState:
+    """Cutoff and pk cursor of a cleanup run, persisted for ``resume``."""
+
+    def __init__(self, path, cutoff, last_pk=0, deleted=0):
+        self.path = path
+        self.cutoff = cutoff
+        self.last_pk = last_pk
+        self.deleted = deleted
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as state_file:
+                data = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+        return cls(path, datetime.fromisoformat(data['cutoff']),
+                   data['last_pk'], data['deleted'])
+
+    def save(self):
+        if self.path is None:
+            return
+        with open(self.path, 'w') as state_file:
+            json.dump({
+                'cutoff': self.cutoff.isoformat(),
+                'last_pk': self.last_pk,
+                'deleted': self.deleted,
+            }, state_file)
+
+    def clear(self):
+        if self.path is None:
+            return
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def clean_inactive_customers(days=365, batch_size=500, sleep=0, dry_run=False,
+                             state_path=None, resume=False, log=None):
+    """
+    Delete customers without orders in the last ``days`` days, ``batch_size``
+    at a time, sleeping ``sleep`` seconds between batches.
+
+    With ``state_path`` the cutoff and progress are saved after every batch
+    and ``resume`` continues an interrupted run with the same cutoff.
+    Returns the number of customers deleted (or that would be, on a dry run).
+    """
+    state = CleanupState.load(state_path) if resume and state_path else None
+    if state is None:
+        state = CleanupState(state_path, timezone.now() - timedelta(days=days))
+
+    candidates = inactive_customers(state.cutoff).order_by('pk')
+    if dry_run:
+        count = candidates.filter(pk__gt=state.last_pk).count()
+        if log:
+            log(f"Would delete {count} customers inactive since {state.cutoff:%Y-%m-%d}")
+        return count
+
+    cascaded = cascade_models(Customer)
+    using = router.db_for_write(Customer)
+    while True:
+        with transaction.atomic(using=using):
+            # Lock the batch so an order placed meanwhile cannot reference
+            # a customer that is about to go.
+            ids = list(candidates.filter(pk__gt=state.last_pk).select_for_update()
+                       .values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            batch = Customer.objects.filter(pk__in=ids)
+            if cascaded is None:
+                # The collector sends the order delete signals
+                batch.delete()
+            else:
+                rollup_slices = DailySalesRollup.objects.slices(
+                    OrderItem.objects.filter(order__customer_id__in=ids))
+                raw_cascade_delete(batch)
+                DailySalesRollup.objects.add_slices(rollup_slices, sign=-1)
+        invalidate_models(Customer, Order, Product)
+
+        state.last_pk = ids[-1]
+        state.deleted += len(ids)
+        state.save()
+        if log:
+            log(f"Deleted {state.deleted} customers (through id {state.last_pk})")
+        if len(ids) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+
+    state.clear()
+    return state.deleted
@@ -1,7 +1,8 @@
 from datetime import datetime
 from django.utils import timezone
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from gql import gql
+
+from crm.graphql_client import get_session
 
 
 def log_crm_heartbeat():
@@ -18,8 +19,7 @@ def log_crm_heartbeat():
 
     # Try to verify GraphQL endpoint is responsive
     try:
-        transport = RequestsHTTPTransport(url="http://localhost:8000/graphql")
-        client = Client(transport=transport, fetch_schema_from_transport=False)
+        session = get_session()
 
         query = gql("""
             {
@@ -27,7 +27,7 @@ def log_crm_heartbeat():
             }
         """)
 
-        result = client.execute(query)
+        result = session.execute(query)
         if result and 'hello' in result:
             message += ' - GraphQL endpoint responsive'
     except Exception as e:
@@ -45,19 +45,19 @@ def update_low_stock():
     """
     Executes the UpdateLowStockProducts GraphQL mutation every 12 hours.
     Updates products with stock < 10 by incrementing stock by 10.
-    Logs updated product names and new stock levels to /tmp/low_stock_updates_log.txt.
+    Logs updated product names and new stock levels to /tmp/low_stock_updates_log.txt
+    (the first 100 products; the total is always logged).
     """
     now = timezone.now()
     timestamp = now.strftime('%d/%m/%Y-%H:%M:%S')
 
     try:
-        transport = RequestsHTTPTransport(url="http://localhost:8000/graphql")
-        client = Client(transport=transport, fetch_schema_from_transport=False)
+        session = get_session()
 
         mutation = gql("""
             mutation {
                 updateLowStockProducts {
-                    updatedProducts {
+                    updatedProducts(first: 100) {
                         id
                         name
                         stock
@@ -69,7 +69,7 @@ def update_low_stock():
             }
         """)
 
-        result = client.execute(mutation)
+        result = session.execute(mutation)
 
         if result and 'updateLowStockProducts' in result:
             mutation_result = result['updateLowStockProducts']
@@ -87,6 +87,8 @@ def update_low_stock():
                     product_name = product.get('name', 'Unknown')
                     product_stock = product.get('stock', 'N/A')
                     log_message += f"    - {product_name}: new stock level = {product_stock}\n"
+                if updated_count > len(updated_products):
+                    log_message += f"    ... and {updated_count - len(updated_products)} more\n"
 
             # Log the update to file
             try:
@@ -3,29 +3,19 @@
 # Script to clean up inactive customers (no orders in the past year)
 cd /home/buomyian/alx-backend-graphql_crm
 
-python manage.py shell << EOF
-from django.utils import timezone
-from datetime import timedelta
-from crm.models import Customer
-
-# Calculate the date from a year ago
-one_year_ago = timezone.now() - timedelta(days=365)
-
-# Find and delete customers with no orders since a year ago
-customers_to_delete = Customer.objects.filter(
-    orders__isnull=True
-) | Customer.objects.filter(
-    orders__order_date__lt=one_year_ago
-).distinct()
-
-count = customers_to_delete.count()
-customers_to_delete.delete()
+# Deletes in batches of 500 with a short pause between transactions and
+# picks up an interrupted run where it stopped
+output=$(python manage.py clean_inactive_customers --days 365 --batch-size 500 --sleep 0.1 --resume)
+status=$?
 
 # Log the result with timestamp
-import datetime
-with open('/tmp/customer_cleanup_log.txt', 'a') as log:
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log.write(f'{timestamp} - Deleted {count} inactive customers\n')
+timestamp=$(date '+%Y-%m-%d %H:%M:%S')
+if [ $status -eq 0 ]; then
+    count=$(echo "$output" | grep -o '[0-9]\+' | tail -1)
+    echo "$timestamp - Deleted $count inactive customers" >> /tmp/customer_cleanup_log.txt
+else
+    echo "$timestamp - Cleanup failed with status $status" >> /tmp/customer_cleanup_log.txt
+fi
 
-print(f'Successfully deleted {count} inactive customers')
-EOF
+echo "$output"
+exit $status
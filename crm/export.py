@@ -0,0 +1,238 @@
+"""
+Streaming exports of customers and orders.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and written
+out one chunk at a time, so memory stays flat whatever the table size.
+Orders carry their items as parallel ``product_ids``, ``quantities`` and
+``unit_prices`` lists, looked up with one query per chunk.
+
+Formats: ``csv``, ``ndjson`` and ``parquet`` (requires ``pyarrow``).
+"""
+
+import csv
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+from crm.filters import CustomerFilter, OrderFilter
+from crm.models import Customer, Order, OrderItem
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+class Export:
+    model = None
+    filterset_class = None
+    columns = ()
+
+    def __init__(self, filters=None, chunk_size=None):
+        self.filters = filters or {}
+        self.chunk_size = chunk_size or settings.CRM_EXPORT_CHUNK_SIZE
+
+    def get_queryset(self):
+        queryset = self.model._default_manager.all()
+        unknown = sorted(set(self.filters) - self.filterset_class.base_filters.keys())
+        if unknown:
+            raise ExportError(
+                f"Unknown filters {', '.join(unknown)}; choose from "
+                f"{', '.join(sorted(self.filterset_class.base_filters))}")
+        if self.filters:
+            filterset = self.filterset_class(data=self.filters, queryset=queryset)
+            if not filterset.is_valid():
+                raise ExportError(json.dumps(filterset.errors.get_json_data()))
+            # A semi-join drops duplicates from filters across many-to-many
+            queryset = queryset.filter(pk__in=filterset.qs.order_by().values('pk'))
+        return queryset.order_by('pk')
+
+    def chunks(self):
+        """Yield lists of at most ``chunk_size`` row dicts in id order."""
+        rows = self.get_queryset().values_list(*self.columns).iterator(
+            chunk_size=self.chunk_size)
+        chunk = []
+        for row in rows:
+            chunk.append(dict(zip(self.columns, row)))
+            if len(chunk) == self.chunk_size:
+                yield self.complete(chunk)
+                chunk = []
+        if chunk:
+            yield self.complete(chunk)
+
+    def complete(self, chunk):
+        return chunk
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+
+class CustomerExport(Export):
+    model = Customer
+    filterset_class = CustomerFilter
+    columns = ('id', 'name', 'email', 'phone', 'created_at', 'updated_at')
+
+
+class OrderExport(Export):
+    model = Order
+    filterset_class = OrderFilter
+    columns = ('id', 'customer_id', 'order_date', 'total_amount', 'created_at', 'updated_at')
+
+    # List columns, one entry per item, and the OrderItem field each holds
+    item_columns = {
+        'product_ids': 'product_id',
+        'quantities': 'quantity',
+        'unit_prices': 'unit_price',
+    }
+
+    @property
+    def fields(self):
+        return list(self.columns) + list(self.item_columns)
+
+    def complete(self, chunk):
+        rows = {row['id']: row for row in chunk}
+        for row in chunk:
+            row.update((name, []) for name in self.item_columns)
+        items = OrderItem.objects.filter(
+            order_id__in=list(rows)).order_by('order_id', 'product_id')
+        for order_id, *values in items.values_list(
+                'order_id', *self.item_columns.values()):
+            row = rows[order_id]
+            for name, value in zip(self.item_columns, values):
+                row[name].append(value)
+        return chunk
+
+
+EXPORTS = {
+    'customers': CustomerExport,
+    'orders': OrderExport,
+}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(str(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def write_csv(export):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export.fields)
+    for chunk in export.chunks():
+        writer.writerows([_csv_value(row[field]) for field in export.fields]
+                         for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_ndjson(export):
+    for chunk in export.chunks():
+        yield ''.join(
+            json.dumps(row, default=_json_default) + '\n' for row in chunk
+        ).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting bytes until the caller drains them."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.extend(data)
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _arrow_type(field):
+    import pyarrow as pa
+
+    internal_type = field.get_internal_type()
+    if internal_type == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC')
+    if internal_type == 'DecimalField':
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if internal_type in ('CharField', 'EmailField', 'TextField'):
+        return pa.string()
+    return pa.int64()
+
+
+def _arrow_schema(export):
+    import pyarrow as pa
+
+    item_columns = getattr(export, 'item_columns', {})
+    types = {}
+    for name in export.fields:
+        if name in item_columns:
+            types[name] = pa.list_(_arrow_type(
+                OrderItem._meta.get_field(item_columns[name])))
+        else:
+            types[name] = _arrow_type(export.model._meta.get_field(name))
+    return pa.schema(list(types.items()))
+
+
+def write_parquet(export):
+    """One Parquet row group per chunk, streamed as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(export)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for chunk in export.chunks():
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+    'parquet': write_parquet,
+}
+
+
+def export_stream(name, format, filters=None, chunk_size=None):
+    """Return an iterator of encoded chunks exporting ``name`` as ``format``."""
+    if name not in EXPORTS:
+        raise ExportError(f"Unknown export {name!r}; choose from {', '.join(EXPORTS)}")
+    if format not in WRITERS:
+        raise ExportError(f"Unknown format {format!r}; choose from {', '.join(WRITERS)}")
+    if format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+    export = EXPORTS[name](filters=filters, chunk_size=chunk_size)
+    # Validate the filters before the first chunk is requested
+    export.get_queryset()
+    return WRITERS[format](export)
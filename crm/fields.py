@@ -0,0 +1,194 @@
+import base64
+import binascii
+import json
+
+import graphene
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql import GraphQLError
+from promise import Promise
+
+from crm.loaders import get_loaders
+from crm.optimizer import optimize_queryset
+
+KEYSET_CURSOR_PREFIX = 'keyset:'
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Relay connection exposing ``totalCount``, counted only when selected."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(self, info):
+        length = getattr(self, 'length', None)
+        if length is not None:
+            return length
+        if isinstance(self.iterable, QuerySet):
+            return self.iterable.count()
+        return len(self.iterable)
+
+
+class BatchedFilterConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection that narrows the filtered queryset to the selected
+    columns and relations, then hands every resolved page to the request
+    loaders so any relation left unjoined is fetched in one query per level.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, **kwargs):
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, **kwargs)
+        return optimize_queryset(queryset, info)
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager,
+                            queryset_resolver, max_limit,
+                            enforce_first_or_last, root, info, **args):
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args)
+
+        def prime(resolved):
+            get_loaders(info).prime(edge.node for edge in resolved.edges)
+            return resolved
+
+        if Promise.is_thenable(result):
+            return Promise.resolve(result).then(prime)
+        return prime(result)
+
+
+def _encode_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class KeysetFilterConnectionField(BatchedFilterConnectionField):
+    """
+    Filter connection paginated by seeking on the model's ordering column.
+
+    Cursors encode the first ``Meta.ordering`` column plus the primary key
+    of a row, and pages are fetched with
+    ``WHERE col < :col OR (col = :col AND id < :id)`` instead of an OFFSET,
+    so deep pages cost the same as the first one. No ``COUNT(*)`` is run
+    unless ``totalCount`` is selected. Offset cursors, the ``offset``
+    argument and querysets with an explicit ``order_by`` (such as ranked
+    ``search`` results) are still served by the default offset pagination.
+    """
+
+    @staticmethod
+    def get_keys(model):
+        ordering = model._meta.ordering[0]
+        descending = ordering.startswith('-')
+        return [(ordering.lstrip('-'), descending), ('pk', descending)]
+
+    @staticmethod
+    def decode_cursor(model, keys, cursor):
+        if cursor is None:
+            return None
+        try:
+            raw = base64.b64decode(cursor).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        if not raw.startswith(KEYSET_CURSOR_PREFIX):
+            return None
+        fields = [model._meta.pk if name == 'pk' else model._meta.get_field(name)
+                  for name, _ in keys]
+        try:
+            values = json.loads(raw[len(KEYSET_CURSOR_PREFIX):])
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError(cursor)
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise GraphQLError("Invalid cursor")
+
+    @staticmethod
+    def encode_cursor(values):
+        raw = KEYSET_CURSOR_PREFIX + json.dumps(
+            [_encode_value(value) for value in values])
+        return base64.b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def seek(keys, values, forward):
+        """Rows strictly after ``values`` in key order (before if not forward)."""
+        condition = Q()
+        for i, (name, descending) in enumerate(keys):
+            lookup = 'lt' if descending == forward else 'gt'
+            filters = {keys[j][0]: values[j] for j in range(i)}
+            filters[f'{name}__{lookup}'] = values[i]
+            condition |= Q(**filters)
+        return condition
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if not isinstance(iterable, QuerySet) or args.get('offset') is not None \
+                or iterable.query.order_by:
+            return super().resolve_connection(
+                connection, args, iterable, max_limit=max_limit)
+
+        model = iterable.model
+        keys = cls.get_keys(model)
+        after = cls.decode_cursor(model, keys, args.get('after'))
+        before = cls.decode_cursor(model, keys, args.get('before'))
+        if (after is None and args.get('after')) or \
+                (before is None and args.get('before')):
+            return super().resolve_connection(
+                connection, args, iterable, max_limit=max_limit)
+
+        first, last = args.get('first'), args.get('last')
+        if first is None and last is None:
+            first = max_limit
+
+        aliases = [f'_keyset_{i}' for i in range(len(keys))]
+        queryset = iterable.annotate(**{
+            alias: F(name) for alias, (name, _) in zip(aliases, keys)})
+        if after is not None:
+            queryset = queryset.filter(cls.seek(keys, after, forward=True))
+        if before is not None:
+            queryset = queryset.filter(cls.seek(keys, before, forward=False))
+
+        forward_order = [f"{'-' if descending else ''}{name}"
+                         for name, descending in keys]
+        if first is None:
+            backward_order = [f"{'' if descending else '-'}{name}"
+                              for name, descending in keys]
+            nodes = list(queryset.order_by(*backward_order)[:last + 1])
+            has_previous_page = len(nodes) > last
+            nodes = nodes[:last][::-1]
+            has_next_page = before is not None
+        else:
+            nodes = list(queryset.order_by(*forward_order)[:first + 1])
+            has_next_page = len(nodes) > first
+            nodes = nodes[:first]
+            has_previous_page = after is not None
+            if last is not None and len(nodes) > last:
+                nodes = nodes[-last:]
+                has_previous_page = True
+
+        edges = [
+            connection.Edge(
+                node=node,
+                cursor=cls.encode_cursor(
+                    [getattr(node, alias) for alias in aliases]),
+            )
+            for node in nodes
+        ]
+        resolved = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        resolved.iterable = iterable
+        resolved.length = None
+        return resolved
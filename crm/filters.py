@@ -1,9 +1,21 @@
 import django_filters
 from django.db.models import Q
 from .models import Customer, Product, Order
+from .search import search as search_backend
 
 
-class CustomerFilter(django_filters.FilterSet):
+class SearchFilterMixin:
+    """Indexed, relevance-ranked ``search`` across the model's text fields."""
+
+    def filter_search(self, queryset, name, value):
+        return search_backend(queryset, value)
+
+
+class CustomerFilter(SearchFilterMixin, django_filters.FilterSet):
+    search = django_filters.CharFilter(
+        method='filter_search',
+        label='Name or email (indexed search, best matches first)'
+    )
     name = django_filters.CharFilter(
         field_name='name',
         lookup_expr='icontains',
@@ -34,10 +46,14 @@ class CustomerFilter(django_filters.FilterSet):
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at_gte', 'created_at_lte', 'phone_pattern']
+        fields = ['search', 'name', 'email', 'created_at_gte', 'created_at_lte', 'phone_pattern']
 
 
-class ProductFilter(django_filters.FilterSet):
+class ProductFilter(SearchFilterMixin, django_filters.FilterSet):
+    search = django_filters.CharFilter(
+        method='filter_search',
+        label='Name (indexed search, best matches first)'
+    )
     name = django_filters.CharFilter(
         field_name='name',
         lookup_expr='icontains',
@@ -75,10 +91,14 @@ class ProductFilter(django_filters.FilterSet):
 
     class Meta:
         model = Product
-        fields = ['name', 'price_gte', 'price_lte', 'stock_gte', 'stock_lte', 'low_stock']
+        fields = ['search', 'name', 'price_gte', 'price_lte', 'stock_gte', 'stock_lte', 'low_stock']
 
 
-class OrderFilter(django_filters.FilterSet):
+class OrderFilter(SearchFilterMixin, django_filters.FilterSet):
+    search = django_filters.CharFilter(
+        method='filter_search',
+        label='Customer or product name (indexed search)'
+    )
     total_amount_gte = django_filters.NumberFilter(
         field_name='total_amount',
         lookup_expr='gte',
@@ -117,6 +137,7 @@ class OrderFilter(django_filters.FilterSet):
     class Meta:
         model = Order
         fields = [
+            'search',
             'total_amount_gte', 'total_amount_lte',
             'order_date_gte', 'order_date_lte',
             'customer_name', 'product_name', 'product_id'
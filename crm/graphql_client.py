@@ -0,0 +1,101 @@
+"""
+GraphQL client for Celery tasks, cron jobs and scripts.
+
+``CRM_GRAPHQL_TRANSPORT = 'local'`` executes documents directly against
+``alx_backend_graphql.schema.schema`` in the calling process: no web server,
+no HTTP round trip and no JSON encoding, with the same result shape the
+endpoint returns. ``'http'`` posts to ``CRM_GRAPHQL_URL`` over one
+keep-alive session per process instead.
+"""
+
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from gql import Client
+from gql.transport import Transport
+from gql.transport.requests import RequestsHTTPTransport
+from graphene_django.settings import graphene_settings
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast, validate
+
+
+class LocalContext:
+    """Stands in for the HTTP request as ``info.context``."""
+
+    user = None
+
+
+class InProcessTransport(Transport):
+    """Synchronous gql transport executing against a local graphene schema."""
+
+    def __init__(self, schema=None):
+        if schema is None:
+            from alx_backend_graphql.schema import schema
+        self.schema = schema.graphql_schema
+
+    def execute(self, request, *args, **kwargs):
+        errors = validate(self.schema, request.document)
+        if errors:
+            return ExecutionResult(errors=[error.formatted for error in errors])
+
+        execute_options = {
+            'context_value': LocalContext(),
+            'variable_values': request.variable_values,
+            'operation_name': request.operation_name,
+        }
+        operation = get_operation_ast(request.document, request.operation_name)
+        if (
+            operation is not None
+            and operation.operation == OperationType.MUTATION
+            and graphene_settings.ATOMIC_MUTATIONS
+        ):
+            with transaction.atomic():
+                result = execute(self.schema, request.document, **execute_options)
+        else:
+            result = execute(self.schema, request.document, **execute_options)
+
+        # Match the JSON error objects the HTTP transport returns
+        if result.errors:
+            return ExecutionResult(
+                data=result.data,
+                errors=[error.formatted for error in result.errors],
+            )
+        return result
+
+
+def get_transport():
+    """Build the transport named by ``CRM_GRAPHQL_TRANSPORT``."""
+    name = settings.CRM_GRAPHQL_TRANSPORT
+    if name == 'local':
+        return InProcessTransport()
+    if name == 'http':
+        return RequestsHTTPTransport(
+            url=settings.CRM_GRAPHQL_URL,
+            timeout=settings.CRM_GRAPHQL_TIMEOUT,
+            retries=settings.CRM_GRAPHQL_RETRIES,
+        )
+    raise ValueError(f"Unknown CRM_GRAPHQL_TRANSPORT {name!r}")
+
+
+_local = threading.local()
+
+
+def get_session():
+    """
+    Return this thread's connected gql session, creating it once.
+
+    Reusing the session keeps the HTTP transport's connection pool alive
+    between task runs; ``Client.execute`` would open and close it per call.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        client = Client(transport=get_transport(), fetch_schema_from_transport=False)
+        session = _local.session = client.connect_sync()
+    return session
+
+
+def close_session():
+    session = getattr(_local, 'session', None)
+    if session is not None:
+        session.client.close_sync()
+        _local.session = None
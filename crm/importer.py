@@ -0,0 +1,436 @@
+"""
+Streaming bulk import of customers, products and orders.
+
+Rows flow through a generator pipeline, one batch at a time:
+
+    read (CSV/NDJSON) -> parse -> validate (``full_clean``) ->
+    resolve foreign keys -> ``bulk_create``
+
+so memory is bounded by the batch size, not the file size. Customers are
+upserted on email. Products and orders are upserted on ``id`` when the
+file has one, so re-importing an export updates the rows it came from; an
+upserted order's lines are replaced by the file's. Orders reference
+customers by ``customer_id`` or ``customer_email`` and list ``product_ids``
+(``;``-separated in CSV, as written by ``export_crm``), optionally with
+matching ``quantities`` and ``unit_prices``.
+Invalid rows are reported with their line number and skipped.
+"""
+
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from crm.cache import invalidate_models
+from crm.models import Customer, Order, OrderItem, Product
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(path, format=None):
+    """Yield ``(line_number, row_dict)`` from a CSV or NDJSON file."""
+    if format is None:
+        format = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+    with open(path, newline='', encoding='utf-8') as source:
+        if format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+        elif format == 'ndjson':
+            for line_number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, RowError(f"Invalid JSON: {e}")
+        else:
+            raise ValueError(f"Unknown import format {format!r}")
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _blank_to_none(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return value
+
+
+def _validation_message(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(
+            ' '.join(messages) if field == '__all__' else f"{field}: {' '.join(messages)}"
+            for field, messages in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+class BatchResult:
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+        self.order_days = set()
+
+    def merge(self, other):
+        self.imported += other.imported
+        self.errors.extend(other.errors)
+        self.order_days.update(other.order_days)
+
+
+class Importer:
+    """Validate and write one batch of ``(line_number, row)`` pairs."""
+
+    model = None
+    # Fields already checked by ``prepare``; validating them would query per row
+    clean_exclude = ()
+
+    def __init__(self):
+        self.result = BatchResult()
+
+    def build(self, row):
+        """Return an unsaved, validated model instance for ``row``."""
+        raise NotImplementedError
+
+    def prepare(self, batch):
+        """Resolve whatever ``build`` needs for the whole batch at once."""
+
+    def write(self, instances):
+        self.model.objects.bulk_create(instances)
+
+    def import_batch(self, batch):
+        self.prepare(batch)
+        valid = []
+        for line_number, row in batch:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                instance = self.build(row)
+                instance.full_clean(exclude=self.clean_exclude, validate_unique=False)
+            except ValidationError as e:
+                self.result.errors.append((line_number, _validation_message(e)))
+                continue
+            except (RowError, KeyError, ValueError, TypeError) as e:
+                self.result.errors.append((line_number, str(e)))
+                continue
+            valid.append((line_number, instance))
+
+        valid = self.deduplicate(valid)
+        try:
+            with transaction.atomic():
+                self.write([instance for _, instance in valid])
+            self.written([instance for _, instance in valid])
+        except IntegrityError:
+            # Retry row by row so only the offending rows are reported
+            for line_number, instance in valid:
+                if not getattr(instance, 'import_with_id', False):
+                    instance.pk = None
+                try:
+                    with transaction.atomic():
+                        self.write([instance])
+                    self.written([instance])
+                except IntegrityError as e:
+                    self.result.errors.append((line_number, str(e)))
+        return self.result
+
+    def deduplicate(self, valid):
+        return valid
+
+    def written(self, instances):
+        self.result.imported += len(instances)
+
+
+class CustomerImporter(Importer):
+    model = Customer
+
+    def build(self, row):
+        return Customer(
+            name=(row.get('name') or '').strip(),
+            email=(row.get('email') or '').strip(),
+            phone=_blank_to_none(row.get('phone')),
+        )
+
+    def deduplicate(self, valid):
+        # Upsert semantics: the last row for an email wins
+        by_email = {}
+        for line_number, customer in valid:
+            by_email[customer.email] = (line_number, customer)
+        return list(by_email.values())
+
+    def write(self, instances):
+        Customer.objects.bulk_create(
+            instances,
+            update_conflicts=True,
+            unique_fields=['email'],
+            update_fields=['name', 'phone', 'updated_at'],
+        )
+
+
+class ProductImporter(Importer):
+    model = Product
+
+    def build(self, row):
+        try:
+            price = Decimal(str(row.get('price')))
+        except InvalidOperation:
+            raise RowError(f"price: Invalid decimal {row.get('price')!r}")
+        product = Product(
+            name=(row.get('name') or '').strip(),
+            price=price,
+            stock=int(_blank_to_none(row.get('stock')) or 0),
+        )
+        product.import_with_id = _blank_to_none(row.get('id')) is not None
+        if product.import_with_id:
+            product.pk = int(row['id'])
+        return product
+
+    def deduplicate(self, valid):
+        by_id = {}
+        for line_number, product in valid:
+            by_id[product.pk if product.import_with_id else ('new', line_number)] = (
+                line_number, product)
+        return list(by_id.values())
+
+    def write(self, instances):
+        with_id = [product for product in instances if product.import_with_id]
+        without_id = [product for product in instances if not product.import_with_id]
+        if with_id:
+            Product.objects.bulk_create(
+                with_id,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=['name', 'price', 'stock', 'updated_at'],
+            )
+        if without_id:
+            Product.objects.bulk_create(without_id)
+
+
+class OrderImporter(Importer):
+    """
+    Orders with their product lines. Customer and product ids are resolved
+    per batch and kept in in-memory maps for the rest of the import.
+    """
+
+    model = Order
+    clean_exclude = ('customer',)
+
+    def __init__(self):
+        super().__init__()
+        self.customer_ids = {}
+        self.known_customer_ids = set()
+        self.prices = {}
+
+    @staticmethod
+    def parse_list(value, convert=int):
+        if isinstance(value, list):
+            return [convert(item) for item in value]
+        return [convert(item.strip()) for item in str(value or '').split(';')
+                if item.strip()]
+
+    def parse_items(self, row):
+        """
+        ``{product_id: (quantity, unit_price)}`` from the row's lists. Prices
+        left out are the product's current price.
+        """
+        product_ids = self.parse_list(row.get('product_ids'))
+        quantities = self.parse_list(row.get('quantities')) or [1] * len(product_ids)
+        try:
+            unit_prices = (self.parse_list(row.get('unit_prices'), Decimal)
+                           or [None] * len(product_ids))
+        except InvalidOperation:
+            raise RowError(f"unit_prices: Invalid decimal in {row.get('unit_prices')!r}")
+        if not len(product_ids) == len(quantities) == len(unit_prices):
+            raise RowError("quantities and unit_prices need one entry per product id")
+
+        items = {}
+        for product_id, quantity, unit_price in zip(product_ids, quantities, unit_prices):
+            if quantity < 1:
+                raise RowError(f"Quantity for product {product_id} must be at least 1")
+            if product_id in items:
+                quantity += items[product_id][0]
+                unit_price = items[product_id][1]
+            items[product_id] = (quantity, unit_price)
+        return items
+
+    def prepare(self, batch):
+        emails, customer_ids, product_ids = set(), set(), set()
+        for _, row in batch:
+            if isinstance(row, Exception):
+                continue
+            if _blank_to_none(row.get('customer_id')) is not None:
+                try:
+                    customer_ids.add(int(row['customer_id']))
+                except ValueError:
+                    pass
+            elif _blank_to_none(row.get('customer_email')) is not None:
+                emails.add(row['customer_email'].strip())
+            try:
+                product_ids.update(self.parse_list(row.get('product_ids')))
+            except ValueError:
+                pass
+
+        emails -= self.customer_ids.keys()
+        if emails:
+            self.customer_ids.update(Customer.objects.filter(
+                email__in=emails).values_list('email', 'id'))
+        customer_ids -= self.known_customer_ids
+        if customer_ids:
+            self.known_customer_ids.update(Customer.objects.filter(
+                id__in=customer_ids).values_list('id', flat=True))
+        product_ids -= self.prices.keys()
+        if product_ids:
+            self.prices.update(Product.objects.filter(
+                id__in=product_ids).values_list('id', 'price'))
+
+    def build(self, row):
+        if _blank_to_none(row.get('customer_id')) is not None:
+            customer_id = int(row['customer_id'])
+            if customer_id not in self.known_customer_ids:
+                raise RowError(f"Customer with ID {customer_id} not found")
+        else:
+            email = (row.get('customer_email') or '').strip()
+            if email not in self.customer_ids:
+                raise RowError(f"Customer with email {email!r} not found")
+            customer_id = self.customer_ids[email]
+
+        items = self.parse_items(row)
+        if not items:
+            raise RowError("At least one product must be selected")
+        missing_ids = set(items) - self.prices.keys()
+        if missing_ids:
+            raise RowError(f"Invalid product IDs: {missing_ids}")
+        items = {
+            product_id: (quantity, self.prices[product_id] if unit_price is None else unit_price)
+            for product_id, (quantity, unit_price) in items.items()
+        }
+
+        order = Order(
+            customer_id=customer_id,
+            total_amount=sum(quantity * unit_price for quantity, unit_price in items.values()),
+        )
+        order_date = _blank_to_none(row.get('order_date'))
+        if order_date is not None:
+            order_date = parse_datetime(order_date)
+            if order_date is None:
+                raise RowError(f"order_date: Invalid date/time {row['order_date']!r}")
+            if timezone.is_naive(order_date):
+                order_date = timezone.make_aware(order_date)
+        order.import_order_date = order_date
+        order.import_items = items
+        order.import_with_id = _blank_to_none(row.get('id')) is not None
+        if order.import_with_id:
+            order.pk = int(row['id'])
+        return order
+
+    def deduplicate(self, valid):
+        by_id = {}
+        for line_number, order in valid:
+            by_id[order.pk if order.import_with_id else ('new', line_number)] = (
+                line_number, order)
+        return list(by_id.values())
+
+    def write(self, instances):
+        with_id = [order for order in instances if order.import_with_id]
+        without_id = [order for order in instances if not order.import_with_id]
+        orders = []
+        if with_id:
+            upserted_ids = [order.pk for order in with_id]
+            # Their old days need their rollups refreshed too
+            self.result.order_days.update(
+                timezone.localdate(order_date) for order_date in Order.objects.filter(
+                    pk__in=upserted_ids).values_list('order_date', flat=True))
+            OrderItem.objects.filter(order_id__in=upserted_ids).delete()
+            orders += Order.objects.bulk_create(
+                with_id,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=['customer', 'total_amount', 'updated_at'],
+            )
+        if without_id:
+            orders += Order.objects.bulk_create(without_id)
+        # auto_now_add overwrote order_date on insert; restore the file's
+        dated = [order for order in orders if order.import_order_date is not None]
+        for order in dated:
+            order.order_date = order.import_order_date
+        if dated:
+            Order.objects.bulk_update(dated, ['order_date'])
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=order.pk, product_id=product_id,
+                      quantity=quantity, unit_price=unit_price)
+            for order in orders
+            for product_id, (quantity, unit_price) in order.import_items.items()
+        ])
+
+    def written(self, instances):
+        super().written(instances)
+        self.result.order_days.update(
+            timezone.localdate(order.order_date) for order in instances)
+
+
+IMPORTERS = {
+    'customers': CustomerImporter,
+    'products': ProductImporter,
+    'orders': OrderImporter,
+}
+
+_worker_importer = None
+
+
+def import_batch(name, batch):
+    """
+    Import one batch in a worker process. The importer, and with it the
+    order importer's id maps, lives as long as the worker.
+    """
+    global _worker_importer
+    if _worker_importer is None or not isinstance(_worker_importer, IMPORTERS[name]):
+        _worker_importer = IMPORTERS[name]()
+    _worker_importer.result = BatchResult()
+    return _worker_importer.import_batch(batch)
+
+
+def reset_sequences(model):
+    """
+    Move ``model``'s id sequence past the ids imported from the file, so
+    the next row created without an id does not collide with them.
+    Backends without sequences (SQLite, MySQL) return no statements.
+    """
+    connection = connections[router.db_for_write(model)]
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def finish_import(name, result):
+    """
+    Bring derived data up to date after an import: id sequences, rollups
+    for imported orders, cached responses. Repriced products leave existing orders
+    alone, since their items keep the price they were ordered at.
+    """
+    from crm.tasks import refresh_daily_sales_rollup
+
+    reset_sequences(IMPORTERS[name].model)
+    if name == 'orders':
+        invalidate_models(Order, Product)
+        if result.order_days:
+            refresh_daily_sales_rollup(
+                date_from=min(result.order_days).isoformat(),
+                date_to=max(result.order_days).isoformat())
+    else:
+        invalidate_models(IMPORTERS[name].model)
+
@@ -0,0 +1,142 @@
+from collections import defaultdict
+
+from django.db.models import F
+
+from crm.models import Customer, Product, Order, OrderItem
+
+
+class BatchLoader:
+    """
+    Request-scoped loader that resolves every pending key with a single query.
+
+    Keys are queued when a page of parent objects is resolved and loaded in
+    one ``IN (...)`` query the first time any of them is requested.
+    """
+
+    default = None
+
+    def __init__(self, loaders):
+        self.loaders = loaders
+        self._cache = {}
+        self._pending = {}
+
+    def enqueue(self, key):
+        if key is not None and key not in self._cache:
+            self._pending[key] = None
+
+    def load(self, key):
+        if key not in self._cache:
+            self.enqueue(key)
+            keys = list(self._pending)
+            self._pending.clear()
+            results = self.batch_load(keys)
+            for pending_key in keys:
+                self._cache[pending_key] = results.get(pending_key, self.default)
+        return self._cache[key]
+
+    def batch_load(self, keys):
+        raise NotImplementedError
+
+
+class ListBatchLoader(BatchLoader):
+    """Batch loader returning a list of related objects per key."""
+
+    default = ()
+
+    def load(self, key):
+        return list(super().load(key))
+
+    def group(self, instances, attname):
+        grouped = defaultdict(list)
+        for instance in instances:
+            grouped[getattr(instance, attname)].append(instance)
+        self.loaders.prime(instances)
+        return grouped
+
+
+class CustomerLoader(BatchLoader):
+    def batch_load(self, keys):
+        customers = Customer.objects.in_bulk(keys)
+        self.loaders.prime(customers.values())
+        return customers
+
+
+class ProductLoader(BatchLoader):
+    def batch_load(self, keys):
+        products = Product.objects.in_bulk(keys)
+        self.loaders.prime(products.values())
+        return products
+
+
+class OrderProductsLoader(ListBatchLoader):
+    def batch_load(self, keys):
+        products = Product.objects.filter(orders__in=keys).annotate(
+            _order_id=F('orders__id'))
+        return self.group(products, '_order_id')
+
+
+class OrderItemsLoader(ListBatchLoader):
+    def batch_load(self, keys):
+        items = OrderItem.objects.filter(order_id__in=keys).order_by('pk')
+        return self.group(items, 'order_id')
+
+
+class CustomerOrdersLoader(ListBatchLoader):
+    def batch_load(self, keys):
+        orders = Order.objects.filter(customer_id__in=keys)
+        return self.group(orders, 'customer_id')
+
+
+class ProductOrdersLoader(ListBatchLoader):
+    def batch_load(self, keys):
+        orders = Order.objects.filter(products__in=keys).annotate(
+            _product_id=F('products__id'))
+        return self.group(orders, '_product_id')
+
+
+class CRMLoaders:
+    """All loaders for one GraphQL execution."""
+
+    def __init__(self):
+        self.customer = CustomerLoader(self)
+        self.product = ProductLoader(self)
+        self.order_products = OrderProductsLoader(self)
+        self.order_items = OrderItemsLoader(self)
+        self.customer_orders = CustomerOrdersLoader(self)
+        self.product_orders = ProductOrdersLoader(self)
+
+    def prime(self, instances):
+        """Queue the relation keys of a freshly resolved page of objects."""
+        for instance in instances:
+            if isinstance(instance, Order):
+                # Read through __dict__ so a deferred customer_id is not
+                # fetched row by row just to be queued.
+                if not Order.customer.is_cached(instance):
+                    self.customer.enqueue(instance.__dict__.get('customer_id'))
+                self.order_products.enqueue(instance.pk)
+                self.order_items.enqueue(instance.pk)
+            elif isinstance(instance, OrderItem):
+                self.product.enqueue(instance.product_id)
+            elif isinstance(instance, Customer):
+                self.customer_orders.enqueue(instance.pk)
+            elif isinstance(instance, Product):
+                self.product_orders.enqueue(instance.pk)
+
+
+def get_loaders(info):
+    """Return the loaders bound to the current request, creating them once."""
+    context = info.context
+    loaders = getattr(context, 'crm_loaders', None)
+    if loaders is None:
+        loaders = CRMLoaders()
+        if context is not None:
+            setattr(context, 'crm_loaders', loaders)
+    return loaders
+
+
+def prefetched(instance, name):
+    """Return prefetched related objects for ``name`` if they were loaded."""
+    cache = getattr(instance, '_prefetched_objects_cache', {})
+    if name in cache:
+        return list(cache[name])
+    return None
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.cleanup import clean_inactive_customers
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete customers with no orders in the last DAYS days, in small '
+        'batches with short transactions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Inactivity window in days (default: 365).')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Customers deleted per transaction (default: 500).')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches (default: 0).')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the customers that would be deleted.')
+        parser.add_argument(
+            '--state-file', default='/tmp/customer_cleanup_state.json',
+            help='Where progress is saved after every batch.')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Continue an interrupted run with its original cutoff.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        count = clean_inactive_customers(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            dry_run=options['dry_run'],
+            state_path=options['state_file'],
+            resume=options['resume'],
+            log=log,
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Would delete {count} inactive customers')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully deleted {count} inactive customers'))
@@ -0,0 +1,59 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.export import EXPORTS, WRITERS, ExportError, export_stream
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream customers or orders to CSV, NDJSON or Parquet in constant '
+        'memory, optionally filtered with the GraphQL connection filters.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument(
+            '--format', default='csv', choices=sorted(WRITERS),
+            help='Output format (default: csv).')
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write; defaults to standard output.')
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='NAME=VALUE',
+            help='FilterSet filter, e.g. --filter order_date_gte=2024-01-01T00:00:00Z. '
+                 'Repeatable.')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Rows per database fetch and write (default: CRM_EXPORT_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        filters = {}
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Filters must look like NAME=VALUE, got {item!r}")
+            filters[name] = value
+
+        try:
+            stream = export_stream(
+                options['name'], options['format'],
+                filters=filters, chunk_size=options['chunk_size'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                written = self.write(stream, output)
+            self.stderr.write(self.style.SUCCESS(
+                f"Wrote {written} bytes to {options['output']}"))
+        else:
+            self.write(stream, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+
+    def write(self, stream, output):
+        written = 0
+        for data in stream:
+            output.write(data)
+            written += len(data)
+        return written
@@ -0,0 +1,123 @@
+import csv
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from crm.importer import (
+    IMPORTERS,
+    BatchResult,
+    batched,
+    finish_import,
+    import_batch,
+    read_rows,
+)
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database connections
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream a CSV or NDJSON file of customers, products or orders into '
+        'the database in validated bulk batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=['csv', 'ndjson'],
+            help='Input format; inferred from the file extension by default.')
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Rows per validated bulk insert (default: CRM_BULK_CREATE_BATCH_SIZE).')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Worker processes importing batches in parallel (default: 1). '
+                 'Ignored on SQLite, which serialises writers.')
+        parser.add_argument(
+            '--errors',
+            help='Write the per-row error report (line, error) to this CSV file.')
+
+    def handle(self, *args, **options):
+        name = options['name']
+        self.verbosity = options['verbosity']
+        batch_size = options['batch_size']
+        if batch_size is None:
+            batch_size = settings.CRM_BULK_CREATE_BATCH_SIZE
+        elif batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+        if workers > 1 and connections['default'].vendor == 'sqlite':
+            self.stderr.write(self.style.WARNING(
+                'SQLite allows one writer at a time; importing with 1 worker.'))
+            workers = 1
+        try:
+            rows = read_rows(options['path'], options['format'])
+            batches = batched(rows, batch_size)
+            if workers > 1:
+                result = self.import_parallel(name, batches, workers)
+            else:
+                result = BatchResult()
+                for batch in batches:
+                    result.merge(import_batch(name, batch))
+                    self.progress(result)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        finish_import(name, result)
+        self.report(result, options['errors'])
+
+    def import_parallel(self, name, batches, workers):
+        result = BatchResult()
+        connections.close_all()
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker) as executor:
+            pending = set()
+            for batch in batches:
+                # Bound the batches in flight so memory stays flat
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result.merge(future.result())
+                    self.progress(result)
+                pending.add(executor.submit(import_batch, name, batch))
+            for future in wait(pending).done:
+                result.merge(future.result())
+        return result
+
+    def progress(self, result):
+        if self.verbosity > 1:
+            self.stderr.write(
+                f"  {result.imported} imported, {len(result.errors)} errors")
+
+    def report(self, result, errors_path):
+        errors = sorted(result.errors)
+        if errors_path:
+            with open(errors_path, 'w', newline='') as errors_file:
+                writer = csv.writer(errors_file)
+                writer.writerow(['line', 'error'])
+                writer.writerows(errors)
+        else:
+            for line_number, error in errors[:20]:
+                self.stderr.write(f"Line {line_number}: {error}")
+            if len(errors) > 20:
+                self.stderr.write(
+                    f"... and {len(errors) - 20} more; use --errors for the full report")
+
+        message = f"Imported {result.imported} rows, {len(errors)} errors"
+        if errors:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
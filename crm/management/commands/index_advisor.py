@@ -0,0 +1,175 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+
+FILTERSETS = [CustomerFilter, ProductFilter, OrderFilter]
+
+# Lookups a B-tree index on the column can serve
+INDEXABLE_LOOKUPS = {'exact', 'gt', 'gte', 'lt', 'lte', 'range', 'in', 'isnull'}
+
+
+def scans_table(plan, table):
+    """Whether an EXPLAIN plan reads ``table`` with a full sequential scan."""
+    for line in plan.splitlines():
+        if f'Seq Scan on {table}' in line:
+            return True
+        if re.search(rf'\bSCAN {table}\b', line) and 'INDEX' not in line:
+            return True
+    return False
+
+
+class Recommendation:
+    def __init__(self, model, fields, reason):
+        self.model = model
+        self.fields = fields
+        self.reason = reason
+
+    @property
+    def columns(self):
+        return [self.model._meta.get_field(name.lstrip('-')).column
+                for name in self.fields]
+
+    def covered_by(self, indexes):
+        """Return the name of an existing index whose leading columns match."""
+        columns = self.columns
+        for name, index_columns in indexes.items():
+            if index_columns[:len(columns)] == columns:
+                return name
+        return None
+
+    def describe(self):
+        return '({})'.format(', '.join(
+            f"{column} DESC" if name.startswith('-') else column
+            for name, column in zip(self.fields, self.columns)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Derive the indexes the CRM filters and orderings need from the '
+        'FilterSet definitions and report which ones are missing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create', action='store_true',
+            help='Create missing indexes directly (prefer Meta.indexes and a migration).')
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Run EXPLAIN for every filter and report whether it uses an index.')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Exit with an error if any recommended index is missing.')
+
+    def handle(self, *args, **options):
+        missing = []
+        for filterset_class in FILTERSETS:
+            model = filterset_class._meta.model
+            indexes = self.get_indexes(model)
+            self.stdout.write(self.style.MIGRATE_HEADING(model._meta.db_table))
+
+            for recommendation in self.recommend(filterset_class):
+                covered_by = recommendation.covered_by(indexes)
+                line = f"  {recommendation.describe()} - {recommendation.reason}"
+                if covered_by:
+                    self.stdout.write(f"{line}: covered by {covered_by}")
+                    continue
+                missing.append(recommendation)
+                self.stdout.write(self.style.WARNING(f"{line}: MISSING"))
+                if options['create']:
+                    self.create_index(recommendation)
+                    indexes = self.get_indexes(model)
+
+            for name, note in self.unindexable(filterset_class):
+                self.stdout.write(f"  {name} - {note}")
+
+            if options['explain']:
+                self.explain(filterset_class)
+
+        if options['check'] and missing and not options['create']:
+            raise CommandError(f"{len(missing)} recommended indexes are missing")
+
+    def get_indexes(self, model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        return {
+            name: constraint['columns']
+            for name, constraint in constraints.items()
+            if constraint['index'] or constraint['unique']
+            or constraint['primary_key']
+        }
+
+    def recommend(self, filterset_class):
+        model = filterset_class._meta.model
+        ordering = model._meta.ordering[0]
+        pk = f"-{model._meta.pk.name}" if ordering.startswith('-') else model._meta.pk.name
+        recommendations = [
+            Recommendation(model, [ordering, pk], 'default ordering and keyset pagination'),
+        ]
+        for field in model._meta.fields:
+            if field.many_to_one:
+                recommendations.append(Recommendation(
+                    model, [field.name, ordering],
+                    f"{field.related_model._meta.model_name}.{field.remote_field.related_name} "
+                    f"in default order"))
+
+        seen = {tuple(r.columns) for r in recommendations}
+        for name, filter_ in filterset_class.base_filters.items():
+            if filter_.method or '__' in filter_.field_name:
+                continue
+            if filter_.lookup_expr not in INDEXABLE_LOOKUPS:
+                continue
+            recommendation = Recommendation(
+                model, [filter_.field_name], f"filter {name} ({filter_.lookup_expr})")
+            if not any(columns[:1] == tuple(recommendation.columns) for columns in seen):
+                seen.add(tuple(recommendation.columns))
+                recommendations.append(recommendation)
+        return recommendations
+
+    def unindexable(self, filterset_class):
+        for name, filter_ in filterset_class.base_filters.items():
+            if filter_.method:
+                yield name, f"custom method {filter_.method}, not analysed"
+            elif filter_.lookup_expr not in INDEXABLE_LOOKUPS:
+                yield name, (f"{filter_.lookup_expr} on {filter_.field_name} "
+                             f"cannot use a B-tree index")
+            elif '__' in filter_.field_name:
+                yield name, f"joins through {filter_.field_name.split('__')[0]}"
+
+    def create_index(self, recommendation):
+        index = models.Index(fields=recommendation.fields)
+        index.set_name_with_model(recommendation.model)
+        with connection.schema_editor() as schema_editor:
+            schema_editor.add_index(recommendation.model, index)
+        self.stdout.write(self.style.SUCCESS(f"    created {index.name}"))
+
+    def sample_value(self, model, field_name):
+        value = model._default_manager.order_by().values_list(
+            field_name, flat=True).first()
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    def explain(self, filterset_class):
+        model = filterset_class._meta.model
+        for name, filter_ in filterset_class.base_filters.items():
+            if filter_.method:
+                continue
+            value = self.sample_value(model, filter_.field_name)
+            if value is None:
+                self.stdout.write(f"  EXPLAIN {name}: no data to sample")
+                continue
+            queryset = filterset_class(
+                data={name: str(value)},
+                queryset=model._default_manager.order_by(),
+            ).qs
+            plan = queryset.explain()
+            if scans_table(plan, model._meta.db_table):
+                self.stdout.write(self.style.WARNING(f"  EXPLAIN {name}: scan"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"  EXPLAIN {name}: index"))
+            for line in plan.splitlines():
+                self.stdout.write(f"      {line}")
@@ -0,0 +1,88 @@
+from django.db import DatabaseError, migrations, transaction
+
+# Columns indexed for search per table, see crm.search.SEARCH_FIELDS
+SEARCH_COLUMNS = {
+    'crm_customer': ('name', 'email'),
+    'crm_product': ('name',),
+}
+
+
+def sqlite_statements(table, columns):
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    delete = (f"INSERT INTO {fts}({fts}, rowid, {names}) "
+              f"VALUES ('delete', old.id, {old});")
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, "
+        f"content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def sqlite_supports_trigram_fts(schema_editor):
+    """
+    Whether this SQLite build has FTS5 with the trigram tokenizer (3.34+).
+    Without it the tables are left out and crm.search falls back to
+    ``icontains``.
+    """
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE temp.crm_fts_probe USING fts5(probe, tokenize='trigram')")
+            schema_editor.execute("DROP TABLE temp.crm_fts_probe")
+    except DatabaseError:
+        return False
+    return True
+
+
+def postgresql_statements(table, columns):
+    return [
+        f"CREATE INDEX {table}_{column}_trgm ON {table} "
+        f"USING gin (UPPER({column}::text) gin_trgm_ops)"
+        for column in columns
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        if not sqlite_supports_trigram_fts(schema_editor):
+            return
+        for table, columns in SEARCH_COLUMNS.items():
+            for statement in sqlite_statements(table, columns):
+                schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, columns in SEARCH_COLUMNS.items():
+            for statement in postgresql_statements(table, columns):
+                schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in SEARCH_COLUMNS.items():
+        if vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        elif vendor == 'postgresql':
+            for column in columns:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
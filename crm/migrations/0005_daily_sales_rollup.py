@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('segment', models.CharField(choices=[('new', 'New customer'), ('returning', 'Returning customer')], max_length=20)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='crm.product')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['product', 'date'], name='crm_rollup_product_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product', 'segment'), name='crm_rollup_date_product_segment_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reminder', to='crm.order')),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:17
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_indexes = import_module('crm.migrations.0004_search_indexes')
+
+
+def clamp_negative_stock(apps, schema_editor):
+    Product = apps.get_model('crm', 'Product')
+    Product.objects.filter(stock__lt=0).update(stock=0)
+
+
+def restore_product_search_triggers(apps, schema_editor):
+    """
+    SQLite adds and removes check constraints by rebuilding the table,
+    which drops the full-text triggers of 0004_search_indexes. Recreate
+    them and reindex the rows written while they were gone.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    table = 'crm_product'
+    with schema_editor.connection.cursor() as cursor:
+        tables = schema_editor.connection.introspection.table_names(cursor)
+    if f'{table}_fts' not in tables:
+        # 0004 skipped the index on a SQLite without trigram FTS5
+        return
+    statements = search_indexes.sqlite_statements(
+        table, search_indexes.SEARCH_COLUMNS[table])
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+    # Skip the CREATE VIRTUAL TABLE; the index table itself survives
+    for statement in statements[1:]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_order_reminder'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_stock, migrations.RunPython.noop),
+        # Runs when migrating backwards, after the constraint is removed
+        migrations.RunPython(migrations.RunPython.noop, restore_product_search_triggers),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(condition=models.Q(('stock__gte', 0)), name='crm_product_stock_non_negative'),
+        ),
+        migrations.RunPython(restore_product_search_triggers, migrations.RunPython.noop),
+    ]
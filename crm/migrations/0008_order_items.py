@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 10000
+
+
+def copy_order_lines(apps, schema_editor):
+    """
+    Turn every order-product row into an order item of one unit at the
+    product's current price, which is what the order total was built from.
+    """
+    OrderProduct = apps.get_model('crm', 'Order_products')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    db = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        rows = list(OrderProduct.objects.using(db).filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', 'order_id', 'product_id', 'product__price')[:BATCH_SIZE])
+        if not rows:
+            break
+        OrderItem.objects.using(db).bulk_create([
+            OrderItem(order_id=order_id, product_id=product_id, quantity=1, unit_price=price)
+            for _, order_id, product_id, price in rows
+        ])
+        last_pk = rows[-1][0]
+
+
+def copy_order_items_back(apps, schema_editor):
+    OrderProduct = apps.get_model('crm', 'Order_products')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    db = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        rows = list(OrderItem.objects.using(db).filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', 'order_id', 'product_id')[:BATCH_SIZE])
+        if not rows:
+            break
+        OrderProduct.objects.using(db).bulk_create([
+            OrderProduct(order_id=order_id, product_id=product_id)
+            for _, order_id, product_id in rows
+        ])
+        last_pk = rows[-1][0]
+
+
+def fill_rollup_units(apps, schema_editor):
+    # Every existing line is one unit, so units equal the order count
+    DailySalesRollup = apps.get_model('crm', 'DailySalesRollup')
+    DailySalesRollup.objects.using(schema_editor.connection.alias).update(
+        units=models.F('order_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_product_stock_non_negative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='crm.order')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='crm.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'order'], name='crm_item_product_order_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='crm_orderitem_order_product_uniq'), models.CheckConstraint(condition=models.Q(('quantity__gte', 1)), name='crm_orderitem_quantity_positive')],
+            },
+        ),
+        migrations.RunPython(copy_order_lines, copy_order_items_back),
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='crm.OrderItem', to='crm.product'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='units',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rollup_units, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,53 @@
-from django.db import models
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.db.models.signals import m2m_changed
+from django.utils import timezone
+from crm.cache import invalidate_models
 from django.core.exceptions import ValidationError
 import re
 
 
+class InvalidatingQuerySet(models.QuerySet):
+    """
+    Queryset whose bulk writes drop the cached responses reading the model.
+    ``update()``, ``bulk_create()`` and ``bulk_update()`` send no model
+    signals, so the signal receivers alone would leave those responses stale.
+    """
+
+    def update(self, **kwargs):
+        updated = super().update(**kwargs)
+        if updated:
+            invalidate_models(self.model)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            invalidate_models(self.model)
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        updated = super().bulk_update(objs, fields, batch_size=batch_size)
+        if updated:
+            invalidate_models(self.model)
+        return updated
+
+    def delete(self):
+        deleted, per_model = super().delete()
+        if deleted:
+            # Fast deletes of cascaded rows send no signals either
+            invalidate_models(*(apps.get_model(label)
+                                for label, count in per_model.items() if count))
+        return deleted, per_model
+
+
 class Customer(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
@@ -10,8 +55,13 @@ class Customer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = InvalidatingQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='crm_customer_created_id_idx'),
+        ]
 
     def clean(self):
         if self.phone:
@@ -23,6 +73,84 @@ class Customer(models.Model):
         return self.name
 
 
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Insufficient stock for products: {self.product_ids}")
+
+
+class ProductQuerySet(InvalidatingQuerySet):
+    def reserve_stock(self, quantities):
+        """
+        Take ``quantities`` (``{product_id: units}``) out of stock with one
+        conditional ``UPDATE ... SET stock = stock - n WHERE id = ? AND
+        stock >= n`` over all the products, or raise ``InsufficientStock``
+        naming the products that are short and change nothing.
+
+        The database checks and decrements each row under its row lock, so
+        concurrent orders can never take a product below zero. Backends
+        with ``SELECT ... FOR UPDATE`` lock the rows in id order first so
+        orders sharing products cannot deadlock.
+        """
+        quantities = {pk: units for pk, units in quantities.items() if units}
+        if not quantities:
+            return
+        units = Case(
+            *(When(pk=pk, then=Value(n)) for pk, n in quantities.items()),
+            output_field=models.IntegerField(),
+        )
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db):
+            rows = self.filter(pk__in=list(quantities)).order_by()
+            if connection.features.has_select_for_update:
+                list(rows.order_by('pk').select_for_update().values_list('pk', flat=True))
+            updated = rows.filter(stock__gte=units).update(
+                stock=F('stock') - units, updated_at=timezone.now())
+            if updated != len(quantities):
+                available = dict(rows.values_list('pk', 'stock'))
+                # Rolls back the decrements of the products that had enough
+                raise InsufficientStock(
+                    pk for pk, n in quantities.items() if available.get(pk, 0) < n)
+        invalidate_models(self.model)
+
+    def increment_stock(self, amount):
+        """
+        Add ``amount`` to the stock of every product in the queryset with a
+        single ``UPDATE ... SET stock = stock + amount`` and return the
+        sorted ids of the updated rows.
+
+        The increment is computed by the database, so concurrent writers
+        never lose updates. ``QuerySet.update()`` cannot return the rows it
+        changed, so on backends with ``UPDATE ... RETURNING`` (PostgreSQL,
+        SQLite 3.35+) the statement is written out, filtered by the
+        queryset's own SQL, and reports the ids in the same round trip.
+        Elsewhere the ids are read first and then updated by id.
+        """
+        now = timezone.now()
+        connection = connections[self.db]
+        if (connection.vendor in ('postgresql', 'sqlite')
+                and connection.features.can_return_columns_from_insert):
+            qn = connection.ops.quote_name
+            opts = self.model._meta
+            table, pk = qn(opts.db_table), qn(opts.pk.column)
+            stock, updated_at = qn(opts.get_field('stock').column), qn(
+                opts.get_field('updated_at').column)
+            matching, params = self.order_by().values('pk').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET {stock} = {stock} + %s, {updated_at} = %s '
+                    f'WHERE {pk} IN ({matching}) RETURNING {pk}',
+                    [amount, connection.ops.adapt_datetimefield_value(now), *params])
+                ids = sorted(row[0] for row in cursor.fetchall())
+        else:
+            with transaction.atomic(using=self.db):
+                ids = sorted(self.values_list('pk', flat=True))
+                self.model._base_manager.using(self.db).filter(pk__in=ids).update(
+                    stock=F('stock') + amount, updated_at=now)
+        invalidate_models(self.model)
+        return ids
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -30,8 +158,19 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='crm_product_created_id_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(stock__gte=0), name='crm_product_stock_non_negative'),
+        ]
 
     def clean(self):
         if self.price < 0:
@@ -43,19 +182,301 @@ class Product(models.Model):
         return self.name
 
 
+def line_total(prefix=''):
+    """``quantity * unit_price`` of the order line reached by ``prefix``."""
+    return ExpressionWrapper(
+        F(prefix + 'quantity') * F(prefix + 'unit_price'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
+class OrderQuerySet(InvalidatingQuerySet):
+    def recalculate_totals(self):
+        """
+        Recompute ``total_amount`` for every order in the queryset with a
+        single UPDATE driven by a correlated ``SUM`` over its lines' price
+        snapshots.
+        """
+        totals = OrderItem.objects.filter(
+            order_id=OuterRef('pk')
+        ).values('order_id').annotate(
+            total=Sum(line_total())
+        ).values('total')
+        updated = self.order_by().update(total_amount=Coalesce(
+            Subquery(totals),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        ))
+        invalidate_models(Order)
+        return updated
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     order_date = models.DateTimeField(auto_now_add=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['-order_date', '-id'], name='crm_order_date_id_idx'),
+            models.Index(fields=['customer', '-order_date'], name='crm_order_customer_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
 
     def calculate_total(self):
-        return sum(product.price for product in self.products.all())
+        total = self.items.aggregate(total=Sum(line_total()))['total']
+        # SQLite multiplies decimals as REAL; round back to cents
+        return Decimal(total or 0).quantize(Decimal('0.01'))
+
+    def add_items(self, quantities, prices=None, totaled=False):
+        """
+        Add a line per product in ``quantities`` (``{product_id: units}``),
+        priced at ``prices`` (``{product_id: unit_price}``) or else at the
+        products' current prices. Sends ``m2m_changed`` like
+        ``products.add()``, so totals, rollups and caches follow.
+
+        Pass ``totaled=True`` when ``total_amount`` already includes the new
+        lines, e.g. a new order created with its total, to skip recomputing it.
+        """
+        if prices is None:
+            prices = dict(Product.objects.filter(
+                pk__in=list(quantities)).values_list('pk', 'price'))
+        using = router.db_for_write(OrderItem, instance=self)
+        pk_set = set(quantities)
+        signal = dict(sender=OrderItem, instance=self, reverse=False,
+                      model=Product, pk_set=pk_set, using=using, totaled=totaled)
+        with transaction.atomic(using=using):
+            m2m_changed.send(action='pre_add', **signal)
+            OrderItem.objects.using(using).bulk_create([
+                OrderItem(order=self, product_id=product_id, quantity=units,
+                          unit_price=prices[product_id])
+                for product_id, units in quantities.items()
+            ])
+            m2m_changed.send(action='post_add', **signal)
 
     def __str__(self):
         return f"Order {self.id} - {self.customer.name}"
+
+
+class OrderItem(models.Model):
+    """
+    One product on an order: how many units, and the unit price when the
+    order was placed, so later price changes leave the order's total alone.
+    """
+
+    # The (order, product) constraint's index serves lookups by order
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items',
+                              db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items',
+                                db_index=False)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = InvalidatingQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['order', 'product'], name='crm_orderitem_order_product_uniq'),
+            models.CheckConstraint(
+                condition=Q(quantity__gte=1), name='crm_orderitem_quantity_positive'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'order'], name='crm_item_product_order_idx'),
+        ]
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} on order {self.order_id}"
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class DailySalesRollupQuerySet(models.QuerySet):
+    def slices(self, lines):
+        """
+        Aggregate the order lines in ``lines`` (an ``OrderItem`` queryset)
+        into ``{(date, product_id, segment): (order_count, units, revenue)}``
+        with one query.
+        """
+        new_customer = timedelta(days=settings.CRM_NEW_CUSTOMER_DAYS)
+        rows = lines.annotate(
+            date=TruncDate('order__order_date'),
+            segment=Case(
+                When(order__order_date__lt=F('order__customer__created_at') + new_customer,
+                     then=Value(DailySalesRollup.SEGMENT_NEW)),
+                default=Value(DailySalesRollup.SEGMENT_RETURNING),
+            ),
+        ).values('date', 'product_id', 'segment').annotate(
+            order_count=Count('order_id', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum(line_total()),
+        ).order_by()
+        return {
+            (row['date'], row['product_id'], row['segment']): (
+                row['order_count'], row['units'],
+                Decimal(row['revenue']).quantize(Decimal('0.01')))
+            for row in rows
+        }
+
+    def refresh(self, date_from=None, date_to=None, product_ids=None):
+        """
+        Recompute the rollup rows for orders placed between ``date_from``
+        and ``date_to`` (inclusive dates, open-ended when None) that contain
+        ``product_ids`` (all products when None), and return the number of
+        rows written.
+
+        The slice is deleted and rebuilt from the order lines with one
+        aggregate query, so running it again for the same window is a
+        no-op. Rebuilding races with concurrent order writes, so it is for
+        backfills and repairs (``crm.tasks.refresh_daily_sales_rollup``);
+        order writes use ``add_slices``.
+        """
+        lines = OrderItem.objects.all()
+        rollups = self.model._default_manager.all()
+        if date_from is not None:
+            lines = lines.filter(order__order_date__gte=_day_start(date_from))
+            rollups = rollups.filter(date__gte=date_from)
+        if date_to is not None:
+            lines = lines.filter(
+                order__order_date__lt=_day_start(date_to + timedelta(days=1)))
+            rollups = rollups.filter(date__lte=date_to)
+        if product_ids is not None:
+            lines = lines.filter(product_id__in=product_ids)
+            rollups = rollups.filter(product_id__in=product_ids)
+
+        rollup_rows = [
+            DailySalesRollup(
+                date=date, product_id=product_id, segment=segment,
+                order_count=order_count, units=units, revenue=revenue,
+            )
+            for (date, product_id, segment), (order_count, units, revenue)
+            in self.slices(lines).items()
+        ]
+        with transaction.atomic(using=self.db):
+            rollups.delete()
+            # Upsert so a concurrent refresh of the same slice cannot collide
+            self.model._default_manager.bulk_create(
+                rollup_rows,
+                batch_size=settings.CRM_BULK_CREATE_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['date', 'product', 'segment'],
+                update_fields=['order_count', 'units', 'revenue', 'updated_at'],
+            )
+        invalidate_models(self.model)
+        return len(rollup_rows)
+
+    def add_slices(self, slices, sign=1):
+        """
+        Add ``slices`` (as returned by ``slices``), times ``sign``, to the
+        rollup rows with ``UPDATE ... SET units = units + delta``, inserting
+        the rows that do not exist yet and deleting those left empty.
+
+        Each writer only adds its own lines' deltas, so concurrent order
+        writes to the same slice add up instead of overwriting each other.
+        Rows are written in key order so writers cannot deadlock.
+
+        Lines written without signals (``bulk_create``, raw SQL) leave the
+        rows behind until the next ``refresh``, so a removal may subtract
+        more than a row holds. Counts stop at zero instead of failing the
+        order write that triggered them.
+        """
+        manager = self.model._default_manager.db_manager(self.db)
+        with transaction.atomic(using=self.db):
+            for (date, product_id, segment), deltas in sorted(slices.items()):
+                order_count, units, revenue = (sign * delta for delta in deltas)
+                if not (order_count or units or revenue):
+                    continue
+                row = manager.filter(date=date, product_id=product_id, segment=segment)
+                changes = dict(
+                    order_count=self._clamped('order_count', order_count),
+                    units=self._clamped('units', units),
+                    revenue=self._clamped('revenue', revenue),
+                    updated_at=timezone.now(),
+                )
+                if not row.update(**changes) and order_count > 0:
+                    try:
+                        with transaction.atomic(using=self.db):
+                            manager.create(
+                                date=date, product_id=product_id, segment=segment,
+                                order_count=order_count, units=max(units, 0),
+                                revenue=max(revenue, 0))
+                    except IntegrityError:
+                        # A concurrent writer inserted the row first
+                        row.update(**changes)
+                row.filter(order_count__lte=0).delete()
+        invalidate_models(self.model)
+
+    def _clamped(self, name, delta):
+        """``name + delta``, but never below zero."""
+        return Greatest(F(name) + delta, Value(0),
+                        output_field=self.model._meta.get_field(name))
+
+    def move_slices(self, before, after):
+        """Apply the change from ``before`` to ``after`` (both from ``slices``)."""
+        changed = {}
+        for key in before.keys() | after.keys():
+            old = before.get(key, (0, 0, Decimal('0')))
+            new = after.get(key, (0, 0, Decimal('0')))
+            if old != new:
+                changed[key] = tuple(n - o for n, o in zip(new, old))
+        if changed:
+            self.add_slices(changed)
+
+
+class DailySalesRollup(models.Model):
+    """
+    Orders, units and revenue per day, product and customer segment, maintained
+    from order writes by ``crm.signals`` and repaired by
+    ``crm.tasks.refresh_daily_sales_rollup``.
+    """
+
+    SEGMENT_NEW = 'new'
+    SEGMENT_RETURNING = 'returning'
+    SEGMENT_CHOICES = [
+        (SEGMENT_NEW, 'New customer'),
+        (SEGMENT_RETURNING, 'Returning customer'),
+    ]
+
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    segment = models.CharField(max_length=20, choices=SEGMENT_CHOICES)
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DailySalesRollupQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'product', 'segment'], name='crm_rollup_date_product_segment_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'date'], name='crm_rollup_product_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product_id} {self.segment}"
+
+
+class OrderReminder(models.Model):
+    """Records that a reminder covering ``order`` was delivered."""
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='reminder')
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Reminder for order {self.order_id}"
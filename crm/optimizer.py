@@ -0,0 +1,142 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql import get_named_type
+from graphql.execution.collect_fields import collect_sub_fields
+
+
+class QueryPlan:
+    """
+    Columns, joins and prefetches needed to serve a selection set.
+
+    Paths are relative to ``model``; ``only`` is dropped when a selected
+    field cannot be mapped to a plain column, since its resolver may read
+    any of them.
+    """
+
+    def __init__(self, model, defer_safe=True):
+        self.model = model
+        self.only = {model._meta.pk.attname}
+        self.select_related = []
+        self.prefetch_related = []
+        self.defer_safe = defer_safe
+
+    def nest(self, path, child):
+        """Merge the plan of a relation reached through ``path``."""
+        self.select_related.extend(
+            f'{path}__{lookup}' for lookup in child.select_related)
+        self.prefetch_related.extend(
+            (f'{path}__{lookup}', queryset)
+            for lookup, queryset in child.prefetch_related)
+        if child.defer_safe:
+            self.only.update(f'{path}__{column}' for column in child.only)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*(
+                Prefetch(lookup, queryset=related)
+                for lookup, related in self.prefetch_related))
+        if self.defer_safe:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+def _sub_fields(info, graphql_type, field_nodes):
+    """Collect sub-selections of ``field_nodes``, expanding fragments."""
+    return collect_sub_fields(
+        info.schema, info.fragments, info.variable_values,
+        graphql_type, field_nodes)
+
+
+def _child(info, graphql_type, field_nodes):
+    """Return the named type and merged sub-selections of a field."""
+    name = field_nodes[0].name.value
+    child_type = get_named_type(graphql_type.fields[name].type)
+    if not hasattr(child_type, 'fields'):
+        return child_type, {}
+    return child_type, _sub_fields(info, child_type, field_nodes)
+
+
+def _connection_nodes(info, graphql_type, selections):
+    """Descend ``edges { node { ... } }`` of a connection selection."""
+    node_type, node_fields = None, {}
+    for field_nodes in selections.values():
+        if field_nodes[0].name.value != 'edges':
+            continue
+        edge_type, edge_fields = _child(info, graphql_type, field_nodes)
+        for edge_nodes in edge_fields.values():
+            if edge_nodes[0].name.value != 'node':
+                continue
+            node_type, fields = _child(info, edge_type, edge_nodes)
+            for key, nodes in fields.items():
+                node_fields.setdefault(key, []).extend(nodes)
+    return node_type, node_fields
+
+
+def _plan(info, model, graphql_type, selections, defer_safe=True):
+    plan = QueryPlan(model, defer_safe)
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    relations = []
+    for field_nodes in selections.values():
+        name = field_nodes[0].name.value
+        if name.startswith('__'):
+            continue
+        attr = to_snake_case(name)
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            plan.defer_safe = False
+            continue
+        if field.is_relation:
+            relations.append((field, field_nodes))
+        elif field.primary_key:
+            continue
+        elif hasattr(graphene_type, f'resolve_{attr}'):
+            # A custom resolver may read any column of this object or of
+            # the objects it reaches, so nothing below it is deferred.
+            plan.defer_safe = False
+        else:
+            plan.only.add(field.attname)
+
+    for field, field_nodes in relations:
+        child_type, child_fields = _child(info, graphql_type, field_nodes)
+        related_model = field.related_model
+
+        if field.concrete and not field.many_to_many:
+            plan.only.add(field.attname)
+            plan.select_related.append(field.name)
+            plan.nest(field.name, _plan(
+                info, related_model, child_type, child_fields,
+                plan.defer_safe))
+            continue
+
+        node_type, node_fields = _connection_nodes(
+            info, child_type, child_fields)
+        if node_type is None:
+            continue
+        child = _plan(
+            info, related_model, node_type, node_fields, plan.defer_safe)
+        if field.one_to_many:
+            child.only.add(field.field.attname)
+        plan.prefetch_related.append((
+            field.get_accessor_name() if field.auto_created else field.name,
+            child.apply(related_model._default_manager.all())))
+    return plan
+
+
+def optimize_queryset(queryset, info):
+    """
+    Restrict ``queryset`` to the columns the client selected and join or
+    prefetch the relations it traverses, following fragments and nested
+    connections.
+    """
+    return_type = get_named_type(info.return_type)
+    selections = _sub_fields(info, return_type, info.field_nodes)
+    if any(nodes[0].name.value == 'edges' for nodes in selections.values()):
+        return_type, selections = _connection_nodes(
+            info, return_type, selections)
+        if return_type is None:
+            return queryset
+    return _plan(info, queryset.model, return_type, selections).apply(queryset)
@@ -0,0 +1,232 @@
+"""
+Order reminder pipeline.
+
+1. Page through the orders of the last ``days`` days with ``allOrders``
+   cursors, skipping orders that already have an ``OrderReminder``.
+2. Group the remaining orders by customer, so each customer gets a single
+   reminder covering all of their orders.
+3. Deliver the reminders in batches, on a rate-limited thread pool or as a
+   Celery group, through the sender named by ``CRM_REMINDER_SENDER``.
+4. Record an ``OrderReminder`` per order once its reminder is delivered, so
+   re-running the job only delivers what is still missing.
+
+Delivery is at-least-once: a crash between sending and recording a batch
+sends that batch again on the next run.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from gql import gql
+from graphql_relay import from_global_id
+
+from crm.graphql_client import get_session
+from crm.models import OrderReminder
+
+logger = logging.getLogger(__name__)
+
+ORDERS_PAGE = gql("""
+    query RecentOrders($since: DateTime!, $first: Int!, $after: String) {
+        allOrders(orderDateGte: $since, first: $first, after: $after) {
+            edges {
+                node {
+                    id
+                    orderDate
+                    customer {
+                        id
+                        name
+                        email
+                    }
+                }
+            }
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+        }
+    }
+""")
+
+
+class FileSender:
+    """Appends one line per reminder to a log file; the local stand-in."""
+
+    def __init__(self, path='/tmp/order_reminders_log.txt'):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, reminder):
+        timestamp = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+        order_ids = ', '.join(str(order_id) for order_id in reminder['order_ids'])
+        with self.lock, open(self.path, 'a') as log:
+            log.write(f"{timestamp} - Customer Email: {reminder['email']}, "
+                      f"Order IDs: {order_ids}\n")
+
+
+class EmailSender:
+    """Sends reminders with Django's configured ``EMAIL_BACKEND``."""
+
+    subject = 'Your recent orders'
+
+    def send(self, reminder):
+        order_ids = ', '.join(f"#{order_id}" for order_id in reminder['order_ids'])
+        send_mail(
+            self.subject,
+            f"Hi {reminder['name']},\n\nThanks for your orders {order_ids}. "
+            f"We will let you know when they ship.\n",
+            settings.DEFAULT_FROM_EMAIL,
+            [reminder['email']],
+        )
+
+
+def get_sender():
+    return import_string(settings.CRM_REMINDER_SENDER)()
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def collect_reminders(days=7, page_size=None, session=None):
+    """
+    Return one reminder per customer with orders in the last ``days`` days
+    that have not been reminded yet, as dicts of ``customer_id``, ``name``,
+    ``email`` and ``order_ids``.
+    """
+    page_size = page_size or settings.CRM_REMINDER_PAGE_SIZE
+    session = session or get_session()
+    since = (timezone.now() - timedelta(days=days)).isoformat()
+
+    reminders = {}
+    after = None
+    while True:
+        result = session.execute(ORDERS_PAGE, variable_values={
+            'since': since, 'first': page_size, 'after': after})
+        page = result['allOrders']
+        nodes = [edge['node'] for edge in page['edges']]
+        order_ids = {int(from_global_id(node['id'])[1]): node for node in nodes}
+        reminded = set(OrderReminder.objects.filter(
+            order_id__in=list(order_ids)).values_list('order_id', flat=True))
+
+        for order_id, node in order_ids.items():
+            if order_id in reminded:
+                continue
+            customer = node['customer']
+            reminder = reminders.setdefault(customer['id'], {
+                'customer_id': int(from_global_id(customer['id'])[1]),
+                'name': customer['name'],
+                'email': customer['email'],
+                'order_ids': [],
+            })
+            reminder['order_ids'].append(order_id)
+
+        if not page['pageInfo']['hasNextPage']:
+            break
+        after = page['pageInfo']['endCursor']
+    return list(reminders.values())
+
+
+def deliver(reminders, sender=None, limiter=None):
+    """
+    Send ``reminders`` and record their orders as reminded. Returns the
+    number delivered; failures are left unrecorded for the next run.
+    """
+    sender = sender or get_sender()
+    delivered_orders = []
+    delivered = 0
+    for reminder in reminders:
+        if limiter is not None:
+            limiter.wait()
+        try:
+            sender.send(reminder)
+        except Exception:
+            # Left unrecorded, so the next run sends it again
+            logger.exception("Error sending reminder to %s", reminder['email'])
+            continue
+        delivered += 1
+        delivered_orders.extend(reminder['order_ids'])
+
+    now = timezone.now()
+    OrderReminder.objects.bulk_create(
+        [OrderReminder(order_id=order_id, sent_at=now) for order_id in delivered_orders],
+        ignore_conflicts=True,
+    )
+    return delivered
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def dispatch(reminders, mode=None, batch_size=None):
+    """
+    Deliver ``reminders`` in batches, with ``mode`` ``'threads'`` (a local
+    pool sharing one rate limiter) or ``'celery'`` (a group of
+    ``send_order_reminder_batch`` tasks, rate limited per worker process).
+    Returns the number delivered, or the group result for Celery.
+    """
+    mode = mode or settings.CRM_REMINDER_DISPATCH
+    batch_size = batch_size or settings.CRM_REMINDER_BATCH_SIZE
+    batches = list(_batches(reminders, batch_size))
+
+    if mode == 'celery':
+        from celery import group
+        from crm.tasks import send_order_reminder_batch
+
+        return group(send_order_reminder_batch.s(batch) for batch in batches).apply_async()
+    if mode != 'threads':
+        raise ValueError(f"Unknown CRM_REMINDER_DISPATCH {mode!r}")
+
+    sender = get_sender()
+    limiter = get_process_limiter()
+
+    def run(batch):
+        try:
+            return deliver(batch, sender=sender, limiter=limiter)
+        finally:
+            # Pool threads each opened their own connection
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=settings.CRM_REMINDER_THREADS) as executor:
+        return sum(executor.map(run, batches))
+
+
+_process_limiter = None
+
+
+def get_process_limiter():
+    """Rate limiter shared by everything delivering in this process."""
+    global _process_limiter
+    if _process_limiter is None:
+        _process_limiter = RateLimiter(settings.CRM_REMINDER_RATE)
+    return _process_limiter
+
+
+def send_order_reminders(days=7):
+    """Collect and dispatch the reminders for the last ``days`` days."""
+    reminders = collect_reminders(days=days)
+    return len(reminders), dispatch(reminders)
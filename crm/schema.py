@@ -1,39 +1,103 @@
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 from graphql import GraphQLError
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
-from crm.models import Customer, Order
+from crm.models import Customer, DailySalesRollup, InsufficientStock, Order, OrderItem
 from crm.models import Product
 from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+from crm.cache import invalidate_models
+from crm.fields import CountableConnection, KeysetFilterConnectionField
+from crm.loaders import get_loaders, prefetched
+from crm.optimizer import optimize_queryset
+from crm.stats import CRMStats, sales_rollup
+from crm import analytics
 import re
 
 
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _batch_size(batch_size):
+    """The ``batchSize`` argument, or the default when it is not given."""
+    if batch_size is None:
+        return settings.CRM_BULK_CREATE_BATCH_SIZE
+    if batch_size < 1:
+        raise GraphQLError("batchSize must be at least 1")
+    return batch_size
+
+
 class CustomerType(DjangoObjectType):
     class Meta:
         model = Customer
         fields = '__all__'
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    def resolve_orders(self, info, **kwargs):
+        orders = prefetched(self, 'orders')
+        if orders is None:
+            orders = get_loaders(info).customer_orders.load(self.pk)
+        return orders
 
 
 class ProductType(DjangoObjectType):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('order_items',)
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    def resolve_orders(self, info, **kwargs):
+        orders = prefetched(self, 'orders')
+        if orders is None:
+            orders = get_loaders(info).product_orders.load(self.pk)
+        return orders
+
+
+class OrderItemType(DjangoObjectType):
+    unit_price = graphene.Decimal()
+    line_total = graphene.Decimal()
+
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'product', 'quantity', 'unit_price')
+
+    def resolve_product(self, info):
+        if OrderItem.product.is_cached(self):
+            return self.product
+        return get_loaders(info).product.load(self.product_id)
 
 
 class OrderType(DjangoObjectType):
     total_amount = graphene.Decimal()
+    items = graphene.List(graphene.NonNull(OrderItemType))
 
     class Meta:
         model = Order
         fields = '__all__'
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
 
-    def resolve_total_amount(self, info):
-        return self.calculate_total()
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        products = prefetched(self, 'products')
+        if products is None:
+            products = get_loaders(info).order_products.load(self.pk)
+        return products
+
+    def resolve_items(self, info):
+        items = prefetched(self, 'items')
+        if items is None:
+            items = get_loaders(info).order_items.load(self.pk)
+        return items
 
 
 class CreateCustomerInput(graphene.InputObjectType):
@@ -84,12 +148,15 @@ class BulkCreateCustomers(graphene.Mutation):
 
     class Arguments:
         input = graphene.List(BulkCreateCustomersInput, required=True)
+        batch_size = graphene.Int()
 
     @staticmethod
-    def mutate(root, info, input):
-        created_customers = []
-        errors = []
+    def mutate(root, info, input, batch_size=None):
+        batch_size = _batch_size(batch_size)
+        row_errors = []
+        valid_rows = []
 
+        # Validate every row in memory; uniqueness is checked below in bulk
         for i, customer_data in enumerate(input):
             try:
                 customer = Customer(
@@ -97,13 +164,53 @@ class BulkCreateCustomers(graphene.Mutation):
                     email=customer_data.email,
                     phone=customer_data.phone
                 )
-                customer.full_clean()
-                customer.save()
-                created_customers.append(customer)
+                customer.full_clean(validate_unique=False)
+                valid_rows.append((i, customer))
             except ValidationError as e:
-                errors.append(f"Row {i+1}: {str(e)}")
+                row_errors.append((i, str(e)))
             except Exception as e:
-                errors.append(f"Row {i+1}: {str(e)}")
+                row_errors.append((i, str(e)))
+
+        emails = [customer.email for _, customer in valid_rows]
+        existing_emails = set()
+        for chunk in _chunks(emails, batch_size):
+            existing_emails.update(Customer.objects.filter(
+                email__in=chunk).values_list('email', flat=True))
+
+        new_rows = []
+        for i, customer in valid_rows:
+            if customer.email in existing_emails:
+                error = ValidationError({'email': [customer.unique_error_message(
+                    Customer, ('email',))]})
+                row_errors.append((i, str(error)))
+                continue
+            existing_emails.add(customer.email)
+            new_rows.append((i, customer))
+
+        created_customers = []
+        with transaction.atomic():
+            for chunk in _chunks(new_rows, batch_size):
+                try:
+                    with transaction.atomic():
+                        Customer.objects.bulk_create(
+                            [customer for _, customer in chunk])
+                    created_customers.extend(customer for _, customer in chunk)
+                except IntegrityError:
+                    # A concurrent insert won the race for some email; retry
+                    # the chunk row by row so only the conflicting rows fail.
+                    for i, customer in chunk:
+                        customer.pk = None
+                        try:
+                            with transaction.atomic():
+                                customer.save()
+                            created_customers.append(customer)
+                        except Exception as e:
+                            row_errors.append((i, str(e)))
+
+        if created_customers:
+            invalidate_models(Customer)
+        errors = [f"Row {i+1}: {error}" for i, error in sorted(row_errors)]
+        get_loaders(info).prime(created_customers)
 
         return BulkCreateCustomers(
             customers=created_customers,
@@ -147,12 +254,29 @@ class CreateProduct(graphene.Mutation):
             raise GraphQLError(f"Error creating product: {str(e)}")
 
 
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.Int(required=True)
+    quantity = graphene.Int(default_value=1)
+
+
 class CreateOrderInput(graphene.InputObjectType):
     customer_id = graphene.Int(required=True)
-    product_ids = graphene.List(graphene.Int, required=True)
+    product_ids = graphene.List(graphene.Int)
+    items = graphene.List(OrderItemInput)
     order_date = graphene.DateTime()
 
 
+def _order_quantities(order_data):
+    """``{product_id: units}``: one of each of ``productIds``, plus ``items``."""
+    quantities = dict.fromkeys(order_data.product_ids or [], 1)
+    for item in order_data.items or []:
+        if item.quantity is None or item.quantity < 1:
+            raise ValueError(
+                f"Quantity for product {item.product_id} must be at least 1")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
 class CreateOrder(graphene.Mutation):
     order = graphene.Field(OrderType)
     message = graphene.String()
@@ -164,7 +288,11 @@ class CreateOrder(graphene.Mutation):
     @staticmethod
     def mutate(root, info, input):
         try:
-            if not input.product_ids:
+            try:
+                quantities = _order_quantities(input)
+            except ValueError as e:
+                raise GraphQLError(str(e))
+            if not quantities:
                 raise GraphQLError("At least one product must be selected")
 
             try:
@@ -173,99 +301,435 @@ class CreateOrder(graphene.Mutation):
                 raise GraphQLError(
                     f"Customer with ID {input.customer_id} not found")
 
-            products = Product.objects.filter(id__in=input.product_ids)
-            if len(products) != len(input.product_ids):
-                missing_ids = set(input.product_ids) - \
-                    set(p.id for p in products)
+            prices = dict(Product.objects.filter(
+                id__in=list(quantities)).values_list('id', 'price'))
+            missing_ids = set(quantities) - prices.keys()
+            if missing_ids:
                 raise GraphQLError(f"Invalid product IDs: {missing_ids}")
 
             with transaction.atomic():
+                # Fails fast, before anything is written, if any is sold out
+                Product.objects.reserve_stock(quantities)
                 order = Order.objects.create(
                     customer=customer,
-                    total_amount=0
+                    total_amount=sum(prices[product_id] * units
+                                     for product_id, units in quantities.items())
                 )
-                order.products.set(products)
-                order.total_amount = order.calculate_total()
-                order.save()
+                order.add_items(quantities, prices, totaled=True)
 
             return CreateOrder(
                 order=order,
                 message=f"Order created successfully with total: ${order.total_amount}",
                 success=True
             )
+        except InsufficientStock as e:
+            raise GraphQLError(str(e), extensions={
+                'code': 'INSUFFICIENT_STOCK', 'productIds': e.product_ids})
         except GraphQLError:
             raise
         except Exception as e:
             raise GraphQLError(f"Error creating order: {str(e)}")
 
 
+class BulkCreateOrders(graphene.Mutation):
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+    success = graphene.Boolean()
+
+    class Arguments:
+        input = graphene.List(CreateOrderInput, required=True)
+        batch_size = graphene.Int()
+
+    @staticmethod
+    def mutate(root, info, input, batch_size=None):
+        batch_size = _batch_size(batch_size)
+        row_errors = []
+
+        row_quantities = []
+        for i, order_data in enumerate(input):
+            try:
+                row_quantities.append(_order_quantities(order_data))
+            except ValueError as e:
+                row_errors.append((i, str(e)))
+                row_quantities.append(None)
+
+        customer_ids = {order_data.customer_id for order_data in input}
+        product_ids = {product_id for quantities in row_quantities
+                       for product_id in quantities or ()}
+        existing_customers = set()
+        for chunk in _chunks(list(customer_ids), batch_size):
+            existing_customers.update(Customer.objects.filter(
+                id__in=chunk).values_list('id', flat=True))
+        prices = {}
+        for chunk in _chunks(list(product_ids), batch_size):
+            prices.update(Product.objects.filter(
+                id__in=chunk).values_list('id', 'price'))
+
+        valid_rows = []
+        for i, (order_data, quantities) in enumerate(zip(input, row_quantities)):
+            if quantities is None:
+                continue
+            if not quantities:
+                row_errors.append((i, "At least one product must be selected"))
+                continue
+            if order_data.customer_id not in existing_customers:
+                row_errors.append(
+                    (i, f"Customer with ID {order_data.customer_id} not found"))
+                continue
+            missing_ids = set(quantities) - prices.keys()
+            if missing_ids:
+                row_errors.append((i, f"Invalid product IDs: {missing_ids}"))
+                continue
+            order = Order(
+                customer_id=order_data.customer_id,
+                total_amount=sum(prices[product_id] * units
+                                 for product_id, units in quantities.items())
+            )
+            valid_rows.append((i, order, quantities))
+
+        created_orders = []
+        try:
+            with transaction.atomic():
+                valid_rows = BulkCreateOrders.reserve_stock(valid_rows, row_errors)
+                for chunk in _chunks(valid_rows, batch_size):
+                    orders = Order.objects.bulk_create(
+                        [order for _, order, _ in chunk])
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order_id=order.pk, product_id=product_id,
+                                  quantity=units, unit_price=prices[product_id])
+                        for _, order, quantities in chunk
+                        for product_id, units in quantities.items()
+                    ], batch_size=batch_size)
+                    created_orders.extend(orders)
+                DailySalesRollup.objects.add_slices(DailySalesRollup.objects.slices(
+                    OrderItem.objects.filter(order__in=created_orders)))
+        except Exception as e:
+            raise GraphQLError(f"Error creating orders: {str(e)}")
+
+        if created_orders:
+            invalidate_models(Order, Product)
+        errors = [f"Row {i+1}: {error}" for i, error in sorted(row_errors)]
+        get_loaders(info).prime(created_orders)
+
+        return BulkCreateOrders(
+            orders=created_orders,
+            errors=errors,
+            success=len(errors) == 0
+        )
+
+    @staticmethod
+    def reserve_stock(rows, row_errors):
+        """
+        Reserve stock for every row in one statement. When products run
+        short, fill rows in input order from the stock that is left, report
+        the rest as errors and try again with the rows that fit.
+        """
+        while rows:
+            total = {}
+            for _, _, quantities in rows:
+                for product_id, units in quantities.items():
+                    total[product_id] = total.get(product_id, 0) + units
+            try:
+                Product.objects.reserve_stock(total)
+                return rows
+            except InsufficientStock as e:
+                available = dict(Product.objects.filter(
+                    pk__in=e.product_ids).values_list('pk', 'stock'))
+                fitting = []
+                for i, order, quantities in rows:
+                    short = sorted(
+                        product_id for product_id, units in quantities.items()
+                        if product_id in available and available[product_id] < units)
+                    if short:
+                        row_errors.append(
+                            (i, f"Insufficient stock for products: {short}"))
+                        continue
+                    for product_id, units in quantities.items():
+                        if product_id in available:
+                            available[product_id] -= units
+                    fitting.append((i, order, quantities))
+                rows = fitting
+        return rows
+
+
+class StatsGroupBy(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    CUSTOMER = 'customer'
+    PRODUCT = 'product'
+
+
+class StatsGroupType(graphene.ObjectType):
+    key = graphene.String()
+    label = graphene.String()
+    period_start = graphene.DateTime()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+
+
+class CRMStatsType(graphene.ObjectType):
+    # Models the response cache must watch, see crm.cache.document_models
+    cache_models = (Customer, Order, Product)
+
+    total_customers = graphene.Int()
+    active_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+    average_order_value = graphene.Decimal()
+    groups = graphene.List(StatsGroupType, first=graphene.Int())
+
+    def resolve_groups(self, info, first=None):
+        return self.groups(first=first)
+
+
+class SalesRollupGroupBy(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+    PRODUCT = 'product'
+    SEGMENT = 'segment'
+
+
+class CustomerSegment(graphene.Enum):
+    NEW = DailySalesRollup.SEGMENT_NEW
+    RETURNING = DailySalesRollup.SEGMENT_RETURNING
+
+
+class SalesRollupGroupType(graphene.ObjectType):
+    cache_models = (DailySalesRollup, Product)
+
+    key = graphene.String()
+    label = graphene.String()
+    date = graphene.Date()
+    order_count = graphene.Int()
+    units = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class RFMSegment(graphene.Enum):
+    CHAMPIONS = 'champions'
+    LOYAL = 'loyal'
+    PROMISING = 'promising'
+    AT_RISK = 'at_risk'
+    LOST = 'lost'
+    HIBERNATING = 'hibernating'
+    NEEDS_ATTENTION = 'needs_attention'
+
+
+class CustomerMetricsOrder(graphene.Enum):
+    LIFETIME_VALUE = 'lifetime_value'
+    MONETARY = 'monetary'
+    FREQUENCY = 'frequency'
+    RECENCY = 'recency'
+
+
+class CustomerMetricsType(graphene.ObjectType):
+    cache_models = (Customer, Order)
+
+    customer_id = graphene.Int()
+    customer = graphene.Field(CustomerType)
+    recency_days = graphene.Int()
+    frequency = graphene.Int()
+    monetary = graphene.Decimal()
+    average_order_value = graphene.Decimal()
+    lifetime_value = graphene.Decimal()
+    first_order_date = graphene.DateTime()
+    last_order_date = graphene.DateTime()
+    recency_score = graphene.Int()
+    frequency_score = graphene.Int()
+    monetary_score = graphene.Int()
+    rfm_score = graphene.String()
+    segment = RFMSegment()
+
+    def resolve_customer(self, info):
+        return get_loaders(info).customer.load(self['customer_id'])
+
+
+class ProductAffinityType(graphene.ObjectType):
+    cache_models = (Order, Product)
+
+    product_id = graphene.Int()
+    product = graphene.Field(ProductType)
+    other_product_id = graphene.Int()
+    other_product = graphene.Field(ProductType)
+    order_count = graphene.Int()
+    support = graphene.Float()
+    confidence = graphene.Float()
+    lift = graphene.Float()
+
+    def resolve_product(self, info):
+        return get_loaders(info).product.load(self['product_id'])
+
+    def resolve_other_product(self, info):
+        return get_loaders(info).product.load(self['other_product_id'])
+
+
 class Query(graphene.ObjectType):
     hello = graphene.String()
-    all_customers = DjangoFilterConnectionField(
+    all_customers = KeysetFilterConnectionField(
         CustomerType, filterset_class=CustomerFilter)
-    all_products = DjangoFilterConnectionField(
+    all_products = KeysetFilterConnectionField(
         ProductType, filterset_class=ProductFilter)
-    all_orders = DjangoFilterConnectionField(
+    all_orders = KeysetFilterConnectionField(
         OrderType, filterset_class=OrderFilter)
     customer = graphene.Field(CustomerType, id=graphene.Int(required=True))
     product = graphene.Field(ProductType, id=graphene.Int(required=True))
     order = graphene.Field(OrderType, id=graphene.Int(required=True))
+    crm_stats = graphene.Field(
+        CRMStatsType,
+        order_date_gte=graphene.DateTime(),
+        order_date_lte=graphene.DateTime(),
+        group_by=StatsGroupBy(),
+    )
+    sales_rollup = graphene.List(
+        SalesRollupGroupType,
+        date_from=graphene.Date(required=True),
+        date_to=graphene.Date(required=True),
+        group_by=SalesRollupGroupBy(),
+        product_id=graphene.Int(),
+        segment=CustomerSegment(),
+        first=graphene.Int(),
+    )
+    customer_metrics = graphene.List(
+        CustomerMetricsType,
+        order_date_gte=graphene.DateTime(),
+        order_date_lte=graphene.DateTime(),
+        customer_id=graphene.Int(),
+        segment=RFMSegment(),
+        order_by=CustomerMetricsOrder(),
+        first=graphene.Int(default_value=50),
+    )
+    product_affinity = graphene.List(
+        ProductAffinityType,
+        order_date_gte=graphene.DateTime(),
+        order_date_lte=graphene.DateTime(),
+        product_id=graphene.Int(),
+        min_orders=graphene.Int(default_value=2),
+        first=graphene.Int(default_value=20),
+    )
 
     def resolve_hello(self, info):
         return "Hello, GraphQL!"
 
     def resolve_customer(self, info, id):
         try:
-            return Customer.objects.get(id=id)
+            return optimize_queryset(Customer.objects.all(), info).get(id=id)
         except Customer.DoesNotExist:
             return None
 
     def resolve_product(self, info, id):
         try:
-            return Product.objects.get(id=id)
+            return optimize_queryset(Product.objects.all(), info).get(id=id)
         except Product.DoesNotExist:
             return None
 
     def resolve_order(self, info, id):
         try:
-            return Order.objects.get(id=id)
+            return optimize_queryset(Order.objects.all(), info).get(id=id)
         except Order.DoesNotExist:
             return None
 
+    def resolve_crm_stats(self, info, order_date_gte=None, order_date_lte=None,
+                          group_by=None):
+        return CRMStats(
+            date_from=order_date_gte,
+            date_to=order_date_lte,
+            group_by=getattr(group_by, 'value', group_by),
+        )
+
+    def resolve_sales_rollup(self, info, date_from, date_to, group_by=None,
+                             product_id=None, segment=None, first=None):
+        return sales_rollup(
+            date_from,
+            date_to,
+            group_by=getattr(group_by, 'value', group_by) or 'day',
+            product_id=product_id,
+            segment=getattr(segment, 'value', segment),
+            first=first,
+        )
+
+    def resolve_customer_metrics(self, info, order_date_gte=None, order_date_lte=None,
+                                 customer_id=None, segment=None, order_by=None,
+                                 first=50):
+        rows = analytics.customer_metrics(
+            date_from=order_date_gte,
+            date_to=order_date_lte,
+            customer_id=customer_id,
+            segment=getattr(segment, 'value', segment),
+            order_by=getattr(order_by, 'value', order_by) or 'lifetime_value',
+            first=first,
+        )
+        loader = get_loaders(info).customer
+        for row in rows:
+            loader.enqueue(row['customer_id'])
+        return rows
+
+    def resolve_product_affinity(self, info, order_date_gte=None, order_date_lte=None,
+                                 product_id=None, min_orders=2, first=20):
+        rows = analytics.product_affinity(
+            date_from=order_date_gte,
+            date_to=order_date_lte,
+            product_id=product_id,
+            min_orders=min_orders,
+            first=first,
+        )
+        loader = get_loaders(info).product
+        for row in rows:
+            loader.enqueue(row['product_id'])
+            loader.enqueue(row['other_product_id'])
+        return rows
+
 
 class UpdateLowStockProducts(graphene.Mutation):
-    updated_products = graphene.List(ProductType)
+    updated_products = graphene.List(
+        ProductType, first=graphene.Int(), offset=graphene.Int())
     updated_count = graphene.Int()
     message = graphene.String()
     success = graphene.Boolean()
 
+    class Arguments:
+        threshold = graphene.Int(default_value=10, required=False)
+        increment = graphene.Int(default_value=10, required=False)
+
     @staticmethod
-    def mutate(root, info):
+    def mutate(root, info, threshold=10, increment=10):
+        # An explicit null means the default too
+        threshold = 10 if threshold is None else threshold
+        increment = 10 if increment is None else increment
+        if threshold < 0:
+            raise GraphQLError("Threshold must not be negative")
+        if increment < 1:
+            raise GraphQLError("Increment must be a positive number")
         try:
-            low_stock_products = Product.objects.filter(stock__lt=10)
-            updated_products = []
-
-            for product in low_stock_products:
-                product.stock += 10
-                product.full_clean()
-                product.save()
-                updated_products.append(product)
+            updated_ids = Product.objects.filter(
+                stock__lt=threshold).increment_stock(increment)
 
-            message = f"Successfully updated {len(updated_products)} products with low stock"
+            message = f"Successfully updated {len(updated_ids)} products with low stock"
 
-            return UpdateLowStockProducts(
-                updated_products=updated_products,
-                updated_count=len(updated_products),
+            payload = UpdateLowStockProducts(
+                updated_count=len(updated_ids),
                 message=message,
                 success=True
             )
+            payload.updated_ids = updated_ids
+            return payload
         except Exception as e:
             raise GraphQLError(f"Error updating low stock products: {str(e)}")
 
+    def resolve_updated_products(self, info, first=None, offset=0):
+        """Load only the requested page of updated products."""
+        offset = offset or 0
+        page_ids = self.updated_ids[offset:]
+        if first is not None:
+            page_ids = page_ids[:first]
+        products = Product.objects.in_bulk(page_ids)
+        return [products[pk] for pk in page_ids if pk in products]
+
 
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
@@ -0,0 +1,157 @@
+"""
+Indexed substring search over customer and product names.
+
+``icontains`` compiles to ``LIKE '%term%'``, which no B-tree index can
+serve. The backends here answer the same question from an index instead:
+
+* SQLite: FTS5 tables with the ``trigram`` tokenizer, kept in sync with
+  ``crm_customer``/``crm_product`` by triggers (migration 0004), ranked
+  with ``bm25()``.
+* PostgreSQL: ``pg_trgm`` GIN indexes on ``UPPER(column)``, which serve
+  the ``UPPER(col) LIKE UPPER(%s)`` Django emits for ``icontains``,
+  ranked by trigram similarity.
+
+Every backend falls back to plain ``icontains`` for terms shorter than a
+trigram and when its index is missing.
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+from crm.models import Customer, Order, OrderItem, Product
+
+# Columns searched per model, most relevant first
+SEARCH_FIELDS = {
+    Customer: ('name', 'email'),
+    Product: ('name',),
+}
+
+MIN_TERM_LENGTH = 3
+
+
+def contains_filter(fields, term):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': term})
+    return condition
+
+
+class SearchBackend:
+    """
+    Unindexed fallback: ``icontains`` over the search fields.
+
+    Subclasses override ``match`` to narrow the queryset through an index
+    and annotate a ``search_rank`` where higher is more relevant.
+    """
+
+    def search(self, queryset, term):
+        """Rows of ``queryset`` matching ``term``, most relevant first."""
+        term = term.strip()
+        if not term:
+            return queryset
+        if queryset.model is Order:
+            return self.search_orders(queryset, term)
+
+        fields = SEARCH_FIELDS[queryset.model]
+        if len(term) < MIN_TERM_LENGTH or not self.available(queryset.model):
+            return queryset.filter(contains_filter(fields, term))
+        return self.match(queryset, fields, term).order_by(
+            '-search_rank', *queryset.model._meta.ordering)
+
+    def search_orders(self, queryset, term):
+        """Orders whose customer or any product matches ``term``."""
+        customers = self.search(Customer.objects.order_by(), term)
+        products = self.search(Product.objects.order_by(), term)
+        order_ids = OrderItem.objects.filter(
+            product__in=products.values('pk')).values('order_id')
+        return queryset.filter(
+            Q(customer__in=customers.values('pk')) | Q(pk__in=order_ids))
+
+    def available(self, model):
+        return False
+
+    def match(self, queryset, fields, term):
+        raise NotImplementedError
+
+
+class SQLiteFTS5SearchBackend(SearchBackend):
+    """FTS5 trigram tables named ``<table>_fts``, one row per source row."""
+
+    _available = None
+
+    @staticmethod
+    def fts_table(model):
+        return f'{model._meta.db_table}_fts'
+
+    def available(self, model):
+        if self._available is None:
+            connection = connections['default']
+            with connection.cursor() as cursor:
+                tables = set(connection.introspection.table_names(cursor))
+            SQLiteFTS5SearchBackend._available = {
+                model for model in SEARCH_FIELDS
+                if self.fts_table(model) in tables
+            }
+        return model in self._available
+
+    def match(self, queryset, fields, term):
+        fts = self.fts_table(queryset.model)
+        table = queryset.model._meta.db_table
+        # A quoted FTS5 string is a phrase of consecutive trigrams, i.e. a
+        # case-insensitive substring match.
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        # bm25() is lower for better matches
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [phrase]),
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({fts}) FROM {fts} '
+            f'WHERE {fts} MATCH %s AND {fts}.rowid = {table}.id',
+            [phrase],
+        ))
+
+
+class PostgresTrigramSearchBackend(SearchBackend):
+    """``icontains`` served by ``pg_trgm`` GIN indexes, ranked by similarity."""
+
+    def available(self, model):
+        return True
+
+    def match(self, queryset, fields, term):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        similarities = [TrigramWordSimilarity(term, field) for field in fields]
+        rank = similarities[0] if len(similarities) == 1 else Greatest(*similarities)
+        return queryset.filter(contains_filter(fields, term)).annotate(
+            search_rank=rank)
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTS5SearchBackend,
+    'postgresql': PostgresTrigramSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Instantiate ``CRM_SEARCH_BACKEND``, or the backend for the default
+    database vendor when it is unset.
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'CRM_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = BACKENDS.get(connections['default'].vendor, SearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+def search(queryset, term):
+    return get_search_backend().search(queryset, term)
@@ -24,4 +24,12 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'recalculate-order-totals': {
+        'task': 'crm.tasks.recalculate_order_totals',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'refresh-daily-sales-rollup': {
+        'task': 'crm.tasks.refresh_daily_sales_rollup',
+        'schedule': crontab(hour=3, minute=30),
+    },
 }
@@ -0,0 +1,146 @@
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from crm.cache import invalidate_models
+from crm.models import Customer, DailySalesRollup, Order, OrderItem, Product
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def update_order_totals_on_products_change(sender, instance, action, reverse, pk_set,
+                                           totaled=False, **kwargs):
+    """
+    Keep ``Order.total_amount`` in sync when products are added to or
+    removed from an order, from either side of the relation, unless
+    ``Order.add_items`` was told the total already includes the new lines.
+    """
+    if totaled:
+        return
+    if reverse and action == 'pre_clear':
+        instance._cleared_order_ids = list(
+            instance.orders.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        instance.total_amount = instance.calculate_total()
+        Order.objects.filter(pk=instance.pk).update(
+            total_amount=instance.total_amount)
+    elif action == 'post_clear':
+        Order.objects.filter(
+            pk__in=instance.__dict__.pop('_cleared_order_ids', [])
+        ).recalculate_totals()
+    else:
+        Order.objects.filter(pk__in=pk_set).recalculate_totals()
+
+
+@receiver(post_save, sender=OrderItem)
+def update_order_on_item_save(sender, instance, raw, **kwargs):
+    """Saving a single line, e.g. a new quantity, bypasses ``m2m_changed``."""
+    if raw:
+        return
+    Order.objects.filter(pk=instance.order_id).recalculate_totals()
+
+
+@receiver(pre_delete, sender=Product)
+def remember_orders_of_deleted_product(sender, instance, **kwargs):
+    instance._deleted_order_ids = list(
+        instance.orders.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def update_order_totals_on_product_delete(sender, instance, **kwargs):
+    """Deleting a product cascades its order rows without ``m2m_changed``."""
+    order_ids = instance.__dict__.pop('_deleted_order_ids', [])
+    if order_ids:
+        Order.objects.filter(pk__in=order_ids).recalculate_totals()
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_models(sender)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_cached_responses_on_products_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_models(Order, Product)
+
+
+def _line_slices(**filters):
+    return DailySalesRollup.objects.slices(OrderItem.objects.filter(**filters))
+
+
+def _changed_lines(instance, reverse, pk_set):
+    if reverse:
+        return _line_slices(product=instance, order_id__in=pk_set)
+    return _line_slices(order=instance, product_id__in=pk_set)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def update_daily_sales_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Add the lines added to an order to the rollup, and take removed ones out."""
+    if action == 'post_add':
+        DailySalesRollup.objects.add_slices(_changed_lines(instance, reverse, pk_set))
+    elif action == 'pre_remove':
+        instance._rollup_removed = _changed_lines(instance, reverse, pk_set)
+    elif action == 'pre_clear':
+        instance._rollup_removed = _line_slices(
+            **{'product' if reverse else 'order': instance})
+    elif action in ('post_remove', 'post_clear'):
+        DailySalesRollup.objects.add_slices(
+            instance.__dict__.pop('_rollup_removed', {}), sign=-1)
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_rollup_of_saved_item(sender, instance, raw, **kwargs):
+    if not raw:
+        instance._rollup_before = (
+            _line_slices(pk=instance.pk) if instance.pk is not None else {})
+
+
+@receiver(post_save, sender=OrderItem)
+def update_daily_sales_on_item_save(sender, instance, raw, **kwargs):
+    if not raw:
+        DailySalesRollup.objects.move_slices(
+            instance.__dict__.pop('_rollup_before', {}), _line_slices(pk=instance.pk))
+
+
+def _moves_order_lines(instance, raw, update_fields):
+    # Only the order's day and customer (new or returning) place its lines
+    return not raw and instance.pk is not None and (
+        update_fields is None or {'order_date', 'customer'} & set(update_fields)
+    )
+
+
+@receiver(pre_save, sender=Order)
+def remember_rollup_of_saved_order(sender, instance, raw, update_fields, **kwargs):
+    if _moves_order_lines(instance, raw, update_fields):
+        instance._rollup_before = _line_slices(order_id=instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_daily_sales_on_order_change(sender, instance, created, raw, update_fields, **kwargs):
+    # A new order has no lines yet; an edited one may have moved day or segment
+    before = instance.__dict__.pop('_rollup_before', None)
+    if not created and before is not None:
+        DailySalesRollup.objects.move_slices(before, _line_slices(order=instance))
+
+
+@receiver(pre_delete, sender=Order)
+def remember_lines_of_deleted_order(sender, instance, **kwargs):
+    instance._rollup_removed = _line_slices(order=instance)
+
+
+@receiver(post_delete, sender=Order)
+def update_daily_sales_on_order_delete(sender, instance, **kwargs):
+    """Deleting an order cascades its lines without ``m2m_changed``."""
+    DailySalesRollup.objects.add_slices(
+        instance.__dict__.pop('_rollup_removed', {}), sign=-1)
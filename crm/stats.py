@@ -0,0 +1,217 @@
+"""
+Database-side aggregates behind the ``crmStats`` and ``salesRollup``
+queries.
+
+Every figure is a single ``COUNT``/``SUM`` query over the stored
+``Order.total_amount`` (or the line totals of order items), so the report
+costs the same whatever the number of orders and revenue stays an exact
+``Decimal``.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+
+from crm.models import Customer, DailySalesRollup, Order, OrderItem, line_total
+
+GROUP_BY_PERIOD = {
+    'day': TruncDay,
+    'week': TruncWeek,
+}
+GROUP_BY_RELATED = ('customer', 'product')
+
+CENT = Decimal('0.01')
+ZERO = Value(Decimal('0'), output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def _revenue(field):
+    return Coalesce(Sum(field), ZERO)
+
+
+def _money(value):
+    # SQLite sums decimals as REAL; round back to the column's precision
+    return Decimal(value).quantize(CENT)
+
+
+class CRMStats:
+    """
+    Aggregates for the orders placed in an optional ``[date_from, date_to]``
+    window. Each figure is queried on first access only.
+    """
+
+    def __init__(self, date_from=None, date_to=None, group_by=None):
+        if group_by is not None and group_by not in GROUP_BY_PERIOD \
+                and group_by not in GROUP_BY_RELATED:
+            raise ValueError(f"Cannot group by {group_by!r}")
+        self.date_from = date_from
+        self.date_to = date_to
+        self.group_by = group_by
+        self._totals = None
+
+    def orders(self):
+        orders = Order.objects.order_by()
+        if self.date_from is not None:
+            orders = orders.filter(order_date__gte=self.date_from)
+        if self.date_to is not None:
+            orders = orders.filter(order_date__lte=self.date_to)
+        return orders
+
+    def totals(self):
+        if self._totals is None:
+            self._totals = self.orders().aggregate(
+                total_orders=Count('pk'),
+                total_revenue=_revenue('total_amount'),
+                active_customers=Count('customer', distinct=True),
+            )
+        return self._totals
+
+    @property
+    def total_customers(self):
+        return Customer.objects.count()
+
+    @property
+    def active_customers(self):
+        return self.totals()['active_customers']
+
+    @property
+    def total_orders(self):
+        return self.totals()['total_orders']
+
+    @property
+    def total_revenue(self):
+        return _money(self.totals()['total_revenue'])
+
+    @property
+    def average_order_value(self):
+        if not self.total_orders:
+            return None
+        return (self.total_revenue / self.total_orders).quantize(CENT)
+
+    def groups(self, first=None):
+        """
+        One row per period, customer or product: ``key``, ``label``,
+        ``total_orders`` and ``total_revenue``.
+
+        Periods come in chronological order, customers and products by
+        revenue, highest first.
+        """
+        if self.group_by is None:
+            return []
+        if self.group_by in GROUP_BY_PERIOD:
+            rows = self.orders().annotate(
+                period=GROUP_BY_PERIOD[self.group_by]('order_date'),
+            ).values('period').annotate(
+                total_orders=Count('pk'),
+                total_revenue=_revenue('total_amount'),
+            ).order_by('period')
+            rows = rows[:first] if first is not None else rows
+            return [
+                {
+                    'key': row['period'].date().isoformat(),
+                    'label': row['period'].date().isoformat(),
+                    'period_start': row['period'],
+                    'total_orders': row['total_orders'],
+                    'total_revenue': _money(row['total_revenue']),
+                }
+                for row in rows
+            ]
+
+        if self.group_by == 'customer':
+            rows = self.orders().values('customer_id', 'customer__name').annotate(
+                total_orders=Count('pk'),
+                total_revenue=_revenue('total_amount'),
+            )
+            key, label = 'customer_id', 'customer__name'
+        else:
+            # Product revenue is the product's line total on each order
+            rows = OrderItem.objects.filter(
+                order__in=self.orders().values('pk'),
+            ).values('product_id', 'product__name').annotate(
+                total_orders=Count('order_id', distinct=True),
+                total_revenue=_revenue(line_total()),
+            )
+            key, label = 'product_id', 'product__name'
+
+        rows = rows.order_by('-total_revenue', key)
+        rows = rows[:first] if first is not None else rows
+        return [
+            {
+                'key': str(row[key]),
+                'label': row[label],
+                'period_start': None,
+                'total_orders': row['total_orders'],
+                'total_revenue': _money(row['total_revenue']),
+            }
+            for row in rows
+        ]
+
+
+ROLLUP_GROUP_BY_PERIOD = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+ROLLUP_GROUP_BY_COLUMN = {
+    'product': ('product_id', 'product__name'),
+    'segment': ('segment', 'segment'),
+}
+
+
+def sales_rollup(date_from, date_to, group_by='day', product_id=None,
+                 segment=None, first=None):
+    """
+    Sales between ``date_from`` and ``date_to`` (inclusive) read from
+    ``DailySalesRollup`` and grouped by period, product or segment.
+
+    ``order_count`` counts each order once per product it contains;
+    ``units`` adds up the quantities.
+    """
+    rows = DailySalesRollup.objects.filter(
+        date__gte=date_from, date__lte=date_to).order_by()
+    if product_id is not None:
+        rows = rows.filter(product_id=product_id)
+    if segment is not None:
+        rows = rows.filter(segment=segment)
+
+    if group_by in ROLLUP_GROUP_BY_PERIOD:
+        trunc = ROLLUP_GROUP_BY_PERIOD[group_by]
+        period = F('date') if trunc is None else trunc('date')
+        rows = rows.annotate(period=period).values('period').annotate(
+            order_count=Sum('order_count'),
+            units=Sum('units'),
+            revenue=_revenue('revenue'),
+        ).order_by('period')
+        rows = rows[:first] if first is not None else rows
+        return [
+            {
+                'key': row['period'].isoformat(),
+                'label': row['period'].isoformat(),
+                'date': row['period'],
+                'order_count': row['order_count'],
+                'units': row['units'],
+                'revenue': _money(row['revenue']),
+            }
+            for row in rows
+        ]
+
+    if group_by not in ROLLUP_GROUP_BY_COLUMN:
+        raise ValueError(f"Cannot group by {group_by!r}")
+    key, label = ROLLUP_GROUP_BY_COLUMN[group_by]
+    rows = rows.values(*dict.fromkeys((key, label))).annotate(
+        order_count=Sum('order_count'),
+        units=Sum('units'),
+        revenue=_revenue('revenue'),
+    ).order_by('-revenue', key)
+    rows = rows[:first] if first is not None else rows
+    return [
+        {
+            'key': str(row[key]),
+            'label': row[label],
+            'date': None,
+            'order_count': row['order_count'],
+            'units': row['units'],
+            'revenue': _money(row['revenue']),
+        }
+        for row in rows
+    ]
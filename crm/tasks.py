@@ -1,9 +1,11 @@
 from celery import shared_task
 from django.utils import timezone
-from datetime import datetime
-import requests
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from datetime import date, timedelta
+from decimal import Decimal
+from gql import gql
+from crm import cleanup, reminders
+from crm.graphql_client import get_session
+from crm.models import DailySalesRollup, Order
 
 
 @shared_task
@@ -20,44 +22,25 @@ def generate_crm_report():
     timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
 
     try:
-        transport = RequestsHTTPTransport(url="http://localhost:8000/graphql")
-        client = Client(transport=transport, fetch_schema_from_transport=False)
+        session = get_session()
 
-        # GraphQL query to fetch report data
+        # Aggregated in the database; no order rows are transferred
         query = gql("""
             {
-                allCustomers {
-                    totalCount
-                }
-                allOrders {
-                    totalCount
-                    edges {
-                        node {
-                            totalAmount
-                        }
-                    }
+                crmStats {
+                    totalCustomers
+                    totalOrders
+                    totalRevenue
                 }
             }
         """)
 
-        result = client.execute(query)
-
-        # Extract data from the result
-        total_customers = result.get('allCustomers', {}).get('totalCount', 0)
-        orders_data = result.get('allOrders', {})
-        total_orders = orders_data.get('totalCount', 0)
-
-        # Calculate total revenue
-        total_revenue = 0
-        if orders_data.get('edges'):
-            for edge in orders_data['edges']:
-                node = edge.get('node', {})
-                total_amount = node.get('totalAmount', 0)
-                if total_amount:
-                    try:
-                        total_revenue += float(total_amount)
-                    except (ValueError, TypeError):
-                        pass
+        result = session.execute(query)
+
+        stats = result.get('crmStats') or {}
+        total_customers = stats.get('totalCustomers', 0)
+        total_orders = stats.get('totalOrders', 0)
+        total_revenue = Decimal(stats.get('totalRevenue') or '0')
 
         # Format the report message
         report_message = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, {total_revenue} revenue\n"
@@ -74,7 +57,7 @@ def generate_crm_report():
             'success': True,
             'customers': total_customers,
             'orders': total_orders,
-            'revenue': total_revenue
+            'revenue': str(total_revenue)
         }
 
     except Exception as e:
@@ -86,3 +69,121 @@ def generate_crm_report():
             print(f'Error writing to CRM report log: {str(write_error)}')
 
         return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def recalculate_order_totals(order_ids=None):
+    """
+    Recomputes the stored Order.total_amount from its items' quantities and
+    unit prices.
+
+    Repairs totals after writes that bypass model signals (queryset updates,
+    raw SQL, bulk imports). Runs as a single UPDATE with a DB-side SUM, so
+    no order or product rows are loaded into Python.
+
+    Logs the number of updated orders to /tmp/order_totals_log.txt.
+    """
+    timestamp = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    orders = Order.objects.all()
+    if order_ids is not None:
+        orders = orders.filter(pk__in=order_ids)
+    updated = orders.recalculate_totals()
+
+    try:
+        with open('/tmp/order_totals_log.txt', 'a') as log_file:
+            log_file.write(f"{timestamp} - Recalculated {updated} order totals\n")
+    except Exception as e:
+        print(f'Error writing to order totals log: {str(e)}')
+
+    return {'success': True, 'updated': updated}
+
+
+@shared_task
+def refresh_daily_sales_rollup(date_from=None, date_to=None, full=False, days_per_batch=7):
+    """
+    Rebuilds DailySalesRollup rows for the days between date_from and
+    date_to (ISO dates, inclusive).
+
+    Defaults to yesterday and today, which repairs anything the signal
+    handlers missed (bulk imports, raw SQL). With full=True the window
+    starts at the first order, which backfills an empty rollup table.
+    Each batch of days is rebuilt in its own transaction and re-running a
+    window is a no-op.
+
+    Logs the number of refreshed days and rows to /tmp/daily_sales_rollup_log.txt.
+    """
+    timestamp = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    today = timezone.localdate()
+
+    end = date.fromisoformat(date_to) if date_to else today
+    if date_from:
+        start = date.fromisoformat(date_from)
+    elif full:
+        first_order = Order.objects.order_by('order_date').values_list(
+            'order_date', flat=True).first()
+        start = timezone.localdate(first_order) if first_order else today
+    else:
+        start = today - timedelta(days=1)
+
+    rows = 0
+    day = start
+    while day <= end:
+        batch_end = min(day + timedelta(days=days_per_batch - 1), end)
+        rows += DailySalesRollup.objects.refresh(day, batch_end)
+        day = batch_end + timedelta(days=1)
+    days = max((end - start).days + 1, 0)
+
+    try:
+        with open('/tmp/daily_sales_rollup_log.txt', 'a') as log_file:
+            log_file.write(
+                f"{timestamp} - Refreshed {days} days ({start} to {end}), {rows} rollup rows\n")
+    except Exception as e:
+        print(f'Error writing to daily sales rollup log: {str(e)}')
+
+    return {'success': True, 'days': days, 'rows': rows}
+
+
+@shared_task
+def clean_inactive_customers(days=365, batch_size=500, sleep=0.1):
+    """
+    Deletes customers with no orders in the last `days` days in batches of
+    `batch_size`, resuming an interrupted run from its saved state.
+
+    Logs the number of deleted customers to /tmp/customer_cleanup_log.txt.
+    """
+    timestamp = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    deleted = cleanup.clean_inactive_customers(
+        days=days,
+        batch_size=batch_size,
+        sleep=sleep,
+        state_path='/tmp/customer_cleanup_state.json',
+        resume=True,
+    )
+
+    try:
+        with open('/tmp/customer_cleanup_log.txt', 'a') as log_file:
+            log_file.write(f"{timestamp} - Deleted {deleted} inactive customers\n")
+    except Exception as e:
+        print(f'Error writing to customer cleanup log: {str(e)}')
+
+    return {'success': True, 'deleted': deleted}
+
+
+@shared_task
+def send_order_reminders(days=7):
+    """
+    Sends one reminder per customer for the orders of the last `days` days
+    that have not been reminded yet, fanned out per CRM_REMINDER_DISPATCH.
+    """
+    customers, dispatched = reminders.send_order_reminders(days=days)
+    if isinstance(dispatched, int):
+        return {'success': True, 'customers': customers, 'delivered': dispatched}
+    return {'success': True, 'customers': customers, 'group': dispatched.id}
+
+
+@shared_task
+def send_order_reminder_batch(batch):
+    """Delivers one batch of reminders, rate limited per worker process."""
+    delivered = reminders.deliver(batch, limiter=reminders.get_process_limiter())
+    return {'success': True, 'delivered': delivered}
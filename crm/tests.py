@@ -1,3 +1,884 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from alx_backend_graphql.persisted_queries import query_hash
+from alx_backend_graphql.profiling import metrics_operation
+from crm.analytics import (
+    compute_co_purchases, compute_customer_metrics, product_affinity, quintile_scores,
+)
+from crm import cleanup, reminders
+from crm.filters import OrderFilter, ProductFilter
+from crm.importer import OrderImporter
+from crm.models import (
+    Customer, DailySalesRollup, InsufficientStock, Order, OrderItem, OrderReminder, Product,
+)
+from crm.search import search
+
+
+class ProductSearchIndexTests(TestCase):
+    """The search index must keep up with product writes after every migration."""
+
+    def test_new_product_is_found_by_search(self):
+        product = Product.objects.create(name='Zebra Lamp', price='19.99', stock=5)
+        self.assertEqual(list(search(Product.objects.all(), 'Zebra')), [product])
+
+    def test_renamed_product_is_found_by_search(self):
+        product = Product.objects.create(name='Plain Lamp', price='19.99', stock=5)
+        product.name = 'Zebra Lamp'
+        product.save()
+        self.assertEqual(list(search(Product.objects.all(), 'Zebra')), [product])
+        self.assertEqual(list(search(Product.objects.all(), 'Plain')), [])
+
+    def test_order_is_found_by_product_name(self):
+        customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        product = Product.objects.create(name='Zebra Lamp', price='19.99', stock=5)
+        order = Order.objects.create(customer=customer)
+        order.add_items({product.pk: 1})
+        self.assertEqual(list(search(Order.objects.all(), 'Zebra')), [order])
+
+
+class OrderListQueryCountTests(TestCase):
+    """A page of orders costs the same number of queries whatever its size."""
+
+    QUERY = """
+        query AllOrders($first: Int!) {
+            allOrders(first: $first) {
+                edges {
+                    node {
+                        id
+                        customer { name }
+                        products { edges { node { name } } }
+                        items { quantity unitPrice product { name } }
+                    }
+                }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        customers = Customer.objects.bulk_create(
+            Customer(name=f'Customer {i}', email=f'customer{i}@example.com')
+            for i in range(10))
+        products = Product.objects.bulk_create(
+            Product(name=f'Product {i}', price='9.99', stock=100) for i in range(5))
+        for i in range(60):
+            order = Order.objects.create(customer=customers[i % len(customers)])
+            order.add_items({products[i % 5].pk: 1, products[(i + 1) % 5].pk: 2})
+
+    def query_orders(self, first):
+        response = self.client.post(
+            '/graphql/', {'query': self.QUERY, 'variables': {'first': first}},
+            content_type='application/json')
+        payload = response.json()
+        self.assertNotIn('errors', payload)
+        return payload['data']['allOrders']['edges']
+
+    def test_queries_per_page_do_not_grow_with_page_size(self):
+        for first in (5, 50):
+            with self.subTest(first=first), self.assertNumQueries(4):
+                edges = self.query_orders(first)
+            self.assertEqual(len(edges), first)
+            self.assertEqual(len(edges[0]['node']['items']), 2)
+
+
+class FilterIndexPlanTests(TestCase):
+    """
+    The list filters must keep using their indexes; a migration that drops
+    or reshapes one fails here instead of turning the query into a scan.
+    """
+
+    def plan(self, filterset_class, data, ordered=False):
+        queryset = filterset_class._meta.model.objects.all()
+        # Unordered, like index_advisor --explain, so the plan shows the
+        # filter's own index rather than the one serving the default order
+        if not ordered:
+            queryset = queryset.order_by()
+        filterset = filterset_class(data, queryset=queryset)
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        return filterset.qs.explain()
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn(index, plan, f"Plan does not use {index}:\n{plan}")
+
+    def test_order_total_range_uses_total_index(self):
+        plan = self.plan(OrderFilter, {'total_amount_gte': '10', 'total_amount_lte': '20'})
+        self.assertUsesIndex(plan, 'crm_order_total_idx')
+
+    def test_order_date_range_uses_date_id_index(self):
+        plan = self.plan(OrderFilter, {
+            'order_date_gte': '2024-01-01T00:00:00Z',
+            'order_date_lte': '2024-02-01T00:00:00Z',
+        }, ordered=True)
+        self.assertUsesIndex(plan, 'crm_order_date_id_idx')
+        # Ordering by (-order_date, -id) comes from the index, not a sort
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_product_stock_threshold_uses_stock_index(self):
+        for data in ({'stock_lte': '5'}, {'stock_gte': '100'}, {'low_stock': 'true'}):
+            with self.subTest(data=data):
+                plan = self.plan(ProductFilter, data)
+                self.assertUsesIndex(plan, 'crm_product_stock_idx')
+
+
+class GraphQLTestMixin:
+    def execute(self, query, variables=None):
+        response = self.client.post(
+            '/graphql/', {'query': query, 'variables': variables or {}},
+            content_type='application/json')
+        return response.json()
+
+    def assertGraphQLError(self, payload, message):
+        self.assertIn('errors', payload)
+        self.assertEqual(payload['errors'][0]['message'], message)
+
+
+class BulkCreateCustomersTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+        mutation($input: [BulkCreateCustomersInput]!, $batchSize: Int) {
+            bulkCreateCustomers(input: $input, batchSize: $batchSize) {
+                success
+                errors
+                customers { email }
+            }
+        }
+    """
+    ROWS = [{'name': 'Ann', 'email': 'ann@example.com'},
+            {'name': 'Bob', 'email': 'bob@example.com'}]
+
+    def test_rejects_batch_size_below_one(self):
+        for batch_size in (0, -1):
+            with self.subTest(batch_size=batch_size):
+                payload = self.execute(
+                    self.MUTATION, {'input': self.ROWS, 'batchSize': batch_size})
+                self.assertGraphQLError(payload, "batchSize must be at least 1")
+        self.assertFalse(Customer.objects.exists())
+
+    def test_batch_size_defaults_when_omitted(self):
+        payload = self.execute(self.MUTATION, {'input': self.ROWS})
+        self.assertTrue(payload['data']['bulkCreateCustomers']['success'])
+        self.assertEqual(Customer.objects.count(), 2)
+
+
+class BulkCreateOrdersTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+        mutation($input: [CreateOrderInput]!, $batchSize: Int) {
+            bulkCreateOrders(input: $input, batchSize: $batchSize) {
+                success
+                errors
+                orders { totalAmount }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        cls.product = Product.objects.create(name='Lamp', price='10.00', stock=10)
+
+    def rows(self):
+        return [{'customerId': self.customer.pk, 'productIds': [self.product.pk]}] * 2
+
+    def test_rejects_batch_size_below_one(self):
+        for batch_size in (0, -1):
+            with self.subTest(batch_size=batch_size):
+                payload = self.execute(
+                    self.MUTATION, {'input': self.rows(), 'batchSize': batch_size})
+                self.assertGraphQLError(payload, "batchSize must be at least 1")
+        self.assertFalse(Order.objects.exists())
+
+    def test_batch_size_of_one(self):
+        payload = self.execute(self.MUTATION, {'input': self.rows(), 'batchSize': 1})
+        self.assertTrue(payload['data']['bulkCreateOrders']['success'])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class DailySalesRollupTests(TestCase):
+    """Order writes keep the rollup equal to a full rebuild from the lines."""
+
+    def rollup(self):
+        return sorted(DailySalesRollup.objects.values_list(
+            'date', 'product_id', 'segment', 'order_count', 'units', 'revenue'))
+
+    def assertRollupMatchesRefresh(self):
+        maintained = self.rollup()
+        DailySalesRollup.objects.refresh()
+        self.assertEqual(maintained, self.rollup())
+
+    def test_order_writes_keep_rollup_in_step(self):
+        ann = Customer.objects.create(name='Ann', email='ann@example.com')
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        Customer.objects.filter(pk=bob.pk).update(
+            created_at=timezone.now() - timedelta(days=365))
+        lamp = Product.objects.create(name='Lamp', price='10.00', stock=50)
+        desk = Product.objects.create(name='Desk', price='99.50', stock=50)
+
+        first = Order.objects.create(customer=ann)
+        first.add_items({lamp.pk: 2, desk.pk: 1})
+        second = Order.objects.create(customer=bob)
+        second.add_items({lamp.pk: 3})
+        self.assertRollupMatchesRefresh()
+        self.assertEqual(
+            DailySalesRollup.objects.filter(product=lamp).aggregate(
+                units=Sum('units'))['units'], 5)
+
+        item = first.items.get(product=lamp)
+        item.quantity = 4
+        item.save()
+        self.assertRollupMatchesRefresh()
+
+        first.order_date -= timedelta(days=3)
+        first.save()
+        second.customer = ann
+        second.save()
+        self.assertRollupMatchesRefresh()
+
+        first.products.remove(desk)
+        lamp.orders.remove(second)
+        self.assertRollupMatchesRefresh()
+
+        second.add_items({desk.pk: 2})
+        first.delete()
+        self.assertRollupMatchesRefresh()
+        second.products.clear()
+        self.assertEqual(self.rollup(), [])
+
+    def drifted_orders(self):
+        """
+        Two orders of a lamp, the second written with ``bulk_create`` so
+        the rollup only counts the first: one order, one unit.
+        """
+        customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        lamp = Product.objects.create(name='Lamp', price='10.00', stock=50)
+        counted = Order.objects.create(customer=customer)
+        counted.add_items({lamp.pk: 1})
+        uncounted = Order.objects.create(customer=customer)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=uncounted, product=lamp, quantity=3, unit_price='10.00')])
+        self.assertEqual(
+            list(DailySalesRollup.objects.values_list('order_count', 'units')), [(1, 1)])
+        return counted, uncounted
+
+    def test_deleting_orders_with_a_drifted_rollup(self):
+        counted, uncounted = self.drifted_orders()
+        uncounted.delete()
+        counted.delete()
+        self.assertFalse(Order.objects.exists())
+        self.assertRollupMatchesRefresh()
+
+    def test_removing_items_with_a_drifted_rollup(self):
+        counted, uncounted = self.drifted_orders()
+        item = uncounted.items.get()
+        item.quantity = 1
+        item.save()
+        uncounted.products.clear()
+        counted.items.get().product.orders.remove(counted)
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertRollupMatchesRefresh()
+
+    def test_batch_size_of_one(self):
+        payload = self.execute(self.MUTATION, {'input': self.rows(), 'batchSize': 1})
+        self.assertTrue(payload['data']['bulkCreateOrders']['success'])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class DailySalesRollupTests(TestCase):
+    """Order writes keep the rollup equal to a full rebuild from the lines."""
+
+    def rollup(self):
+        return sorted(DailySalesRollup.objects.values_list(
+            'date', 'product_id', 'segment', 'order_count', 'units', 'revenue'))
+
+    def assertRollupMatchesRefresh(self):
+        maintained = self.rollup()
+        DailySalesRollup.objects.refresh()
+        self.assertEqual(maintained, self.rollup())
+
+    def test_order_writes_keep_rollup_in_step(self):
+        ann = Customer.objects.create(name='Ann', email='ann@example.com')
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        Customer.objects.filter(pk=bob.pk).update(
+            created_at=timezone.now() - timedelta(days=365))
+        lamp = Product.objects.create(name='Lamp', price='10.00', stock=50)
+        desk = Product.objects.create(name='Desk', price='99.50', stock=50)
+
+        first = Order.objects.create(customer=ann)
+        first.add_items({lamp.pk: 2, desk.pk: 1})
+        second = Order.objects.create(customer=bob)
+        second.add_items({lamp.pk: 3})
+        self.assertRollupMatchesRefresh()
+        self.assertEqual(
+            DailySalesRollup.objects.filter(product=lamp).aggregate(
+                units=Sum('units'))['units'], 5)
+
+        item = first.items.get(product=lamp)
+        item.quantity = 4
+        item.save()
+        self.assertRollupMatchesRefresh()
+
+        first.order_date -= timedelta(days=3)
+        first.save()
+        second.customer = ann
+        second.save()
+        self.assertRollupMatchesRefresh()
+
+        first.products.remove(desk)
+        lamp.orders.remove(second)
+        self.assertRollupMatchesRefresh()
+
+        second.add_items({desk.pk: 2})
+        first.delete()
+        self.assertRollupMatchesRefresh()
+        second.products.clear()
+        self.assertEqual(self.rollup(), [])
+
+    def drifted_order(self):
+        """An order whose second line was written without signals."""
+        customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        self.lamp = Product.objects.create(name='Lamp', price='10.00', stock=50)
+        self.desk = Product.objects.create(name='Desk', price='99.50', stock=50)
+        order = Order.objects.create(customer=customer)
+        order.add_items({self.lamp.pk: 1})
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.lamp, quantity=3, unit_price='10.00')
+            for order in [Order.objects.create(customer=customer)]
+        ] + [OrderItem(order=order, product=self.desk, quantity=2, unit_price='99.50')])
+        return order
+
+    def test_deleting_an_order_with_a_drifted_rollup(self):
+        order = self.drifted_order()
+        Order.objects.exclude(pk=order.pk).get().delete()
+        order.delete()
+        self.assertEqual(self.rollup(), [])
+        self.assertFalse(Order.objects.exists())
+
+
+class MetricsOperationLabelTests(TestCase):
+    @override_settings(GRAPHQL_METRICS_OPERATIONS={'AllOrders'})
+    def test_only_listed_operations_are_labelled_by_name(self):
+        self.assertEqual(metrics_operation('AllOrders'), 'AllOrders')
+        self.assertEqual(metrics_operation('Random123'), 'other')
+        self.assertEqual(metrics_operation(None), 'anonymous')
+
+
+class KeysetCursorTests(GraphQLTestMixin, TestCase):
+    QUERY = """
+        query($after: String) {
+            allOrders(first: 5, after: $after) { edges { node { id } } }
+        }
+    """
+
+    def test_malformed_cursor_is_rejected(self):
+        for raw in ('keyset:not json', 'keyset:{"a": 1}', 'keyset:[1]',
+                    'keyset:["not a date", 1]', 'keyset:[null, [1]]'):
+            with self.subTest(raw=raw):
+                cursor = base64.b64encode(raw.encode()).decode()
+                payload = self.execute(self.QUERY, {'after': cursor})
+                self.assertGraphQLError(payload, "Invalid cursor")
+
+
+class UpdateLowStockProductsTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+        mutation($threshold: Int, $increment: Int) {
+            updateLowStockProducts(threshold: $threshold, increment: $increment) {
+                updatedCount
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.low = Product.objects.create(name='Low', price='1.00', stock=3)
+        cls.high = Product.objects.create(name='High', price='1.00', stock=30)
+
+    def test_null_arguments_use_defaults(self):
+        payload = self.execute(self.MUTATION, {'threshold': None, 'increment': None})
+        self.assertEqual(payload['data']['updateLowStockProducts']['updatedCount'], 1)
+        self.low.refresh_from_db()
+        self.assertEqual(self.low.stock, 13)
+
+    def test_rejects_negative_arguments(self):
+        payload = self.execute(self.MUTATION, {'threshold': -1})
+        self.assertGraphQLError(payload, "Threshold must not be negative")
+        payload = self.execute(self.MUTATION, {'increment': -5})
+        self.assertGraphQLError(payload, "Increment must be a positive number")
+        self.low.refresh_from_db()
+        self.assertEqual(self.low.stock, 3)
+
+    def test_returns_the_updated_products_in_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            ids = Product.objects.filter(stock__lt=10).increment_stock(5)
+        self.assertEqual(ids, [self.low.pk])
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertIn('RETURNING', queries.captured_queries[0]['sql'])
+        before = self.low.updated_at
+        self.low.refresh_from_db()
+        self.high.refresh_from_db()
+        self.assertEqual((self.low.stock, self.high.stock), (8, 30))
+        self.assertGreater(self.low.updated_at, before)
+
+
+class OrderImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        cls.lamp = Product.objects.create(name='Lamp', price='10.00', stock=10)
+        cls.desk = Product.objects.create(name='Desk', price='99.00', stock=10)
+
+    def import_orders(self, rows):
+        importer = OrderImporter()
+        result = importer.import_batch(list(enumerate(rows, start=2)))
+        self.assertEqual(result.errors, [])
+        return result
+
+    def test_reimporting_an_export_updates_the_orders(self):
+        order = Order.objects.create(customer=self.customer)
+        order.add_items({self.lamp.pk: 2})
+        row = {'id': str(order.pk), 'customer_id': str(self.customer.pk),
+               'order_date': order.order_date.isoformat(),
+               'product_ids': f'{self.desk.pk}', 'quantities': '3'}
+        self.import_orders([row])
+        self.import_orders([row])
+
+        self.assertEqual(Order.objects.count(), 1)
+        order.refresh_from_db()
+        self.assertEqual(
+            list(order.items.values_list('product_id', 'quantity')), [(self.desk.pk, 3)])
+        self.assertEqual(order.total_amount, Decimal('297.00'))
+
+    def test_command_rejects_batch_size_below_one(self):
+        for batch_size in ('0', '-1'):
+            with self.subTest(batch_size=batch_size), \
+                    self.assertRaisesMessage(CommandError, "--batch-size must be at least 1"):
+                call_command('import_crm', 'orders', 'orders.csv', '--batch-size', batch_size)
+
+    def test_rows_without_id_create_orders(self):
+        row = {'customer_id': str(self.customer.pk), 'product_ids': str(self.lamp.pk)}
+        self.import_orders([row, row])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class ExportFilterTests(TestCase):
+    def test_command_rejects_unknown_filters(self):
+        with self.assertRaisesMessage(CommandError, "Unknown filters order_dat_gte"):
+            call_command('export_crm', 'orders', '--filter', 'order_dat_gte=2024-01-01',
+                         stdout=io.StringIO())
+
+    def test_view_rejects_unknown_filters(self):
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/export/orders.csv', {'order_dat_gte': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Unknown filters order_dat_gte', response.content)
+
+    def test_view_accepts_known_filters(self):
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/export/orders.csv', {'total_amount_gte': '10'})
+        self.assertEqual(response.status_code, 200)
+
+
+class CreateOrderTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+        mutation($customerId: Int!, $items: [OrderItemInput]!) {
+            createOrder(input: {customerId: $customerId, items: $items}) {
+                order { totalAmount }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        cls.lamp = Product.objects.create(name='Lamp', price='10.00', stock=10)
+
+    def test_total_is_not_recomputed_after_adding_the_lines(self):
+        variables = {'customerId': self.customer.pk,
+                     'items': [{'productId': self.lamp.pk, 'quantity': 3}]}
+        with CaptureQueriesContext(connection) as queries:
+            payload = self.execute(self.MUTATION, variables)
+        self.assertEqual(payload['data']['createOrder']['order']['totalAmount'], '30.00')
+        self.assertEqual(Order.objects.get().total_amount, Decimal('30.00'))
+        total_updates = [query['sql'] for query in queries.captured_queries
+                         if query['sql'].startswith('UPDATE "crm_order"')]
+        self.assertEqual(total_updates, [])
+
+    def test_adding_lines_to_an_existing_order_updates_its_total(self):
+        order = Order.objects.create(customer=self.customer)
+        order.add_items({self.lamp.pk: 2})
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('20.00'))
+
+
+class QuintileScoreTests(TestCase):
+    def scores(self, values):
+        return quintile_scores(np.array(values)).tolist()
+
+    def test_ties_share_the_highest_score(self):
+        self.assertEqual(self.scores([3, 3, 3, 3, 3]), [5, 5, 5, 5, 5])
+        self.assertEqual(self.scores([1, 2, 2, 3, 4, 5, 6, 7, 8, 9]),
+                         [1, 2, 2, 2, 3, 3, 4, 4, 5, 5])
+
+    def test_fewer_values_than_quintiles(self):
+        self.assertEqual(self.scores([]), [])
+        self.assertEqual(self.scores([7]), [5])
+        self.assertEqual(self.scores([1, 2]), [1, 5])
+        self.assertEqual(self.scores([1, 2, 3]), [1, 3, 5])
+
+    def test_single_recent_customer_is_not_lost(self):
+        customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        Order.objects.create(customer=customer, total_amount='10.00')
+        metrics = compute_customer_metrics()
+        self.assertEqual(metrics['recency_score'].tolist(), [5])
+        self.assertEqual(metrics['segment'].tolist(), ['champions'])
+
+
+class CustomerMetricsTests(TestCase):
+    def place_order(self, customer, total, days_ago):
+        order = Order.objects.create(customer=customer, total_amount=total)
+        Order.objects.filter(pk=order.pk).update(
+            order_date=self.as_of - timedelta(days=days_ago))
+
+    def test_rfm_with_ties(self):
+        self.as_of = timezone.now()
+        ann, bob, cid = Customer.objects.bulk_create(
+            Customer(name=name, email=f'{name}@example.com') for name in ('ann', 'bob', 'cid'))
+        for total, days_ago in (('10.00', 0), ('20.00', 1), ('30.00', 2)):
+            self.place_order(ann, total, days_ago)
+        self.place_order(bob, '5.00', 10)
+        self.place_order(cid, '5.00', 10)
+
+        metrics = compute_customer_metrics(as_of=self.as_of)
+        self.assertEqual(metrics['customer_id'].tolist(), [ann.pk, bob.pk, cid.pk])
+        self.assertEqual(metrics['recency_days'].tolist(), [0, 10, 10])
+        self.assertEqual(metrics['frequency'].tolist(), [3, 1, 1])
+        self.assertEqual(metrics['monetary_cents'].tolist(), [6000, 500, 500])
+        self.assertEqual(metrics['average_order_cents'].tolist(), [2000, 500, 500])
+        # Tenure under 30 days counts as 30: 3 orders per 30 days, for 3 years
+        self.assertEqual(metrics['lifetime_value_cents'][0], round(2000 * 3 * 365 / 30 * 3))
+        # Bob and Cid tie on every measure and share their scores
+        for name in ('recency_score', 'frequency_score', 'monetary_score'):
+            self.assertEqual(metrics[name].tolist(), [5, 3, 3], name)
+        self.assertEqual(metrics['segment'].tolist(), ['champions', 'loyal', 'loyal'])
+
+    def test_monetary_sums_are_exact_cents(self):
+        customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        Order.objects.bulk_create([
+            Order(customer=customer, total_amount=amount)
+            for amount in ('99999999.99', '0.10', '0.20')])
+        metrics = compute_customer_metrics()
+        self.assertEqual(metrics['monetary_cents'].dtype, np.int64)
+        self.assertEqual(metrics['monetary_cents'].tolist(), [10000000029])
+
+
+class CoPurchaseTests(TestCase):
+    def test_pair_counts(self):
+        customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        a, b, c = Product.objects.bulk_create(
+            Product(name=name, price='1.00', stock=10) for name in 'abc')
+        for products in ((a, b, c), (a, b), (c,), (b,)):
+            Order.objects.create(customer=customer).add_items(
+                {product.pk: 1 for product in products})
+
+        stats = compute_co_purchases()
+        self.assertEqual(stats['total_orders'], 4)
+        self.assertEqual(stats['product_ids'].tolist(), [a.pk, b.pk, c.pk])
+        self.assertEqual(stats['product_orders'].tolist(), [2, 3, 2])
+        ids = stats['product_ids']
+        pairs = {(ids[low], ids[high]): count for low, high, count in zip(
+            stats['pair_low'], stats['pair_high'], stats['pair_orders'])}
+        # The single-product order contributes no pair
+        self.assertEqual(pairs, {(a.pk, b.pk): 2, (a.pk, c.pk): 1, (b.pk, c.pk): 1})
+
+        affinity = product_affinity(product_id=c.pk, first=None)
+        self.assertEqual(
+            [(row['other_product_id'], row['order_count']) for row in affinity],
+            [(a.pk, 1), (b.pk, 1)])
+        # Half of c's orders contain a, which is in half of all orders
+        self.assertAlmostEqual(affinity[0]['confidence'], 0.5)
+        self.assertAlmostEqual(affinity[0]['lift'], 1.0)
+        self.assertAlmostEqual(affinity[1]['lift'], 0.5 / 0.75)
+
+
+class CleanInactiveCustomersTests(TestCase):
+    def setUp(self):
+        self.long_ago = timezone.now() - timedelta(days=400)
+        self.lamp = Product.objects.create(name='Lamp', price='10.00', stock=100)
+
+    def customer(self, name, created=None):
+        customer = Customer.objects.create(name=name, email=f'{name}@example.com')
+        if created is not None:
+            Customer.objects.filter(pk=customer.pk).update(created_at=created)
+        return customer
+
+    def order(self, customer, placed=None):
+        order = Order.objects.create(customer=customer)
+        order.add_items({self.lamp.pk: 2})
+        if placed is not None:
+            order.order_date = placed
+            order.save()
+        return order
+
+    def test_only_customers_without_recent_orders_are_deleted(self):
+        lapsed = self.customer('lapsed', self.long_ago)
+        self.order(lapsed, self.long_ago)
+        active = self.customer('active', self.long_ago)
+        self.order(active, self.long_ago)
+        self.order(active)
+        self.customer('newcomer')
+        silent = self.customer('silent', self.long_ago)
+
+        deleted = cleanup.clean_inactive_customers(days=365, batch_size=1)
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(sorted(Customer.objects.values_list('name', flat=True)),
+                         ['active', 'newcomer'])
+        self.assertFalse(Order.objects.filter(customer_id__in=[lapsed.pk, silent.pk]).exists())
+        # Only the active customer's two orders keep their lines
+        self.assertEqual(OrderItem.objects.count(), 2)
+        maintained = sorted(DailySalesRollup.objects.values_list(
+            'date', 'product_id', 'segment', 'order_count', 'units', 'revenue'))
+        DailySalesRollup.objects.refresh()
+        self.assertEqual(maintained, sorted(DailySalesRollup.objects.values_list(
+            'date', 'product_id', 'segment', 'order_count', 'units', 'revenue')))
+
+    def test_resume_continues_after_the_saved_customer(self):
+        first = self.customer('first', self.long_ago)
+        for name in ('second', 'third'):
+            self.customer(name, self.long_ago)
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, 'cleanup.json')
+            cutoff = timezone.now() - timedelta(days=365)
+            cleanup.CleanupState(state_path, cutoff, last_pk=first.pk, deleted=1).save()
+
+            deleted = cleanup.clean_inactive_customers(state_path=state_path, resume=True)
+
+            self.assertEqual(deleted, 3)
+            self.assertFalse(os.path.exists(state_path))
+        # The saved cursor is past the first customer, so it is left alone
+        self.assertEqual(list(Customer.objects.all()), [first])
+
+
+class QueryCostTests(GraphQLTestMixin, TestCase):
+    # 1 for allCustomers, plus 1 per node on a page of 5
+    QUERY = "{ allCustomers(first: 5) { edges { node { name } } } }"
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def assertErrorCode(self, payload, code):
+        self.assertIsNone(payload.get('data'))
+        self.assertEqual(payload['errors'][0]['extensions']['code'], code)
+
+    def test_accepted_query_reports_its_cost(self):
+        payload = self.execute(self.QUERY)
+        self.assertNotIn('errors', payload)
+        self.assertEqual(payload['extensions']['cost'],
+                         {'requested': 6, 'maximum': settings.GRAPHQL_MAX_QUERY_COST})
+
+    @override_settings(GRAPHQL_MAX_QUERY_DEPTH=4)
+    def test_rejects_query_over_the_depth_limit(self):
+        # allOrders > edges > node > customer > name
+        payload = self.execute(
+            "{ allOrders(first: 1) { edges { node { customer { name } } } } }")
+        self.assertErrorCode(payload, 'QUERY_TOO_DEEP')
+        self.assertEqual(payload['errors'][0]['extensions']['depth'], 5)
+
+    @override_settings(GRAPHQL_MAX_QUERY_COST=5)
+    def test_rejects_query_over_the_cost_limit(self):
+        payload = self.execute(self.QUERY)
+        self.assertErrorCode(payload, 'QUERY_TOO_COSTLY')
+        self.assertEqual(payload['errors'][0]['extensions']['cost'], 6)
+
+    @override_settings(GRAPHQL_QUERY_COST_BUDGET=10)
+    def test_rejects_query_over_the_client_budget(self):
+        payload = self.execute(self.QUERY)
+        self.assertEqual(payload['extensions']['cost']['budgetRemaining'], 4)
+        payload = self.execute(self.QUERY)
+        self.assertErrorCode(payload, 'QUERY_COST_BUDGET_EXCEEDED')
+        self.assertGreaterEqual(payload['errors'][0]['extensions']['retryAfter'], 1)
+
+
+class PersistedQueryTests(GraphQLTestMixin, TestCase):
+    def persisted(self, sha256_hash, query=None):
+        body = {'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}}}
+        if query is not None:
+            body['query'] = query
+        response = self.client.post('/graphql/', body, content_type='application/json')
+        return response.json()
+
+    def test_unknown_hash_is_not_found(self):
+        payload = self.persisted(query_hash('{ unknownPersistedQuery: allProducts { totalCount } }'))
+        self.assertGraphQLError(payload, 'PersistedQueryNotFound')
+        self.assertEqual(payload['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+    def test_mismatched_hash_is_rejected(self):
+        query = '{ mismatched: allProducts { totalCount } }'
+        payload = self.persisted(query_hash(query + ' '), query)
+        self.assertGraphQLError(payload, 'provided sha does not match query')
+        # Nothing was registered under either hash
+        payload = self.persisted(query_hash(query + ' '))
+        self.assertGraphQLError(payload, 'PersistedQueryNotFound')
+
+    def test_registered_query_runs_by_hash(self):
+        Product.objects.create(name='Lamp', price='10.00', stock=5)
+        query = '{ registered: allProducts { totalCount } }'
+        sha256_hash = query_hash(query)
+        self.assertEqual(self.persisted(sha256_hash, query)['data'],
+                         {'registered': {'totalCount': 1}})
+
+        self.assertEqual(self.persisted(sha256_hash)['data'],
+                         {'registered': {'totalCount': 1}})
+        response = self.client.get('/graphql/', {'extensions': json.dumps(
+            {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}})},
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['data'], {'registered': {'totalCount': 1}})
+
+
+@override_settings(GRAPHQL_RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(GraphQLTestMixin, TestCase):
+    QUERY = "{ cachedProducts: allProducts(first: 10) { edges { node { name stock } } } }"
+
+    def setUp(self):
+        caches[settings.GRAPHQL_RESPONSE_CACHE_ALIAS].clear()
+        self.lamp = Product.objects.create(name='Lamp', price='10.00', stock=5)
+
+    def products(self):
+        payload = self.execute(self.QUERY)
+        self.assertNotIn('errors', payload)
+        return sorted((edge['node']['name'], edge['node']['stock'])
+                      for edge in payload['data']['cachedProducts']['edges'])
+
+    def test_repeated_query_is_served_from_the_cache(self):
+        self.products()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.products(), [('Lamp', 5)])
+
+    def test_save_invalidates(self):
+        self.products()
+        self.lamp.name = 'Desk lamp'
+        self.lamp.save()
+        self.assertEqual(self.products(), [('Desk lamp', 5)])
+
+    def test_delete_invalidates(self):
+        self.products()
+        self.lamp.delete()
+        self.assertEqual(self.products(), [])
+
+    def test_bulk_create_invalidates(self):
+        self.products()
+        Product.objects.bulk_create([Product(name='Desk', price='99.00', stock=1)])
+        self.assertEqual(self.products(), [('Desk', 1), ('Lamp', 5)])
+
+    def test_queryset_update_invalidates(self):
+        self.products()
+        Product.objects.filter(pk=self.lamp.pk).update(stock=7)
+        self.assertEqual(self.products(), [('Lamp', 7)])
+
+    def test_queryset_delete_invalidates(self):
+        self.products()
+        Product.objects.filter(pk=self.lamp.pk).delete()
+        self.assertEqual(self.products(), [])
+
+    def test_bulk_created_order_lines_invalidate_order_queries(self):
+        query = "{ cachedOrders: allOrders(first: 5) { edges { node { items { quantity } } } } }"
+        customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        order = Order.objects.create(customer=customer)
+        self.execute(query)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.lamp, quantity=2, unit_price='10.00')])
+        payload = self.execute(query)
+        self.assertEqual(payload['data']['cachedOrders']['edges'][0]['node']['items'],
+                         [{'quantity': 2}])
+
+
+class ReserveStockConcurrencyTests(TransactionTestCase):
+    """Concurrent orders for the last units must never oversell."""
+
+    WORKERS = 8
+    ATTEMPTS = 10
+    STOCK = 20
+
+    def reserve(self, product_ids, outcomes):
+        try:
+            for _ in range(self.ATTEMPTS):
+                while True:
+                    try:
+                        Product.objects.reserve_stock({pk: 1 for pk in product_ids})
+                        outcomes.append('reserved')
+                    except InsufficientStock:
+                        outcomes.append('sold_out')
+                    except OperationalError:
+                        # SQLite refuses a concurrent writer; try again
+                        time.sleep(0.001)
+                        continue
+                    break
+        finally:
+            connection.close()
+
+    def test_concurrent_reservations_do_not_oversell(self):
+        lamp, desk = Product.objects.bulk_create([
+            Product(name='Lamp', price='10.00', stock=self.STOCK),
+            Product(name='Desk', price='99.00', stock=self.STOCK * 2)])
+        outcomes = []
+        threads = [threading.Thread(target=self.reserve,
+                                    args=([lamp.pk, desk.pk], outcomes))
+                   for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 80 orders for 20 lamps: exactly 20 succeed, each taking one of both
+        self.assertEqual(len(outcomes), self.WORKERS * self.ATTEMPTS)
+        self.assertEqual(outcomes.count('reserved'), self.STOCK)
+        lamp.refresh_from_db()
+        desk.refresh_from_db()
+        self.assertEqual(lamp.stock, 0)
+        self.assertEqual(desk.stock, self.STOCK)
+
+
+class DeliverRemindersTests(TestCase):
+    class Sender:
+        def send(self, reminder):
+            if reminder['email'] == 'bob@example.com':
+                raise ConnectionError('SMTP unavailable')
+
+    def test_failed_reminder_is_logged_and_left_for_the_next_run(self):
+        ann = Customer.objects.create(name='Ann', email='ann@example.com')
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        ann_order = Order.objects.create(customer=ann)
+        bob_order = Order.objects.create(customer=bob)
+        batch = [
+            {'customer_id': customer.pk, 'name': customer.name, 'email': customer.email,
+             'order_ids': [order.pk]}
+            for customer, order in ((ann, ann_order), (bob, bob_order))
+        ]
+
+        with self.assertLogs('crm.reminders', 'ERROR') as logs:
+            delivered = reminders.deliver(batch, sender=self.Sender())
+
+        self.assertEqual(delivered, 1)
+        self.assertIn('bob@example.com', logs.output[0])
+        self.assertIn('ConnectionError: SMTP unavailable', logs.output[0])
+        self.assertEqual(list(OrderReminder.objects.values_list('order_id', flat=True)),
+                         [ann_order.pk])
@@ -1,3 +1,23 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from crm.export import FORMATS, ExportError, export_stream
+
+
+@staff_member_required
+@require_GET
+def export(request, name, format):
+    """
+    Stream ``customers`` or ``orders`` as CSV, NDJSON or Parquet.
+
+    Query parameters are the connection filters, e.g.
+    ``/export/orders.csv?order_date_gte=2024-01-01T00:00:00Z``.
+    """
+    try:
+        stream = export_stream(name, format, filters=request.GET.dict())
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(stream, content_type=FORMATS[format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{format}"'
+    return response
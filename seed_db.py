@@ -32,9 +32,7 @@ def seed_database():
     for customer in customers_list:
         order = Order.objects.create(customer=customer)
         selected_products = products_list[:2]
-        order.products.set(selected_products)
-        order.total_amount = order.calculate_total()
-        order.save()
+        order.add_items({product.pk: 1 for product in selected_products})
 
     print("Database seeded successfully!")
     print(f"Created {Customer.objects.count()} customers")